@@ -1,4 +1,52 @@
 from django.contrib import admin
-from .models import ChatSession, ChatMessage
+from .models import ChatSession, ChatMessage, QuickAnswer, ChatCall, ChatMetricsMinute
 
-# Admin registrations removed - chatbot models not visible in admin portal
\ No newline at end of file
+# Admin registrations removed - chatbot models not visible in admin portal
+
+
+@admin.register(QuickAnswer)
+class QuickAnswerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'priority', 'max_words', 'is_active', 'updated_at')
+    list_filter = ('kind', 'is_active')
+    list_editable = ('priority', 'is_active')
+    search_fields = ('name', 'patterns', 'response')
+
+
+class ReadOnlyMetricsAdmin(admin.ModelAdmin):
+    """Metrics are written by the chatbot and the rollup command only"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ChatCall)
+class ChatCallAdmin(ReadOnlyMetricsAdmin):
+    list_display = (
+        'created_at', 'path', 'channel', 'latency_ms', 'ttft_ms', 'upstream_ms', 'prompt_tokens',
+        'completion_tokens', 'cost', 'session', 'error',
+    )
+    list_filter = ('path', 'channel', 'tokens_estimated', 'created_at')
+    search_fields = ('error', 'session__title', 'user__email')
+    date_hierarchy = 'created_at'
+    list_select_related = ('session',)
+
+
+@admin.register(ChatMetricsMinute)
+class ChatMetricsMinuteAdmin(ReadOnlyMetricsAdmin):
+    list_display = (
+        'minute', 'path', 'calls', 'errors', 'avg_latency_ms', 'latency_ms_max', 'avg_ttft_ms', 'prompt_tokens',
+        'completion_tokens', 'cost',
+    )
+    list_filter = ('path',)
+    date_hierarchy = 'minute'
+
+    @admin.display(description='Avg latency (ms)')
+    def avg_latency_ms(self, obj):
+        return round(obj.latency_ms_total / obj.calls) if obj.calls else None
+
+    @admin.display(description='Avg TTFT (ms)')
+    def avg_ttft_ms(self, obj):
+        return round(obj.ttft_ms_total / obj.ttft_calls) if obj.ttft_calls else None
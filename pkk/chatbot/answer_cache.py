@@ -0,0 +1,251 @@
+"""
+Answer cache for repeated chatbot questions.
+
+Questions are reduced to a normal form before lookup: case-folded, accents
+and punctuation stripped, filler words dropped, and spelling variants of
+destination names ("Hunzah", "hunza valley", "Naran Kaghan") mapped to one
+canonical entity. The key also carries the system prompt's source hash, the
+catalog version and the custom package rates version, so answers expire as
+soon as the knowledge base, any destination, package or product, or a rate
+(custom package quotes) changes.
+
+Entries live in a small per-process LRU (LOCAL_CACHE_SIZE) in front of the
+shared cache (ANSWER_CACHE_TTL). Follow-up questions in a session that
+already has history ("what about there in May?") are never cached, because
+their meaning depends on the conversation.
+
+Hits, misses, skips and the upstream latency saved by hits are counted in
+the shared cache; see get_answer_cache_stats() and the answer_cache_stats
+management command.
+"""
+import difflib
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.core.cache import cache
+
+from .knowledge_base import DESTINATIONS
+from .prompt_builder import get_system_prompt
+from .retrieval import catalog_version
+
+ANSWER_CACHE_TTL = 60 * 60 * 6
+LOCAL_CACHE_SIZE = 256
+FUZZY_CUTOFF = 0.84  # difflib ratio for treating a word as a misspelt destination
+FUZZY_MIN_LENGTH = 5
+MAX_CACHEABLE_LENGTH = 300  # Longer messages are rarely repeated
+
+STATS_KEYS = {
+    'hits': 'chatbot:answer_cache:hits',
+    'misses': 'chatbot:answer_cache:misses',
+    'skipped': 'chatbot:answer_cache:skipped',
+    'saved_ms': 'chatbot:answer_cache:saved_ms',
+}
+
+# Canonical entity -> other ways people write it
+ENTITY_ALIASES = {
+    'neelum': ['neelum valley', 'neelam', 'neelam valley', 'neelum vally'],
+    'hunza': ['hunza valley', 'hunzah', 'hunzza', 'karimabad'],
+    'skardu': ['skardoo', 'iskardu', 'sakardu'],
+    'fairy_meadows': ['fairy meadows', 'fairy meadow', 'fairymeadows', 'fairy medows'],
+    'deosai': ['deosai plains', 'deosai plain', 'deosai national park', 'deosi'],
+    'naran': ['naran kaghan', 'naran and kaghan', 'naran & kaghan', 'kaghan naran', 'kaghan valley', 'kaghan', 'naraan'],
+    'k2_base_camp': ['k2 base camp', 'k2 basecamp', 'k2'],
+    'swat': ['swat valley', 'swaat'],
+    'murree': ['muree', 'murre', 'murree hills'],
+    'naltar': ['naltar valley'],
+    'chitral': ['chitraal', 'chitral valley'],
+    'baltit_fort': ['baltit fort', 'baltit'],
+}
+
+FILLER_WORDS = {
+    'a', 'an', 'the', 'is', 'are', 'please', 'pls', 'plz', 'kindly', 'tell', 'me', 'can', 'could',
+    'would', 'you', 'i', 'want', 'to', 'know', 'hi', 'hey', 'hello', 'what', 'whats', 'of', 'for',
+}
+FOLLOW_UP_WORDS = {
+    'it', 'its', 'there', 'that', 'this', 'those', 'these', 'they', 'them', 'their', 'he', 'she',
+    'more', 'else', 'also', 'same', 'another', 'instead', 'then', 'above', 'previous', 'again',
+    'why', 'one', 'ones',
+}
+FOLLOW_UP_OPENINGS = ('and ', 'or ', 'but ', 'so ', 'what about ', 'how about ')
+
+_APOSTROPHES_RE = re.compile(r"['’`]")
+_NON_WORD_RE = re.compile(r'[^\w\s]+')
+
+
+def _strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+def _prepare(text):
+    text = _strip_accents(text.casefold())
+    text = _APOSTROPHES_RE.sub('', text.replace('&', ' and '))
+    return ' '.join(_NON_WORD_RE.sub(' ', text).split())
+
+
+def _build_entity_matcher():
+    phrases = {}
+    for canonical, aliases in ENTITY_ALIASES.items():
+        for alias in [canonical.replace('_', ' '), *aliases]:
+            phrases[_prepare(alias)] = canonical
+    for destination in DESTINATIONS['list']:
+        name = _prepare(destination['name'])
+        phrases.setdefault(name, name.replace(' ', '_'))
+    # Longest phrases first, so "hunza valley" wins over "hunza"
+    pattern = '|'.join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf'\b(?:{pattern})\b'), phrases
+
+
+_ENTITY_RE, _ENTITY_PHRASES = _build_entity_matcher()
+_CANONICAL = sorted(set(_ENTITY_PHRASES.values()))
+_FUZZY_TARGETS = {p: c for p, c in _ENTITY_PHRASES.items() if ' ' not in p and len(p) >= FUZZY_MIN_LENGTH}
+
+
+@lru_cache(maxsize=4096)
+def _fuzzy_entity(word):
+    if len(word) < FUZZY_MIN_LENGTH or word in FILLER_WORDS or word in FOLLOW_UP_WORDS:
+        return None
+    match = difflib.get_close_matches(word, _FUZZY_TARGETS, n=1, cutoff=FUZZY_CUTOFF)
+    return _FUZZY_TARGETS[match[0]] if match else None
+
+
+def normalize_question(message):
+    """
+    Reduce a question to its cache form.
+
+    Returns:
+        (normalized text, tuple of canonical entities mentioned)
+    """
+    text = _ENTITY_RE.sub(lambda m: _ENTITY_PHRASES[m.group(0)], _prepare(message))
+    words, entities = [], []
+    for word in text.split():
+        entity = word if word in _CANONICAL else _fuzzy_entity(word)
+        if entity:
+            entities.append(entity)
+            words.append(entity)
+        elif word not in FILLER_WORDS:
+            words.append(word)
+    return ' '.join(words), tuple(dict.fromkeys(entities))
+
+
+def depends_on_history(message, has_history):
+    """
+    True when earlier messages in the session may change what `message`
+    means: it uses a follow-up word, or it names no destination at all.
+    """
+    if not has_history:
+        return False
+    text = _prepare(message)
+    if text.startswith(FOLLOW_UP_OPENINGS) or set(text.split()) & FOLLOW_UP_WORDS:
+        return True
+    return not normalize_question(message)[1]
+
+
+def _incr(stat, delta=1):
+    key = STATS_KEYS[stat]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+class _LocalLRU:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = _LocalLRU(LOCAL_CACHE_SIZE)
+
+
+def answer_cache_key(message, has_history=False):
+    """
+    Cache key for a question, or None when it must not be cached.
+    """
+    from content.pricing import get_rates_version
+
+    if len(message) > MAX_CACHEABLE_LENGTH or depends_on_history(message, has_history):
+        return None
+    normalized, _ = normalize_question(message)
+    if not normalized:
+        return None
+    sources_hash = get_system_prompt()[2]
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    return f'chatbot:answer:{sources_hash}:{catalog_version()}:{get_rates_version()}:{digest}'
+
+
+def get_cached_answer(message, has_history=False):
+    """
+    Look a question up in the answer cache.
+
+    Returns:
+        (answer or None, key to store the answer under, or None when the
+        question is not cacheable)
+    """
+    key = answer_cache_key(message, has_history)
+    if key is None:
+        _incr('skipped')
+        return None, None
+
+    entry = _local.get(key)
+    if entry is None:
+        entry = cache.get(key)
+        if entry is not None:
+            _local.set(key, entry, ANSWER_CACHE_TTL)
+    if entry is None:
+        _incr('misses')
+        return None, key
+
+    _incr('hits')
+    _incr('saved_ms', int(entry['latency'] * 1000))
+    return entry['answer'], key
+
+
+def store_answer(key, answer, latency):
+    """Cache a model answer that took `latency` seconds to produce"""
+    if not key or not answer:
+        return
+    entry = {'answer': answer, 'latency': latency}
+    cache.set(key, entry, timeout=ANSWER_CACHE_TTL)
+    _local.set(key, entry, ANSWER_CACHE_TTL)
+
+
+def get_answer_cache_stats():
+    values = cache.get_many(STATS_KEYS.values())
+    stats = {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    stats['saved_seconds'] = round(stats['saved_ms'] / 1000, 1)
+    return stats
+
+
+def reset_answer_cache_stats():
+    cache.delete_many(STATS_KEYS.values())
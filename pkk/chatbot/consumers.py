@@ -0,0 +1,205 @@
+"""WebSocket consumers for the chatbot"""
+import asyncio
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .answer_cache import store_answer
+from .llm import LLMError, LLMOverloaded, stream_chat_completion
+from .metrics import record_call
+from .models import ChatMessage, ChatSession
+from .throttling import (
+    FLIGHT_POLL_INTERVAL, FLIGHT_TIMEOUT, begin_flight, check_rate_limit, finish_flight, flight_key, poll_flight,
+)
+from .views import BUSY_RESPONSE, ERROR_RESPONSE, RATE_LIMITED_RESPONSE, get_canned_response, prepare_answer
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Streaming chat for logged-in users at ws/chatbot/.
+
+    Client messages:
+        {"type": "message", "message": "...", "session_id": <id or null>}
+        {"type": "cancel"}
+
+    Server messages, per answer:
+        {"type": "start", "session_id": ...}
+        {"type": "token", "text": "..."}, repeated while the model writes
+        {"type": "done", "session_id": ..., "message_id": ..., "response": "..."}
+        or {"type": "cancelled", ...} with the partial response
+        {"type": "error", "error": "..."} for a rejected request, with
+        "retry_after" when the rate limit was hit
+
+    The ChatMessage is saved once the answer is complete (or cancelled, with
+    the text sent so far), so no database work happens per token. A question
+    that is already being answered in the same session (from another tab,
+    say) waits for that answer and gets it as a single token, without being
+    charged to the rate limit.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.stream_task = None
+        await self.accept()
+
+    async def disconnect(self, code):
+        task = getattr(self, 'stream_task', None)
+        if task and not task.done():
+            # Closes the upstream request; the partial answer is still saved
+            task.cancel()
+
+    async def receive_json(self, content, **kwargs):
+        kind = content.get('type')
+        if kind == 'cancel':
+            if self.stream_task and not self.stream_task.done():
+                self.stream_task.cancel()
+            return
+        if kind != 'message':
+            await self.send_json({'type': 'error', 'error': 'Unknown message type'})
+            return
+
+        message = str(content.get('message', '')).strip()
+        if not message:
+            await self.send_json({'type': 'error', 'error': 'Message cannot be empty'})
+            return
+        if len(message) > MAX_MESSAGE_LENGTH:
+            await self.send_json({'type': 'error', 'error': f'Messages are limited to {MAX_MESSAGE_LENGTH} characters'})
+            return
+        if self.stream_task and not self.stream_task.done():
+            await self.send_json({'type': 'error', 'error': 'Please wait for the current answer or cancel it'})
+            return
+        session_id = content.get('session_id')
+        # A new session cannot coalesce with another request, so charge it
+        # before creating the session; otherwise only the flight leader is charged
+        if not session_id and not await self.admit():
+            return
+        session = await self.get_session(session_id, message)
+        if session is None:
+            await self.send_json({'type': 'error', 'error': 'Chat session not found'})
+            return
+        # Run the stream as its own task so a cancel message can be received meanwhile
+        self.stream_task = asyncio.create_task(self.answer(session, message, charged=not session_id))
+
+    async def admit(self):
+        """Charge one message to the rate limit; sends the error and returns False when over it"""
+        client = self.scope.get('client') or (None,)
+        retry_after = await database_sync_to_async(check_rate_limit)(self.user.id, client[0])
+        if retry_after:
+            logger.warning(f"Chat rate limit hit by user {self.user.id}")
+            await self.send_json({'type': 'error', 'error': RATE_LIMITED_RESPONSE, 'retry_after': retry_after})
+            return False
+        return True
+
+    async def answer(self, session, message, charged=False):
+        key = flight_key(self.user.id, session.id, message)
+        token, leader = await database_sync_to_async(begin_flight)(key)
+        if not leader:
+            await self.send_json({'type': 'start', 'session_id': session.id})
+            result = await self.wait_for_flight(key, token)
+            if result is not None:
+                await self.send_json({'type': 'token', 'text': result['response']})
+                await self.send_json({'type': 'done', **result})
+                return
+            token = None  # The leader failed; answer on our own
+
+        result = None
+        try:
+            if not charged and not await self.admit():
+                return
+            if leader:
+                await self.send_json({'type': 'start', 'session_id': session.id})
+            result = await self.stream_answer(session, message)
+        finally:
+            await database_sync_to_async(finish_flight)(key, token, result)
+
+    async def wait_for_flight(self, key, token):
+        deadline = time.monotonic() + FLIGHT_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(FLIGHT_POLL_INTERVAL)
+            finished, result = await database_sync_to_async(poll_flight)(key, token)
+            if finished:
+                return result
+        return None
+
+    async def stream_answer(self, session, message):
+        """Stream the answer to the client and save it; returns the flight result"""
+        pieces = []
+        started = time.monotonic()
+        call = {'path': 'quick'}
+        try:
+            canned_response = await database_sync_to_async(get_canned_response)(message)
+            if canned_response:
+                await self.send_token(canned_response, pieces, started, call)
+            else:
+                cached_answer, messages, cache_key = await database_sync_to_async(prepare_answer)(message, session)
+                if cached_answer:
+                    call['path'] = 'cache'
+                    await self.send_token(cached_answer, pieces, started, call)
+                else:
+                    call.update(path='llm', messages=messages, stats={})
+                    async for text in stream_chat_completion(messages, user_id=self.user.id, stats=call['stats']):
+                        await self.send_token(text, pieces, started, call)
+                    call['response'] = ''.join(pieces)
+                    await database_sync_to_async(store_answer)(cache_key, ''.join(pieces), time.monotonic() - started)
+        except asyncio.CancelledError:
+            response = ''.join(pieces)
+            call.update(error='cancelled', response=response)
+            await self.record_call(session, started, call)
+            message_id = await self.save_message(session, message, response) if response else None
+            try:
+                await self.send_json({
+                    'type': 'cancelled', 'session_id': session.id, 'message_id': message_id, 'response': response,
+                })
+            except Exception:
+                pass  # The socket is already gone
+            raise
+        except LLMError as e:
+            logger.error(f"Chat stream failed: {str(e)}")
+            call.update(
+                error='overloaded' if isinstance(e, LLMOverloaded) else f'api: {str(e)}', response=''.join(pieces),
+            )
+            if not pieces:
+                fallback = BUSY_RESPONSE if isinstance(e, LLMOverloaded) else ERROR_RESPONSE
+                pieces.append(fallback)
+                await self.send_json({'type': 'token', 'text': fallback})
+
+        response = ''.join(pieces)
+        await self.record_call(session, started, call)
+        message_id = await self.save_message(session, message, response)
+        await self.send_json({'type': 'done', 'session_id': session.id, 'message_id': message_id, 'response': response})
+        return {'response': response, 'session_id': session.id, 'message_id': message_id}
+
+    async def send_token(self, text, pieces, started, call):
+        if not pieces:
+            call['ttft_ms'] = (time.monotonic() - started) * 1000
+        pieces.append(text)
+        await self.send_json({'type': 'token', 'text': text})
+
+    async def record_call(self, session, started, call):
+        latency_ms = (time.monotonic() - started) * 1000
+        await database_sync_to_async(record_call)('ws', latency_ms=latency_ms, session=session, **call)
+
+    @database_sync_to_async
+    def get_session(self, session_id, message):
+        if session_id:
+            try:
+                return ChatSession.objects.filter(id=int(session_id), user=self.user).first()
+            except (TypeError, ValueError):
+                return None
+        return ChatSession.objects.create(
+            user=self.user,
+            title=message[:50] + "..." if len(message) > 50 else message
+        )
+
+    @database_sync_to_async
+    def save_message(self, session, message, response):
+        return ChatMessage.objects.create(session=session, message=message, response=response).id
@@ -0,0 +1,154 @@
+"""
+Compiled intent matcher for chatbot quick answers and off-topic filtering.
+
+The active QuickAnswer rules are compiled into a single regular expression
+with one named group per rule. Phrases match whole words only, so "hi" no
+longer fires on "this is". classify() scans a message once and picks the
+result from the set of rules that matched:
+
+1. the first quick-answer rule by priority
+2. otherwise an off-topic rule, unless a travel-context rule also matched
+3. otherwise None, and the model answers
+
+Each process keeps the compiled matcher and compares it against a version
+stamp in the shared cache on every use. chatbot.signals bumps the stamp
+whenever a QuickAnswer or a Destination is saved or deleted, since responses
+may list the live destinations.
+"""
+import re
+import threading
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .knowledge_base import CALCULATOR_INFO, FEATURES
+from .models import QuickAnswer
+
+INTENTS_VERSION_KEY = 'chatbot:intents:version'
+# At one position the first alternative wins, so answers beat travel context beats off-topic
+KIND_ORDER = {'answer': 0, 'travel': 1, 'irrelevant': 2}
+
+Intent = namedtuple('Intent', 'kind name response')
+Rule = namedtuple('Rule', 'group kind name response max_words')
+
+_state = {'version': None, 'regex': None, 'rules': ()}
+_state_lock = threading.Lock()
+
+
+class _KeepMissing(dict):
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def _response_context():
+    from content.models import Destination
+
+    destinations = list(
+        Destination.objects.filter(is_active=True).order_by('name').values_list('name', 'city', 'country')
+    )
+    return _KeepMissing(
+        features='\n'.join(f'{i + 1}. {feature}' for i, feature in enumerate(FEATURES['core_features'])),
+        destinations='\n'.join(
+            f"{i + 1}. {name} - {city or country}" for i, (name, city, country) in enumerate(destinations)
+        ),
+        destinations_total=len(destinations),
+        calculator_url=CALCULATOR_INFO['url'],
+    )
+
+
+def render_response(response, context=None):
+    """Fill live catalog and knowledge-base placeholders; text with stray braces is returned as is"""
+    try:
+        return response.format_map(context or _response_context())
+    except (ValueError, IndexError, AttributeError):
+        return response
+
+
+def phrase_pattern(phrase):
+    """
+    Regex for one rule phrase: whole words, any whitespace between them, and
+    a trailing * for a word prefix ("assalam*" matches "assalamualaikum").
+    """
+    prefix = phrase.endswith('*')
+    words = phrase.rstrip('*').lower().split()
+    body = r'\s+'.join(re.escape(word) for word in words)
+    if prefix:
+        body += r'\w*'
+    return rf'(?<!\w){body}(?!\w)'
+
+
+def compile_rules(rules):
+    """
+    Build the combined matcher.
+
+    Args:
+        rules: QuickAnswer-like objects
+
+    Returns:
+        (compiled regex or None, tuple of Rule in classification order)
+    """
+    context = _response_context()
+    compiled, alternatives = [], []
+    ordered = sorted(rules, key=lambda r: (KIND_ORDER.get(r.kind, len(KIND_ORDER)), r.priority, r.id or 0))
+    for index, rule in enumerate(ordered):
+        phrases = [p for p in rule.get_patterns_list() if p.rstrip('*').strip()]
+        if not phrases:
+            continue
+        group = f'r{index}'
+        alternatives.append(f"(?P<{group}>{'|'.join(phrase_pattern(p) for p in phrases)})")
+        compiled.append(Rule(group, rule.kind, rule.name, render_response(rule.response, context), rule.max_words))
+    regex = re.compile('|'.join(alternatives), re.IGNORECASE) if alternatives else None
+    return regex, tuple(compiled)
+
+
+def _current_version():
+    version = cache.get(INTENTS_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(INTENTS_VERSION_KEY, version, timeout=None):
+            version = cache.get(INTENTS_VERSION_KEY, version)
+    return version
+
+
+def invalidate_intents():
+    """Make every process recompile the rules on its next message"""
+    cache.set(INTENTS_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_matcher():
+    version = _current_version()
+    if _state['version'] != version:
+        with _state_lock:
+            if _state['version'] != version:
+                regex, rules = compile_rules(QuickAnswer.objects.filter(is_active=True))
+                _state.update(regex=regex, rules=rules, version=version)
+    return _state['regex'], _state['rules']
+
+
+def classify(message, matcher=None):
+    """
+    Classify a message in one pass over the compiled rules.
+
+    Returns:
+        Intent(kind, name, response) for a quick answer ('answer') or an
+        off-topic message ('irrelevant', response may be blank), else None
+    """
+    regex, rules = matcher or get_matcher()
+    if regex is None:
+        return None
+    matched = {m.lastgroup for m in regex.finditer(message)}
+    if not matched:
+        return None
+
+    word_count = len(message.split())
+    hits = [r for r in rules if r.group in matched and (r.max_words is None or word_count <= r.max_words)]
+    for rule in hits:
+        if rule.kind == 'answer':
+            return Intent('answer', rule.name, rule.response)
+    if any(rule.kind == 'travel' for rule in hits):
+        return None
+    for rule in hits:
+        if rule.kind == 'irrelevant':
+            return Intent('irrelevant', rule.name, rule.response)
+    return None
@@ -0,0 +1,338 @@
+"""
+LLM gateway for the DeepSeek chat completions API.
+
+Every upstream call, whether from the HTTP view (complete_chat_sync) or the
+WebSocket consumer (stream_chat_completion), runs on one gateway event loop
+in a background thread. That loop owns:
+
+- one httpx.AsyncClient, so connections are kept alive and reused
+- a global semaphore (MAX_CONCURRENCY upstream calls per process) and a
+  per-user semaphore (PER_USER_CONCURRENCY)
+- a bounded wait queue: once MAX_WAITING callers are queued, or a caller
+  has waited QUEUE_TIMEOUT seconds for a slot, LLMOverloaded is raised and
+  the caller shows a friendly "busy" message instead of piling up
+
+429 and 5xx responses and connection errors are retried with full jitter,
+but only before the first token has been sent to the user.
+
+Callers may pass a `stats` dict, which is filled with the time spent
+waiting for a slot and talking to the upstream, the number of attempts,
+and the token counts from the API's usage field (see chatbot.metrics).
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from django.conf import settings
+
+from .config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL
+
+logger = logging.getLogger(__name__)
+
+MODEL = 'deepseek-chat'
+MAX_TOKENS = 600
+TEMPERATURE = 0.7
+TOP_P = 0.95
+# Tokens normally arrive within a second of each other; read covers the first one
+REQUEST_TIMEOUT = httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=5.0)
+COMPLETION_TIMEOUT = 45  # Overall limit for a blocking complete_chat_sync call
+
+MAX_CONCURRENCY = getattr(settings, 'LLM_MAX_CONCURRENCY', 8)
+PER_USER_CONCURRENCY = 1
+MAX_WAITING = 32
+QUEUE_TIMEOUT = 10
+
+MAX_ATTEMPTS = 3
+RETRY_BASE = 0.5
+RETRY_CAP = 4.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The upstream request failed before or during streaming"""
+
+
+class LLMTimeout(LLMError):
+    """The upstream did not answer in time"""
+
+
+class LLMOverloaded(LLMError):
+    """Too many requests are already waiting for an upstream slot"""
+
+
+class _RetryableError(LLMError):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def build_payload(messages, stream=False):
+    return {
+        'model': MODEL,
+        'messages': messages,
+        'max_tokens': MAX_TOKENS,
+        'temperature': TEMPERATURE,
+        'top_p': TOP_P,
+        'stream': stream,
+        # The last streamed chunk then carries the usage totals
+        **({'stream_options': {'include_usage': True}} if stream else {}),
+    }
+
+
+class _Gateway:
+    """State that lives on the gateway loop; only touched from that loop"""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            headers={'Authorization': f'Bearer {DEEPSEEK_API_KEY}'},
+            limits=httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY),
+        )
+        self.slots = asyncio.Semaphore(MAX_CONCURRENCY)
+        self.user_slots = {}  # user key -> [semaphore, holders and waiters]
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self, user_key):
+        entry = self.user_slots.setdefault(user_key, [asyncio.Semaphore(PER_USER_CONCURRENCY), 0])
+        entry[1] += 1
+        acquired = []
+
+        async def acquire():
+            # The user's own slot first, so one user cannot queue up global slots
+            for semaphore in (entry[0], self.slots):
+                await semaphore.acquire()
+                acquired.append(semaphore)
+
+        try:
+            if entry[0].locked() or self.slots.locked():
+                # Only callers that actually have to wait count towards the queue
+                if self.waiting >= MAX_WAITING:
+                    raise LLMOverloaded('Wait queue is full')
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(acquire(), QUEUE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    raise LLMOverloaded(f'No upstream slot within {QUEUE_TIMEOUT}s')
+                finally:
+                    self.waiting -= 1
+            else:
+                await acquire()  # Both semaphores are free, so this does not suspend
+            yield
+        finally:
+            for semaphore in acquired:
+                semaphore.release()
+            entry[1] -= 1
+            if not entry[1]:
+                self.user_slots.pop(user_key, None)
+
+
+_loop = None
+_gateway = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-gateway', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def _get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = _Gateway()
+    return _gateway
+
+
+def _retry_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, RETRY_CAP)
+    # Full jitter keeps clients that failed together from retrying together
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+def _parse_retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+
+def _record_usage(stats, usage):
+    stats.update(
+        prompt_tokens=usage.get('prompt_tokens'),
+        completion_tokens=usage.get('completion_tokens'),
+        cached_prompt_tokens=usage.get('prompt_cache_hit_tokens', 0),
+    )
+
+
+async def _with_retries(user_key, attempt_call, stats):
+    """
+    Hold an upstream slot and run attempt_call() until it succeeds or runs
+    out of attempts. attempt_call raises _RetryableError for failures worth retrying.
+    """
+    gateway = _get_gateway()
+    queued = time.monotonic()
+    async with gateway.slot(user_key):
+        started = time.monotonic()
+        stats['queue_ms'] = int((started - queued) * 1000)
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                stats['attempts'] = attempt + 1
+                try:
+                    return await attempt_call(gateway.client)
+                except httpx.TimeoutException as e:
+                    error = LLMTimeout(f'{type(e).__name__}: {e}')
+                except httpx.TransportError as e:
+                    error = _RetryableError(f'{type(e).__name__}: {e}')
+                except _RetryableError as e:
+                    error = e
+                # A timed-out attempt already took REQUEST_TIMEOUT; retrying would only double the wait
+                if isinstance(error, LLMTimeout):
+                    raise error
+                if attempt + 1 == MAX_ATTEMPTS:
+                    raise LLMError(str(error))
+                delay = _retry_delay(attempt, error.retry_after)
+                logger.warning(f"LLM call failed ({error}), retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        finally:
+            stats['upstream_ms'] = int((time.monotonic() - started) * 1000)
+
+
+def _raise_for_status(response, body):
+    if response.status_code in RETRY_STATUSES:
+        raise _RetryableError(f'HTTP {response.status_code}', retry_after=_parse_retry_after(response))
+    raise LLMError(f'HTTP {response.status_code}: {body[:200].decode(errors="replace")}')
+
+
+async def _complete(messages, user_key, stats):
+    async def attempt(client):
+        response = await client.post(DEEPSEEK_API_URL, json=build_payload(messages))
+        if response.status_code != 200:
+            _raise_for_status(response, response.content)
+        try:
+            body = response.json()
+            content = body['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError) as e:
+            raise LLMError(f'Malformed completion: {e}')
+        _record_usage(stats, body.get('usage') or {})
+        return content
+
+    return await _with_retries(user_key, attempt, stats)
+
+
+async def _stream(messages, user_key, emit, stats):
+    started = []
+
+    async def attempt(client):
+        async with client.stream('POST', DEEPSEEK_API_URL, json=build_payload(messages, stream=True)) as response:
+            if response.status_code != 200:
+                _raise_for_status(response, await response.aread())
+            try:
+                async for line in response.aiter_lines():
+                    # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    try:
+                        chunk = json.loads(data)
+                        choices = chunk['choices']
+                    except (ValueError, KeyError) as e:
+                        raise LLMError(f'Malformed stream chunk: {e}')
+                    if chunk.get('usage'):
+                        _record_usage(stats, chunk['usage'])
+                    # The usage chunk has no choices
+                    delta = (choices[0].get('delta') or {}) if choices else {}
+                    if delta.get('content'):
+                        started.append(True)
+                        emit(('text', delta['content']))
+            except httpx.HTTPError as e:
+                if started:
+                    # The user has seen part of the answer, so it cannot be retried
+                    raise LLMError(f'Stream interrupted: {e}')
+                raise
+
+    try:
+        await _with_retries(user_key, attempt, stats)
+        emit(('end', None))
+    except LLMError as e:
+        emit(('error', e))
+    except Exception as e:
+        emit(('error', LLMError(f'{type(e).__name__}: {e}')))
+
+
+def _user_key(user_id):
+    return user_id if user_id is not None else 'anonymous'
+
+
+def complete_chat_sync(messages, user_id=None, stats=None):
+    """
+    Blocking chat completion for sync views.
+
+    Args:
+        stats: optional dict to fill with timings and token usage
+
+    Returns:
+        The answer text
+
+    Raises:
+        LLMOverloaded: no upstream slot was free in time
+        LLMTimeout: the upstream did not answer in time
+        LLMError: any other upstream failure
+    """
+    stats = {} if stats is None else stats
+    future = asyncio.run_coroutine_threadsafe(_complete(messages, _user_key(user_id), stats), _get_loop())
+    try:
+        return future.result(timeout=COMPLETION_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise LLMTimeout(f'No answer within {COMPLETION_TIMEOUT}s')
+
+
+async def stream_chat_completion(messages, user_id=None, stats=None):
+    """
+    Stream a chat completion to an async caller on any event loop.
+
+    Args:
+        stats: optional dict to fill with timings and token usage; complete
+            once the stream has ended
+
+    Yields:
+        Pieces of the answer text in order
+
+    Raises:
+        LLMOverloaded, LLMTimeout, LLMError: as for complete_chat_sync
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def emit(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    stats = {} if stats is None else stats
+    future = asyncio.run_coroutine_threadsafe(_stream(messages, _user_key(user_id), emit, stats), _get_loop())
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == 'text':
+                yield value
+            elif kind == 'error':
+                raise value
+            else:
+                return
+    finally:
+        # Stops the upstream request when the caller cancels or stops early
+        future.cancel()
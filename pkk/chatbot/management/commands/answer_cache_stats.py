@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from chatbot.answer_cache import get_answer_cache_stats, reset_answer_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show chatbot answer cache hit ratio and the upstream time saved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = get_answer_cache_stats()
+        self.stdout.write(
+            f"Hits: {stats['hits']}  Misses: {stats['misses']}  Skipped: {stats['skipped']}\n"
+            f"Hit ratio: {stats['hit_ratio']:.1%}\n"
+            f"Upstream time saved: {stats['saved_seconds']}s"
+        )
+        if options['reset']:
+            reset_answer_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.intents import classify, compile_rules
+from chatbot.models import ChatMessage, QuickAnswer
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the intent matcher on recent chat messages and show how they were classified. '
+        'Accuracy is checked against the labelled corpus in chatbot.tests'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Most recent chat messages to classify')
+        parser.add_argument('--runs', type=int, default=20, help='Passes over the messages for timing')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        matcher = compile_rules(QuickAnswer.objects.filter(is_active=True))
+        compile_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f"Rules: {len(matcher[1])}, compiled in {compile_ms:.1f} ms")
+
+        messages = list(ChatMessage.objects.order_by('-id').values_list('message', flat=True)[:options['messages']])
+        if not messages:
+            self.stdout.write(self.style.WARNING('No chat messages to classify'))
+            return
+
+        counts = {}
+        for message in messages:
+            intent = classify(message, matcher)
+            name = intent.name if intent else '(model)'
+            counts[name] = counts.get(name, 0) + 1
+
+        start = time.perf_counter()
+        for _ in range(options['runs']):
+            for message in messages:
+                classify(message, matcher)
+        per_message_us = (time.perf_counter() - start) / (options['runs'] * len(messages)) * 1e6
+
+        self.stdout.write(f"Classification: {per_message_us:.1f} µs per message over {len(messages)} messages")
+        for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+            self.stdout.write(f"  {name}: {count}")
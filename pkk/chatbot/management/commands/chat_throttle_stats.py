@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from chatbot.throttling import get_throttle_stats, reset_throttle_stats
+
+
+class Command(BaseCommand):
+    help = 'Show how many chat messages were rate limited or coalesced into another request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = get_throttle_stats()
+        self.stdout.write(
+            f"Rejected per user: {stats['rejected_user']}  Rejected per IP: {stats['rejected_ip']}\n"
+            f"Coalesced duplicates: {stats['coalesced']}"
+        )
+        if options['reset']:
+            reset_throttle_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
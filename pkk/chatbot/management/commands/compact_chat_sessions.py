@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from chatbot.transcripts import COMPACT_BATCH_SIZE, IDLE_DAYS, compact_idle_sessions
+
+
+class Command(BaseCommand):
+    help = 'Fold the messages of chat sessions idle for N days into compressed transcript archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=IDLE_DAYS)
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE, help='Sessions per transaction')
+
+    def handle(self, *args, **options):
+        sessions, messages = compact_idle_sessions(days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {messages} messages from {sessions} idle chat sessions'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from chatbot.metrics import rollup_chat_calls
+
+
+class Command(BaseCommand):
+    help = 'Fold recorded chatbot calls into per-minute metrics and prune old call records'
+
+    def handle(self, *args, **options):
+        minutes, deleted = rollup_chat_calls()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {minutes} per-minute metric rows, deleted {deleted} old call records'
+        ))
@@ -0,0 +1,236 @@
+"""
+Per-call chatbot metrics: which path answered, how long it took, how many
+tokens it used and what it cost.
+
+Every answered message is saved as a ChatCall by record_call(). The token
+counts come from the API's usage field (chatbot.llm fills them into the
+`stats` dict); when a response carries no usage, they are estimated with
+count_tokens() and the call is flagged. Cost uses the per-million-token
+prices below, which settings can override.
+
+rollup_chat_calls() (run by the rollup_chat_metrics command, e.g. every
+minute from cron) folds complete minutes into ChatMetricsMinute rows, one
+per minute and path, and deletes calls older than CALL_RETENTION_DAYS.
+It recomputes the last few rolled-up minutes each time, so calls saved
+just after a run are still counted. get_chat_metrics() combines the rollups
+with the calls that are not rolled up yet.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from .models import ChatCall, ChatMetricsMinute
+from .prompt_builder import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens (deepseek-chat list prices)
+PRICE_PROMPT = Decimal(str(getattr(settings, 'CHAT_PRICE_PROMPT_PER_M', '0.27')))
+PRICE_CACHED_PROMPT = Decimal(str(getattr(settings, 'CHAT_PRICE_CACHED_PROMPT_PER_M', '0.07')))
+PRICE_COMPLETION = Decimal(str(getattr(settings, 'CHAT_PRICE_COMPLETION_PER_M', '1.10')))
+
+CALL_RETENTION_DAYS = 14
+ROLLUP_OVERLAP_MINUTES = 5  # Rolled-up minutes recomputed on every run
+MAX_WINDOW_MINUTES = 60 * 24
+TOP_SESSIONS = 10
+
+
+def call_cost(prompt_tokens, completion_tokens, cached_prompt_tokens=0):
+    """USD cost of one call, cached prompt tokens billed at the cache-hit price"""
+    cost = (
+        (prompt_tokens - cached_prompt_tokens) * PRICE_PROMPT
+        + cached_prompt_tokens * PRICE_CACHED_PROMPT
+        + completion_tokens * PRICE_COMPLETION
+    ) / 1_000_000
+    return cost.quantize(Decimal('0.000001'))
+
+
+def record_call(channel, path, latency_ms, session=None, ttft_ms=None, stats=None, messages=None, response='',
+                error=''):
+    """
+    Save one answered message as a ChatCall. Never raises: metrics must not
+    break answering.
+
+    Args:
+        channel: 'http' or 'ws'
+        path: 'quick', 'cache' or 'llm'
+        latency_ms: from receiving the message to the complete answer
+        session: the ChatSession answered in
+        ttft_ms: time to the first token sent to the client, when streaming
+        stats: the dict chatbot.llm filled for an upstream call
+        messages, response: prompt and the model's text (partial when the
+            call failed or was cancelled), to estimate tokens without usage
+        error: short description of a failure, empty when the call succeeded
+    """
+    stats = stats or {}
+    try:
+        prompt_tokens = stats.get('prompt_tokens')
+        completion_tokens = stats.get('completion_tokens')
+        cached_prompt_tokens = stats.get('cached_prompt_tokens') or 0
+        estimated = False
+        if path == 'llm' and prompt_tokens is None and response:
+            # The model wrote but sent no usage (e.g. a cancelled stream)
+            estimated = True
+            prompt_tokens = sum(count_tokens(m['content']) for m in messages or [])
+            completion_tokens = count_tokens(response)
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        ChatCall.objects.create(
+            user_id=session.user_id if session else None,
+            session=session,
+            channel=channel,
+            path=path,
+            latency_ms=max(0, int(latency_ms)),
+            ttft_ms=None if ttft_ms is None else max(0, int(ttft_ms)),
+            queue_ms=stats.get('queue_ms'),
+            upstream_ms=stats.get('upstream_ms'),
+            attempts=stats.get('attempts', 0),
+            prompt_tokens=prompt_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+            completion_tokens=completion_tokens,
+            tokens_estimated=estimated,
+            cost=call_cost(prompt_tokens, completion_tokens, cached_prompt_tokens),
+            error=error[:200],
+        )
+    except Exception as e:
+        logger.error(f"Could not record chat call metrics: {str(e)}")
+
+
+def _aggregate(calls):
+    """ChatCall totals per minute and path, as dicts shaped like ChatMetricsMinute"""
+    return calls.annotate(minute=TruncMinute('created_at')).values('minute', 'path').annotate(
+        calls=Count('id'),
+        errors=Count('id', filter=~Q(error='')),
+        latency_ms_total=Sum('latency_ms'),
+        latency_ms_max=Max('latency_ms'),
+        ttft_calls=Count('ttft_ms'),
+        ttft_ms_total=Sum('ttft_ms', default=0),
+        upstream_ms_total=Sum('upstream_ms', default=0),
+        prompt_tokens=Sum('prompt_tokens'),
+        completion_tokens=Sum('completion_tokens'),
+        cost=Sum('cost'),
+    ).order_by('minute', 'path')
+
+
+def rollup_chat_calls(now=None):
+    """
+    Fold complete minutes of ChatCalls into ChatMetricsMinute rows and prune
+    old calls.
+
+    Returns:
+        (minute rows written, calls deleted)
+    """
+    now = now or timezone.now()
+    until = now.replace(second=0, microsecond=0)
+    latest = ChatMetricsMinute.objects.aggregate(latest=Max('minute'))['latest']
+    calls = ChatCall.objects.filter(created_at__lt=until)
+    if latest is not None:
+        calls = calls.filter(created_at__gte=latest - timedelta(minutes=ROLLUP_OVERLAP_MINUTES))
+    written = 0
+    for row in _aggregate(calls):
+        minute, path = row.pop('minute'), row.pop('path')
+        ChatMetricsMinute.objects.update_or_create(minute=minute, path=path, defaults=row)
+        written += 1
+    deleted, _ = ChatCall.objects.filter(created_at__lt=now - timedelta(days=CALL_RETENTION_DAYS)).delete()
+    return written, deleted
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _summarise(row):
+    calls = row['calls']
+    return {
+        'calls': calls,
+        'errors': row['errors'],
+        'avg_latency_ms': round(row['latency_ms_total'] / calls) if calls else None,
+        'max_latency_ms': row['latency_ms_max'],
+        'avg_ttft_ms': round(row['ttft_ms_total'] / row['ttft_calls']) if row['ttft_calls'] else None,
+        'prompt_tokens': row['prompt_tokens'],
+        'completion_tokens': row['completion_tokens'],
+        'cost': float(row['cost']),
+    }
+
+
+def get_chat_metrics(minutes=60):
+    """
+    Chatbot metrics for the last `minutes`.
+
+    Returns:
+        Dict with a per-minute series split by path, totals per path (with
+        latency percentiles from the raw calls) and the costliest sessions
+    """
+    minutes = max(1, min(minutes, MAX_WINDOW_MINUTES))
+    now = timezone.now()
+    since = (now - timedelta(minutes=minutes)).replace(second=0, microsecond=0)
+
+    rolled = ChatMetricsMinute.objects.filter(minute__gte=since)
+    latest = rolled.aggregate(latest=Max('minute'))['latest']
+    rows = list(rolled.order_by('minute', 'path').values(
+        'minute', 'path', 'calls', 'errors', 'latency_ms_total', 'latency_ms_max', 'ttft_calls', 'ttft_ms_total',
+        'upstream_ms_total', 'prompt_tokens', 'completion_tokens', 'cost',
+    ))
+    pending = ChatCall.objects.filter(created_at__gte=latest + timedelta(minutes=1) if latest else since)
+    rows += list(_aggregate(pending))
+
+    fields = ('calls', 'errors', 'latency_ms_total', 'ttft_calls', 'ttft_ms_total', 'upstream_ms_total',
+              'prompt_tokens', 'completion_tokens', 'cost')
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['path'], dict.fromkeys(fields, 0) | {'latency_ms_max': 0})
+        for field in fields:
+            total[field] += row[field]
+        total['latency_ms_max'] = max(total['latency_ms_max'], row['latency_ms_max'])
+
+    window_calls = ChatCall.objects.filter(created_at__gte=since)
+    by_path = {}
+    for path, latency_ms, ttft_ms in window_calls.values_list('path', 'latency_ms', 'ttft_ms'):
+        latencies, ttfts = by_path.setdefault(path, ([], []))
+        latencies.append(latency_ms)
+        if ttft_ms is not None:
+            ttfts.append(ttft_ms)
+    paths = {}
+    for path, total in totals.items():
+        latencies, ttfts = by_path.get(path, ([], []))
+        paths[path] = _summarise(total) | {
+            'p50_latency_ms': _percentile(latencies, 0.5),
+            'p95_latency_ms': _percentile(latencies, 0.95),
+            'p95_ttft_ms': _percentile(ttfts, 0.95),
+        }
+
+    sessions = window_calls.exclude(session=None).values('session', 'session__title').annotate(
+        calls=Count('id'),
+        prompt_tokens=Sum('prompt_tokens'),
+        completion_tokens=Sum('completion_tokens'),
+        cost=Sum('cost'),
+    ).order_by('-cost')[:TOP_SESSIONS]
+
+    return {
+        'since': since.isoformat(),
+        'minutes': [
+            {'minute': row['minute'].isoformat(), 'path': row['path'], **_summarise(row)} for row in rows
+        ],
+        'paths': paths,
+        'calls': sum(total['calls'] for total in totals.values()),
+        'cost': float(sum(total['cost'] for total in totals.values())),
+        'top_sessions': [
+            {
+                'session_id': row['session'],
+                'title': row['session__title'],
+                'calls': row['calls'],
+                'prompt_tokens': row['prompt_tokens'],
+                'completion_tokens': row['completion_tokens'],
+                'cost': float(row['cost']),
+            }
+            for row in sessions
+        ],
+    }
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:19
+
+from django.db import migrations, models
+
+
+# Rules previously hard-coded in chatbot.prompt_builder, now with whole-word matching
+SEED_RULES = [
+    ('greeting', 'answer', 10, 6,
+     ['hello', 'hi', 'hey', 'assalam*', 'salam', 'aoa', 'good morning', 'good afternoon', 'good evening'],
+     "Hello! 👋 Welcome to TouriPK! I'm here to help you explore Pakistan's amazing destinations and plan your perfect trip. What would you like to know about? I can help with:\n• Destinations information\n• Cost estimation\n• Package booking\n• Weather forecasts\n• Travel tips"),
+    ('capabilities', 'answer', 20, None,
+     ['what can you do', 'how can you help', 'what do you do'],
+     "I'm your TouriPK travel assistant! 🎒 I can help you with:\n\n✅ Explore 12 featured destinations in Pakistan\n✅ Calculate trip costs with our calculator\n✅ Find perfect tour packages\n✅ Check weather forecasts\n✅ Shop local handicrafts\n✅ Guide you through booking process\n\nWhat are you planning? A family trip, adventure tour, or honeymoon? 🏔️"),
+    ('website-features', 'answer', 30, None,
+     ['website features', 'features of the website', 'features of your website', 'site features',
+      'touripk features', 'features of touripk', 'what features'],
+     "TouriPK offers these amazing features:\n\n{features}\n\nWhich feature would you like to explore first? 🚀"),
+    ('calculator', 'answer', 40, None,
+     ['calculator', 'cost estimat*'],
+     "Our Trip Cost Calculator helps you plan your budget! 💰\n\nHow it works:\n• Select your destination\n• Enter number of people and days\n• Get instant cost breakdown\n\nVisit: {calculator_url}\n\nEstimated ranges: Budget trips (Rs. 15k-35k), Standard (Rs. 35k-80k), Premium (Rs. 80k+)\n\nWant to know costs for a specific destination? 🗺️"),
+    ('destination-list', 'answer', 50, None,
+     ['how many destinations', 'list of destinations', 'all destinations'],
+     "We feature {destinations_total} amazing destinations across Pakistan:\n\n{destinations}\n\nWhich one catches your eye? I can provide detailed information! 🏔️"),
+    ('booking-process', 'answer', 60, None,
+     ['how to book', 'how do i book', 'booking process'],
+     "Booking with TouriPK is simple! 📝\n\n1️⃣ Browse destinations or packages\n2️⃣ Check details & use cost calculator\n3️⃣ Login or create account\n4️⃣ Select your package\n5️⃣ Complete booking & payment\n6️⃣ Receive confirmation\n7️⃣ Enjoy your trip! 🎉\n\nReady to start? Visit /packages/ to see available tours!"),
+    ('travel-context', 'travel', 100, None,
+     ['trip*', 'tour*', 'visit*', 'travel*', 'package*', 'destination*'],
+     ''),
+    ('off-topic', 'irrelevant', 200, None,
+     ['solve', 'calculate', 'equation*', 'math problem*', 'what is 2', "what's 2",
+      'write code', 'program*', 'function in python', 'javascript', 'write me a python',
+      'who is', 'who was', 'who are',
+      'write an essay', 'homework', 'assignment*',
+      'london', 'paris', 'new york', 'dubai', 'india', 'china',
+      'election*', 'politics', 'religious debate',
+      'latest news', 'current president', 'prime minister'],
+     ''),
+]
+
+
+def seed_quick_answers(apps, schema_editor):
+    QuickAnswer = apps.get_model('chatbot', 'QuickAnswer')
+    for name, kind, priority, max_words, patterns, response in SEED_RULES:
+        QuickAnswer.objects.update_or_create(name=name, defaults={
+            'kind': kind, 'priority': priority, 'max_words': max_words,
+            'patterns': '\n'.join(patterns), 'response': response,
+        })
+
+
+def remove_quick_answers(apps, schema_editor):
+    QuickAnswer = apps.get_model('chatbot', 'QuickAnswer')
+    QuickAnswer.objects.filter(name__in=[rule[0] for rule in SEED_RULES]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuickAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(unique=True)),
+                ('kind', models.CharField(choices=[('answer', 'Quick answer'), ('irrelevant', 'Off-topic'), ('travel', 'Travel context (overrides off-topic)')], default='answer', max_length=20)),
+                ('patterns', models.TextField(help_text='One phrase per line, matched as whole words. End a phrase with * to match word prefixes, e.g. "assalam*"')),
+                ('response', models.TextField(blank=True, help_text='Reply for quick answers; may use {features}, {destinations}, {destinations_total} and {calculator_url}. Off-topic rules fall back to the standard reply when blank.')),
+                ('max_words', models.PositiveSmallIntegerField(blank=True, help_text='Only match messages with at most this many words (e.g. plain greetings)', null=True)),
+                ('priority', models.PositiveSmallIntegerField(default=100, help_text='Lower runs first when several rules match')),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.RunPython(seed_quick_answers, remove_quick_answers),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef
+from django.db.models.functions import Coalesce
+
+
+def backfill_last_message_at(apps, schema_editor):
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    newest_message = ChatSession.objects.filter(pk=OuterRef('pk')).annotate(
+        newest=Max('messages__created_at')
+    ).values('newest')[:1]
+    ChatSession.objects.update(last_message_at=Coalesce(newest_message, 'created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_chatmessage_session_time_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatTranscriptArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('oldest_created_at', models.DateTimeField()),
+                ('newest_created_at', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['session', '-last_id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_last_message_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', '-last_message_at'], name='chatsession_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['last_message_at'], name='chatsession_idle_idx'),
+        ),
+        migrations.AddField(
+            model_name='chattranscriptarchive',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chatbot.chatsession'),
+        ),
+    ]
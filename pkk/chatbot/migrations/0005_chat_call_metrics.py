@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_chat_transcript_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('channel', models.CharField(choices=[('http', 'HTTP'), ('ws', 'WebSocket')], max_length=10)),
+                ('path', models.CharField(choices=[('quick', 'Quick answer'), ('cache', 'Answer cache'), ('llm', 'Model')], max_length=10)),
+                ('latency_ms', models.PositiveIntegerField(help_text='From receiving the message to the complete answer')),
+                ('ttft_ms', models.PositiveIntegerField(blank=True, help_text='Time to the first streamed token', null=True)),
+                ('queue_ms', models.PositiveIntegerField(blank=True, help_text='Waiting for an upstream slot', null=True)),
+                ('upstream_ms', models.PositiveIntegerField(blank=True, help_text='Upstream calls, retries included', null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('cached_prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('tokens_estimated', models.BooleanField(default=False, help_text='The API sent no usage, so tokens were estimated')),
+                ('cost', models.DecimalField(decimal_places=6, default=0, help_text='USD', max_digits=12)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='calls', to='chatbot.chatsession')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_calls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatMetricsMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('path', models.CharField(choices=[('quick', 'Quick answer'), ('cache', 'Answer cache'), ('llm', 'Model')], max_length=10)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('latency_ms_total', models.PositiveBigIntegerField(default=0)),
+                ('latency_ms_max', models.PositiveIntegerField(default=0)),
+                ('ttft_calls', models.PositiveIntegerField(default=0)),
+                ('ttft_ms_total', models.PositiveBigIntegerField(default=0)),
+                ('upstream_ms_total', models.PositiveBigIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-minute', 'path'],
+                'constraints': [models.UniqueConstraint(fields=('minute', 'path'), name='chatmetrics_minute_path_unique')],
+            },
+        ),
+    ]
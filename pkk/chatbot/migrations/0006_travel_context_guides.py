@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+# "who is the best guide in Hunza" hit the off-topic "who is" phrase with no travel word to override it
+TRAVEL_PHRASES = [
+    'guide*', 'hotel*', 'trek*', 'itinerar*',
+    'hunza', 'skardu', 'swat', 'naran', 'kaghan', 'gilgit', 'chitral', 'murree', 'neelum',
+    'fairy meadows', 'deosai', 'naltar', 'malam jabba', 'k2',
+]
+
+
+def add_travel_phrases(apps, schema_editor):
+    QuickAnswer = apps.get_model('chatbot', 'QuickAnswer')
+    for rule in QuickAnswer.objects.filter(name='travel-context'):
+        patterns = [line.strip() for line in rule.patterns.splitlines() if line.strip()]
+        patterns += [phrase for phrase in TRAVEL_PHRASES if phrase not in patterns]
+        rule.patterns = '\n'.join(patterns)
+        rule.save(update_fields=['patterns', 'updated_at'])
+
+
+def remove_travel_phrases(apps, schema_editor):
+    QuickAnswer = apps.get_model('chatbot', 'QuickAnswer')
+    for rule in QuickAnswer.objects.filter(name='travel-context'):
+        patterns = [line.strip() for line in rule.patterns.splitlines() if line.strip()]
+        rule.patterns = '\n'.join(phrase for phrase in patterns if phrase not in TRAVEL_PHRASES)
+        rule.save(update_fields=['patterns', 'updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_chat_call_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_travel_phrases, remove_travel_phrases),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# The seeded reply hard-coded the knowledge base's destination count
+OLD_TEXT = 'Explore 12 featured destinations in Pakistan'
+NEW_TEXT = 'Explore {destinations_total} destinations in Pakistan'
+
+
+def use_live_count(apps, schema_editor):
+    QuickAnswer = apps.get_model('chatbot', 'QuickAnswer')
+    for rule in QuickAnswer.objects.filter(name='capabilities', response__contains=OLD_TEXT):
+        rule.response = rule.response.replace(OLD_TEXT, NEW_TEXT)
+        rule.save(update_fields=['response', 'updated_at'])
+
+
+def use_fixed_count(apps, schema_editor):
+    QuickAnswer = apps.get_model('chatbot', 'QuickAnswer')
+    for rule in QuickAnswer.objects.filter(name='capabilities', response__contains=NEW_TEXT):
+        rule.response = rule.response.replace(NEW_TEXT, OLD_TEXT)
+        rule.save(update_fields=['response', 'updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_travel_context_guides'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_live_count, use_fixed_count),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -7,9 +8,140 @@ class ChatSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=100, default="New Chat")
+    # Set from each new ChatMessage (chatbot.signals), so listings need no join
+    last_message_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-last_message_at'], name='chatsession_user_recent_idx'),
+            # Idle sessions for compact_chat_sessions
+            models.Index(fields=['last_message_at'], name='chatsession_idle_idx'),
+        ]
 
 class ChatMessage(models.Model):
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='messages')
     message = models.TextField()
     response = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A session's messages in time order
+            models.Index(fields=['session', 'created_at'], name='chatmessage_session_time_idx'),
+        ]
+
+class ChatTranscriptArchive(models.Model):
+    """
+    A session's messages moved out of ChatMessage once it went idle, stored as
+    zlib-compressed JSON rows of [id, message, response, created_at]
+    """
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='archives')
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    oldest_created_at = models.DateTimeField()
+    newest_created_at = models.DateTimeField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['session', '-last_id']
+
+    def __str__(self):
+        return f"Session #{self.session_id} messages #{self.first_id}-#{self.last_id} ({self.count})"
+
+class ChatCall(models.Model):
+    """One answered chat message: the path that produced it, its timings, token usage and cost"""
+    PATH_CHOICES = [
+        ('quick', 'Quick answer'),
+        ('cache', 'Answer cache'),
+        ('llm', 'Model'),
+    ]
+    CHANNEL_CHOICES = [
+        ('http', 'HTTP'),
+        ('ws', 'WebSocket'),
+    ]
+
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='chat_calls')
+    session = models.ForeignKey(ChatSession, on_delete=models.SET_NULL, null=True, blank=True, related_name='calls')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    path = models.CharField(max_length=10, choices=PATH_CHOICES)
+    latency_ms = models.PositiveIntegerField(help_text='From receiving the message to the complete answer')
+    ttft_ms = models.PositiveIntegerField(null=True, blank=True, help_text='Time to the first streamed token')
+    queue_ms = models.PositiveIntegerField(null=True, blank=True, help_text='Waiting for an upstream slot')
+    upstream_ms = models.PositiveIntegerField(null=True, blank=True, help_text='Upstream calls, retries included')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    cached_prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    tokens_estimated = models.BooleanField(default=False, help_text='The API sent no usage, so tokens were estimated')
+    cost = models.DecimalField(max_digits=12, decimal_places=6, default=0, help_text='USD')
+    error = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_path_display()} answer, {self.latency_ms} ms"
+
+class ChatMetricsMinute(models.Model):
+    """ChatCall totals for one minute and path, written by chatbot.metrics.rollup_chat_calls()"""
+    minute = models.DateTimeField()
+    path = models.CharField(max_length=10, choices=ChatCall.PATH_CHOICES)
+    calls = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    latency_ms_total = models.PositiveBigIntegerField(default=0)
+    latency_ms_max = models.PositiveIntegerField(default=0)
+    ttft_calls = models.PositiveIntegerField(default=0)
+    ttft_ms_total = models.PositiveBigIntegerField(default=0)
+    upstream_ms_total = models.PositiveBigIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    class Meta:
+        ordering = ['-minute', 'path']
+        constraints = [
+            models.UniqueConstraint(fields=['minute', 'path'], name='chatmetrics_minute_path_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.minute:%Y-%m-%d %H:%M} {self.path}: {self.calls} calls"
+
+class QuickAnswer(models.Model):
+    """
+    An intent rule for chatbot.intents: messages matching any of its phrases
+    get a canned answer, are declined as off-topic, or mark travel context.
+    """
+    KIND_CHOICES = [
+        ('answer', 'Quick answer'),
+        ('irrelevant', 'Off-topic'),
+        ('travel', 'Travel context (overrides off-topic)'),
+    ]
+
+    name = models.SlugField(max_length=50, unique=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='answer')
+    patterns = models.TextField(
+        help_text='One phrase per line, matched as whole words. End a phrase with * to match word prefixes, e.g. "assalam*"'
+    )
+    response = models.TextField(
+        blank=True,
+        help_text='Reply for quick answers; may use {features}, {destinations}, {destinations_total} and {calculator_url}. '
+                  'Off-topic rules fall back to the standard reply when blank.'
+    )
+    max_words = models.PositiveSmallIntegerField(
+        null=True, blank=True, help_text='Only match messages with at most this many words (e.g. plain greetings)'
+    )
+    priority = models.PositiveSmallIntegerField(default=100, help_text='Lower runs first when several rules match')
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return self.name
+
+    def get_patterns_list(self):
+        return [line.strip() for line in self.patterns.splitlines() if line.strip()]
@@ -1,16 +1,77 @@
 """
 Smart System Prompt Builder for TouriPK AI Chatbot
 This module creates context-aware prompts that keep the AI focused on website-related queries only.
+
+The system prompt only describes the website, so it is rendered once per
+process and identified by a hash of the knowledge_base dicts. Catalog facts
+(destinations, costs, packages, products) come from chatbot.retrieval: each
+question gets the few live listings that match it, as a separate message
+just before it, instead of the whole catalog in every prompt.
 """
+import hashlib
+import json
+import logging
+import re
+import threading
 
 from .knowledge_base import (
-    WEBSITE_INFO, FEATURES, DESTINATIONS, CALCULATOR_INFO,
+    WEBSITE_INFO, FEATURES, CALCULATOR_INFO,
     PACKAGES_INFO, PRODUCTS_INFO, WEATHER_INFO,
     TRAVEL_TIPS, NAVIGATION
 )
+from .retrieval import RETRIEVAL_MAX_TOKENS, quote_snippet, search_catalog
+
+logger = logging.getLogger(__name__)
+
+MAX_PROMPT_TOKENS = 6000  # System prompt, history and message together
+MESSAGE_OVERHEAD_TOKENS = 4  # Role markers around each message
+CATALOG_CONTEXT_HEADER = "Current TouriPK listings relevant to the user's next message:"
+
+_STATIC_SOURCES_HASH = hashlib.sha256(json.dumps(
+    [WEBSITE_INFO, FEATURES, CALCULATOR_INFO, PACKAGES_INFO, PRODUCTS_INFO,
+     WEATHER_INFO, TRAVEL_TIPS, NAVIGATION],
+    sort_keys=True, ensure_ascii=False,
+).encode('utf-8')).hexdigest()[:16]
+
+_TOKEN_RE = re.compile(r'(\w+)|[^\w\s]')
+
+_state = {'prompt': None, 'tokens': 0}
+_state_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """
+    Estimate how many tokens the model will see for `text`.
+
+    Words count as one token per four characters and every other symbol
+    (punctuation, emoji) as one, which tracks BPE tokenizers closely enough
+    for logging and budgeting.
+    """
+    return sum((len(m.group(1)) + 3) // 4 if m.group(1) else 1 for m in _TOKEN_RE.finditer(text))
+
+
+def get_system_prompt():
+    """
+    The compiled system prompt.
+
+    Returns:
+        (prompt, estimated tokens, sources hash)
+    """
+    if _state['prompt'] is None:
+        with _state_lock:
+            if _state['prompt'] is None:
+                prompt = render_system_prompt()
+                _state.update(prompt=prompt, tokens=count_tokens(prompt))
+                logger.info(f"System prompt compiled: {_STATIC_SOURCES_HASH}, ~{_state['tokens']} tokens")
+    return _state['prompt'], _state['tokens'], _STATIC_SOURCES_HASH
 
 
 def build_system_prompt():
+    """The compiled system prompt text (see get_system_prompt)"""
+    return get_system_prompt()[0]
+
+
+def render_system_prompt():
     """
     Builds a comprehensive system prompt that trains the AI to:
     1. Only answer TouriPK website-related questions
@@ -25,13 +86,14 @@ def build_system_prompt():
 - Help users navigate the TouriPK website
 - Answer questions about Pakistani destinations, packages, and travel planning
 - Guide users to relevant features (calculator, packages, products, weather)
-- Provide accurate information about the 12 destinations we feature
+- Provide accurate information about the destinations, packages and products listed on the site
 - Help with booking process and cost estimation
 
 ⛔ STRICT BOUNDARIES - DO NOT:
 - Answer questions unrelated to TouriPK website or Pakistan tourism
 - Discuss politics, religion, controversial topics, or current events
 - Provide information about destinations not listed on our website
+- Make up prices, durations or package details that are not in the TouriPK listings you are given
 - Write code, essays, or do homework
 - Engage in general knowledge questions (math, science, history unrelated to Pakistan tourism)
 - Answer "what is", "who is", "how to" questions unless directly related to travel/website
@@ -46,15 +108,15 @@ def build_system_prompt():
 **Core Features You Can Help With:**
 {chr(10).join(f"  • {feature}" for feature in FEATURES['core_features'])}
 
-**12 Featured Destinations:**
-{chr(10).join(f"  {i+1}. {dest['name']} ({dest['location']}) - Rs. {dest['daily_rate']}/day - {dest['description']}" 
-              for i, dest in enumerate(DESTINATIONS['list']))}
+**Destinations, Packages and Products:**
+- Before each question you get a system message with the current TouriPK listings that match it
+- Use those listings for names, prices, durations, costs and links
+- If nothing listed answers the question, point users to /content/destinations/, /packages/ or /content/products/
 
 **Trip Cost Calculator:**
 - URL: {CALCULATOR_INFO['url']}
 - How it works: {CALCULATOR_INFO['how_it_works']}
-- Formula: Total = Accommodation (Daily Rate × People × Days) + Transport (8,000 + 1,000 × People) + Activities (3,000 × People)
-- Price ranges: Budget trips Rs. 15,000-35,000, Standard Rs. 35,000-80,000, Premium Rs. 80,000+
+- Never quote a price that is not in the listings; send users to the calculator for a breakdown
 
 **Tour Packages:**
 - URL: {PACKAGES_INFO['url']}
@@ -108,10 +170,10 @@ Politely decline with one of these responses:
 **Example Good Responses:**
 
 Q: "What's the cost for a trip to Hunza?"
-A: "Hunza Valley costs approximately Rs. 6,000 per person per day. For a 2-person, 3-day trip, you'd need around Rs. 52,000 total. Use our Trip Cost Calculator (/content/calculator/) to get a detailed breakdown including accommodation, transport, and activities. Would you like to know about the best time to visit Hunza? 🏔️"
+A: "Here are the current Hunza costs from our listings: [cost components and packages from the listings, with their prices]. Use our Trip Cost Calculator (/content/calculator/) to get a detailed breakdown for your group size and days. Would you like to know about the best time to visit Hunza? 🏔️"
 
 Q: "Tell me about Fairy Meadows"
-A: "Fairy Meadows in Gilgit-Baltistan is the base camp for Nanga Parbat! Key highlights: stunning mountain views, Beyal Camp, and Raikot Glacier. It's a moderately difficult trek, best visited May-September. Daily rate: Rs. 5,500/person. Check detailed info at /content/destinations/. Interested in seeing package deals? 🏕️"
+A: "Fairy Meadows in Gilgit-Baltistan is the base camp for Nanga Parbat! Key highlights: stunning mountain views, Beyal Camp, and Raikot Glacier. It's a moderately difficult trek, best visited May-September. Check detailed info and current costs at /content/destinations/. Interested in seeing package deals? 🏕️"
 
 Q: "How do I book a trip?"
 A: "Easy! 1) Browse destinations or packages 2) Use cost calculator to estimate budget 3) Login/register 4) Select your package 5) Complete booking. Tour packages include transport, hotels, and guides. Visit /packages/ to explore options. Need help with any specific step? 🎒"
@@ -139,102 +201,87 @@ Now respond to user queries following these guidelines strictly!"""
     return prompt
 
 
-def build_context_aware_messages(user_message, chat_history=None):
+def build_catalog_context(user_message, chat_history=None, max_tokens=RETRIEVAL_MAX_TOKENS):
+    """
+    The live listings most relevant to a question, as prompt text.
+
+    A follow-up that matches nothing on its own ("and in winter?") is
+    searched together with the previous question.
+
+    Returns:
+        (context text or '' when nothing matched, estimated tokens)
+    """
+    hits = search_catalog(user_message)
+    if not hits and chat_history:
+        hits = search_catalog(f"{chat_history[-1].get('message', '')} {user_message}")
+
+    quote = quote_snippet(user_message)
+    snippets = ([quote] if quote else []) + [snippet for _, _, snippet in hits]
+
+    lines, tokens = [CATALOG_CONTEXT_HEADER], count_tokens(CATALOG_CONTEXT_HEADER)
+    for snippet in snippets:
+        line = f'• {snippet}'
+        line_tokens = count_tokens(line)
+        if tokens + line_tokens > max_tokens:
+            break
+        lines.append(line)
+        tokens += line_tokens
+    if len(lines) == 1:
+        return '', 0
+    return '\n'.join(lines), tokens
+
+
+def build_context_aware_messages(user_message, chat_history=None, max_tokens=MAX_PROMPT_TOKENS):
     """
     Build messages array with context awareness for better responses.
 
+    The listings relevant to the message go in a system message right before
+    it. History is dropped oldest first, and as a last resort the message is
+    shortened, so the estimated prompt stays within max_tokens.
+
     Args:
         user_message: Current user message
         chat_history: List of previous messages (optional)
+        max_tokens: Prompt token budget
 
     Returns:
         List of message dictionaries for API
     """
-
-    messages = [
-        {"role": "system", "content": build_system_prompt()}
-    ]
-
-    # Add conversation history if available (last 5 messages for context)
-    if chat_history:
-        for msg in chat_history[-5:]:
-            messages.append({"role": "user", "content": msg.get('message', '')})
-            messages.append({"role": "assistant", "content": msg.get('response', '')})
-
-    # Add current message
+    system_prompt, system_tokens, _ = get_system_prompt()
+    budget = max_tokens - system_tokens - MESSAGE_OVERHEAD_TOKENS * 2
+
+    message_tokens = count_tokens(user_message)
+    if message_tokens > budget:
+        logger.warning(f"Chat message of ~{message_tokens} tokens truncated to fit the prompt budget")
+        user_message = user_message[:max(budget, 0) * 4]
+        message_tokens = count_tokens(user_message)
+    budget -= message_tokens
+
+    catalog_context, catalog_tokens = build_catalog_context(
+        user_message, chat_history, min(RETRIEVAL_MAX_TOKENS, budget - MESSAGE_OVERHEAD_TOKENS)
+    )
+    if catalog_context:
+        budget -= catalog_tokens + MESSAGE_OVERHEAD_TOKENS
+
+    # Add conversation history if available (last 5 messages for context), newest first until the budget runs out
+    history = []
+    for msg in reversed((chat_history or [])[-5:]):
+        pair = [
+            {"role": "user", "content": msg.get('message', '')},
+            {"role": "assistant", "content": msg.get('response', '')},
+        ]
+        pair_tokens = sum(count_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in pair)
+        if pair_tokens > budget:
+            break
+        history[:0] = pair
+        budget -= pair_tokens
+
+    messages = [{"role": "system", "content": system_prompt}, *history]
+    if catalog_context:
+        messages.append({"role": "system", "content": catalog_context})
     messages.append({"role": "user", "content": user_message})
-
+    logger.info(
+        f"Chat prompt: ~{max_tokens - budget} tokens (system ~{system_tokens}, catalog ~{catalog_tokens}, "
+        f"{len(history) // 2} of {len((chat_history or [])[-5:])} history exchanges)"
+    )
     return messages
-
-
-def detect_irrelevant_keywords(message):
-    """
-    Quick pre-filter to detect obviously irrelevant questions.
-    Returns True if message seems irrelevant.
-    """
-
-    irrelevant_patterns = [
-        # Math/calculations unrelated to travel
-        'solve', 'calculate', 'equation', 'math problem', 'what is 2', 'what\'s 2',
-        # Code/programming
-        'write code', 'program', 'function in python', 'javascript', 'write me a python',
-        # General knowledge unrelated to travel
-        'who is', 'who was', 'who are',
-        # Homework/essays
-        'write an essay', 'homework', 'assignment',
-        # Non-Pakistan locations (common ones)
-        'london', 'paris', 'new york', 'dubai', 'india', 'china',
-        # Politics/religion (unless about tourism)
-        'election', 'politics', 'religious debate',
-        # Current events
-        'latest news', 'current president', 'prime minister'
-    ]
-
-    message_lower = message.lower()
-
-    # Check for irrelevant patterns
-    for pattern in irrelevant_patterns:
-        if pattern in message_lower:
-            # Check if it's actually travel-related despite keyword
-            travel_context = ['trip', 'tour', 'visit', 'travel', 'package', 'destination', 'touri']
-            if not any(ctx in message_lower for ctx in travel_context):
-                return True
-
-    return False
-
-
-def get_quick_response_for_common_questions(message):
-    """
-    Returns quick responses for very common questions without API call.
-    Returns None if not a common question.
-    """
-
-    message_lower = message.lower()
-
-    # Greetings
-    if any(greeting in message_lower for greeting in ['hello', 'hi ', 'hey', 'assalam', 'good morning', 'good evening']):
-        return "Hello! 👋 Welcome to TouriPK! I'm here to help you explore Pakistan's amazing destinations and plan your perfect trip. What would you like to know about? I can help with:\n• Destinations information\n• Cost estimation\n• Package booking\n• Weather forecasts\n• Travel tips"
-
-    # What can you do
-    if 'what can you do' in message_lower or 'how can you help' in message_lower or 'what do you do' in message_lower:
-        return "I'm your TouriPK travel assistant! 🎒 I can help you with:\n\n✅ Explore 12 featured destinations in Pakistan\n✅ Calculate trip costs with our calculator\n✅ Find perfect tour packages\n✅ Check weather forecasts\n✅ Shop local handicrafts\n✅ Guide you through booking process\n\nWhat are you planning? A family trip, adventure tour, or honeymoon? 🏔️"
-
-    # Features list
-    if 'features' in message_lower and ('website' in message_lower or 'touripk' in message_lower):
-        return f"TouriPK offers these amazing features:\n\n{chr(10).join(f'{i+1}. {feature}' for i, feature in enumerate(FEATURES['core_features']))}\n\nWhich feature would you like to explore first? 🚀"
-
-    # Calculator question
-    if 'calculator' in message_lower or 'cost estimat' in message_lower:
-        return f"Our Trip Cost Calculator helps you plan your budget! 💰\n\nHow it works:\n• Select your destination\n• Enter number of people and days\n• Get instant cost breakdown\n\nVisit: {CALCULATOR_INFO['url']}\n\nEstimated ranges: Budget trips (Rs. 15k-35k), Standard (Rs. 35k-80k), Premium (Rs. 80k+)\n\nWant to know costs for a specific destination? 🗺️"
-
-    # Destinations list
-    if 'how many destinations' in message_lower or 'list of destinations' in message_lower or 'all destinations' in message_lower:
-        destinations_list = chr(10).join(f"{i+1}. {dest.get('name', 'Unknown')} - {dest.get('location', 'Unknown')}" for i, dest in enumerate(DESTINATIONS['list']))
-        return f"We feature {DESTINATIONS['total']} amazing destinations across Pakistan:\n\n{destinations_list}\n\nWhich one catches your eye? I can provide detailed information! 🏔️"
-
-    # Booking process
-    if 'how to book' in message_lower or 'booking process' in message_lower:
-        return "Booking with TouriPK is simple! 📝\n\n1️⃣ Browse destinations or packages\n2️⃣ Check details & use cost calculator\n3️⃣ Login or create account\n4️⃣ Select your package\n5️⃣ Complete booking & payment\n6️⃣ Receive confirmation\n7️⃣ Enjoy your trip! 🎉\n\nReady to start? Visit /packages/ to see available tours!"
-
-    return None
-
@@ -0,0 +1,371 @@
+"""
+BM25 retrieval over the live catalog for chatbot prompts.
+
+Every active Destination (with its cost components), active Package and
+approved Product becomes one document: a short snippet that goes into the
+prompt, plus the text it is searched by. build_context_aware_messages() adds
+the top RETRIEVAL_TOP_K snippets for each question instead of a full listing.
+
+Each process keeps its index in memory. chatbot.signals records a change
+entry ("package:12") in the shared cache for every catalog save or delete,
+numbered by a shared counter. Before a search the index re-reads just the
+documents changed since the number it last applied; if the log has gaps or
+is too long, it rebuilds from scratch. catalog_version() is that counter, so
+anything derived from catalog content (the answer cache) can key on it.
+
+A question that names a custom package destination and a trip length or
+group size ("cheapest Hunza trip for 8 people, 5 days") also gets the
+cheapest option from the precomputed quote grid (quote_snippet()).
+"""
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from django.core.cache import cache
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SEQ_KEY = 'chatbot:catalog:seq'
+CATALOG_CHANGE_KEY = 'chatbot:catalog:change:{}'
+CHANGE_LOG_TTL = 60 * 60 * 24
+MAX_INCREMENTAL_CHANGES = 200  # Beyond this a full rebuild is cheaper
+RETRIEVAL_TOP_K = 5
+RETRIEVAL_MAX_TOKENS = 700  # Snippets added to one prompt
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 3  # Names count as this many occurrences of their words
+DESCRIPTION_CHARS = 240
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'for', 'from', 'has', 'have', 'how',
+    'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'our', 'per', 'please', 'rs', 's', 'tell',
+    'that', 'the', 'there', 'this', 'to', 'we', 'what', 'when', 'where', 'which', 'with', 'you', 'your',
+}
+
+_WORD_RE = re.compile(r'\w+')
+_QUOTE_DAYS_RE = re.compile(r'(\d+)\s*-?\s*(?:days?|nights?)\b')
+_QUOTE_PEOPLE_RE = re.compile(r'(\d+)\s*(?:people|persons?|travell?ers|pax|members|adults|guests)\b')
+
+_state = {'seq': None, 'index': None}
+_state_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lower-case word stems without accents, stop words, bare numbers or plural s"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    terms = []
+    for word in _WORD_RE.findall(text):
+        word = ''.join(c for c in word if not unicodedata.combining(c))
+        if word in STOP_WORDS or word.isdigit():
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def _shorten(text, limit=DESCRIPTION_CHARS):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= limit else text[:limit].rsplit(' ', 1)[0] + '…'
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index that supports adding and removing
+    single documents. Documents occupy slots; freed slots are reused.
+    """
+
+    def __init__(self):
+        self.keys = []  # slot -> document key, None when free
+        self.snippets = []
+        self.terms = []  # slot -> set of distinct terms
+        self.lengths = np.zeros(0, dtype=np.float64)
+        self.slots = {}  # document key -> slot
+        self.postings = {}  # term -> {slot: term frequency}
+        self.free = []
+        self.total_length = 0.0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, key, snippet, text):
+        self.remove(key)
+        terms = tokenize(text)
+        if not terms:
+            return
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.keys)
+            self.keys.append(None)
+            self.snippets.append(None)
+            self.terms.append(None)
+            self.lengths = np.append(self.lengths, 0.0)
+        self.keys[slot], self.snippets[slot], self.terms[slot] = key, snippet, set(terms)
+        self.slots[key] = slot
+        self.lengths[slot] = len(terms)
+        self.total_length += len(terms)
+        for term in terms:
+            postings = self.postings.setdefault(term, {})
+            postings[slot] = postings.get(slot, 0) + 1
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        for term in self.terms[slot]:
+            postings = self.postings[term]
+            del postings[slot]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths[slot]
+        self.lengths[slot] = 0.0
+        self.keys[slot] = self.snippets[slot] = self.terms[slot] = None
+        self.free.append(slot)
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """
+        Returns:
+            Up to k (score, key, snippet) tuples, best first
+        """
+        count = len(self.slots)
+        terms = set(tokenize(query))
+        if not count or not terms:
+            return []
+        scores = np.zeros(len(self.keys), dtype=np.float64)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / (self.total_length / count))
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            slots = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            scores[slots] += idf * tf * (BM25_K1 + 1) / (tf + norm[slots])
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(float(scores[slot]), self.keys[slot], self.snippets[slot]) for slot in hits]
+
+
+def _weighted(name, *parts):
+    return ' '.join([name] * NAME_WEIGHT + [part for part in parts if part])
+
+
+def _destination_documents(ids=None):
+    from content.models import Destination
+
+    destinations = Destination.objects.filter(is_active=True).prefetch_related('cost_components')
+    if ids is not None:
+        destinations = destinations.filter(pk__in=ids)
+    documents = {}
+    for dest in destinations:
+        components = list(dest.cost_components.all())
+        costs = '; '.join(f"{c.name} Rs. {c.base_cost:,.0f} {c.unit}" for c in components[:6])
+        snippet = (
+            f"Destination: {dest.name} ({dest.city or dest.country}) - {dest.get_difficulty_level_display()}, "
+            f"best time {dest.best_time_to_visit or 'any season'}, at least {dest.min_days} day(s). "
+            f"{_shorten(dest.description)}"
+            + (f" Costs: {costs}." if costs else '')
+            + f" Details: {reverse('content:destination_detail', args=[dest.pk])}"
+        )
+        text = _weighted(
+            dest.name, dest.city, dest.country, dest.difficulty_level, dest.best_time_to_visit, dest.description,
+            ' '.join(f'{c.name} {c.category} {c.description}' for c in components),
+        )
+        documents[f'destination:{dest.pk}'] = (snippet, text)
+    return documents
+
+
+def _package_documents(ids=None):
+    from packages.models import Package
+
+    packages = Package.objects.filter(is_active=True).select_related('company')
+    if ids is not None:
+        packages = packages.filter(pk__in=ids)
+    documents = {}
+    for package in packages:
+        child = f" (child Rs. {package.child_price:,.0f})" if package.child_price is not None else ''
+        inclusions = ', '.join(package.get_inclusions_list()[:5])
+        snippet = (
+            f"Package: {package.name} by {package.company.name} - Rs. {package.price_per_person:,.0f} per person{child}, "
+            f"{package.duration_days} days/{package.duration_nights} nights, {package.get_package_type_display()}, "
+            f"covers {package.destination_names}, {package.min_people}-{package.max_people} people. "
+            f"{_shorten(package.description)}"
+            + (f" Includes: {inclusions}." if inclusions else '')
+            + f" Details: {package.get_absolute_url()}"
+        )
+        text = _weighted(
+            package.name, package.company.name, package.destination_names, package.package_type,
+            package.get_package_type_display(), package.description, package.inclusions, package.itinerary,
+        )
+        documents[f'package:{package.pk}'] = (snippet, text)
+    return documents
+
+
+def _product_documents(ids=None):
+    from content.models import Product
+
+    products = Product.objects.filter(is_active=True, is_approved=True).select_related('company')
+    if ids is not None:
+        products = products.filter(pk__in=ids)
+    documents = {}
+    for product in products:
+        seller = f" by {product.company.name}" if product.company else ''
+        snippet = (
+            f"Product: {product.name}{seller} ({product.get_category_display()}) - Rs. {product.price:,.0f}. "
+            f"{_shorten(product.description, 160)} Shop: {reverse('content:product_list')}"
+        )
+        text = _weighted(product.name, product.category, product.get_category_display(), product.description)
+        documents[f'product:{product.pk}'] = (snippet, text)
+    return documents
+
+
+DOCUMENT_LOADERS = {
+    'destination': _destination_documents,
+    'package': _package_documents,
+    'product': _product_documents,
+}
+
+
+def load_documents(keys=None):
+    """
+    Snippet and search text for catalog documents.
+
+    Args:
+        keys: document keys such as "package:12", or None for the whole catalog
+
+    Returns:
+        Dict of key -> (snippet, text). Keys that are missing or inactive are left out.
+    """
+    documents = {}
+    if keys is None:
+        for loader in DOCUMENT_LOADERS.values():
+            documents.update(loader())
+        return documents
+    ids = {}
+    for key in keys:
+        kind, _, pk = key.partition(':')
+        if kind in DOCUMENT_LOADERS and pk.isdigit():
+            ids.setdefault(kind, set()).add(int(pk))
+    for kind, kind_ids in ids.items():
+        documents.update(DOCUMENT_LOADERS[kind](kind_ids))
+    return documents
+
+
+def build_index():
+    start = time.perf_counter()
+    index = BM25Index()
+    for key, (snippet, text) in load_documents().items():
+        index.add(key, snippet, text)
+    logger.info(f"Chatbot catalog index built: {len(index)} documents in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return index
+
+
+def apply_changes(index, keys):
+    """Re-read the given documents into the index, dropping the ones that are gone"""
+    documents = load_documents(keys)
+    for key in keys:
+        if key in documents:
+            index.add(key, *documents[key])
+        else:
+            index.remove(key)
+
+
+def catalog_version():
+    """Number of the latest catalog change; identical in every process"""
+    seq = cache.get(CATALOG_SEQ_KEY)
+    if seq is None:
+        # Start from the clock, so a counter lost from the cache never repeats an old number
+        start = int(time.time() * 1000)
+        cache.add(CATALOG_SEQ_KEY, start, timeout=None)
+        seq = cache.get(CATALOG_SEQ_KEY, start)
+    return seq
+
+
+def record_catalog_change(*keys):
+    """Log changed documents (e.g. "destination:3") for every process to re-read"""
+    for key in keys:
+        catalog_version()
+        try:
+            seq = cache.incr(CATALOG_SEQ_KEY)
+        except ValueError:
+            # The counter vanished; the fresh one forces a full rebuild anyway
+            catalog_version()
+            continue
+        cache.set(CATALOG_CHANGE_KEY.format(seq), key, timeout=CHANGE_LOG_TTL)
+
+
+def get_index():
+    seq = catalog_version()
+    if _state['seq'] != seq:
+        with _state_lock:
+            applied, index = _state['seq'], _state['index']
+            if applied != seq:
+                pending = seq - applied if applied is not None else None
+                changes = {}
+                if pending is not None and 0 < pending <= MAX_INCREMENTAL_CHANGES:
+                    changes = cache.get_many([CATALOG_CHANGE_KEY.format(n) for n in range(applied + 1, seq + 1)])
+                if index is not None and changes and len(changes) == pending:
+                    apply_changes(index, set(changes.values()))
+                else:
+                    index = build_index()
+                _state.update(index=index, seq=seq)
+    return _state['index']
+
+
+def search_catalog(query, k=RETRIEVAL_TOP_K):
+    """
+    Top catalog snippets for a question.
+
+    Returns:
+        Up to k (score, key, snippet) tuples, best first
+    """
+    index = get_index()
+    with _state_lock:
+        # Incremental updates mutate the index in place
+        return index.search(query, k)
+
+
+def quote_snippet(query):
+    """
+    The cheapest custom package for a question that names a rate-table
+    destination and a trip length or group size; the other defaults to the
+    builder's minimum.
+
+    Returns:
+        Snippet text, or '' when the question asks for no quote
+    """
+    from content.pricing import MAX_DAYS, MAX_PEOPLE, MIN_DAYS, MIN_PEOPLE, get_rate_tables
+    from content.quote_grid import cheapest_quote
+
+    text = query.casefold()
+    days = _QUOTE_DAYS_RE.search(text)
+    people = _QUOTE_PEOPLE_RE.search(text)
+    if not days and not people:
+        return ''
+    terms = set(tokenize(query))
+    destination = next(
+        (slug for slug, rates in get_rate_tables().items() if slug in terms or rates['name'].casefold() in text),
+        None,
+    )
+    if destination is None:
+        return ''
+    quote = cheapest_quote(
+        destination, int(days.group(1)) if days else MIN_DAYS, int(people.group(1)) if people else MIN_PEOPLE,
+    )
+    if quote is None:
+        return ''
+    return (
+        f"Cheapest custom package for {quote['destination_name']}: Rs. {quote['total']:,.0f} for "
+        f"{quote['num_people']} people and {quote['num_days']} days ({quote['num_rooms']} room(s), "
+        f"{quote['accommodation']} stay, {quote['vehicle']}, food: {quote['food']}), "
+        f"Rs. {quote['per_person']:,.0f} per person. The builder takes {MIN_DAYS}-{MAX_DAYS} days and "
+        f"{MIN_PEOPLE}-{MAX_PEOPLE} people. Build it: {reverse('content:custom_package')}"
+    )
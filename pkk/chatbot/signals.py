@@ -0,0 +1,73 @@
+"""Signal handlers that keep the chatbot's catalog index, intent rules and session activity current"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .intents import invalidate_intents
+from .models import ChatMessage, ChatSession, QuickAnswer
+from .retrieval import record_catalog_change
+
+# Saves limited to these fields do not change any catalog snippet
+STAT_FIELDS = {'views_count', 'rating', 'reviews_count', 'stock_quantity', 'costs_version', 'costs_updated_at'}
+
+CATALOG_DOCUMENT_KINDS = {
+    'content.Destination': 'destination',
+    'packages.Package': 'package',
+    'content.Product': 'product',
+}
+
+
+def _record_after_commit(*keys):
+    # Other processes re-read these rows, so they must see the committed data
+    transaction.on_commit(lambda: record_catalog_change(*keys))
+
+
+@receiver(post_save, sender='content.Destination')
+@receiver(post_delete, sender='content.Destination')
+@receiver(post_save, sender='packages.Package')
+@receiver(post_delete, sender='packages.Package')
+@receiver(post_save, sender='content.Product')
+@receiver(post_delete, sender='content.Product')
+def catalog_document_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= STAT_FIELDS:
+        return
+    _record_after_commit(f'{CATALOG_DOCUMENT_KINDS[sender._meta.label]}:{instance.pk}')
+
+
+@receiver(post_save, sender='content.CostComponent')
+@receiver(post_delete, sender='content.CostComponent')
+def cost_component_changed(sender, instance, **kwargs):
+    # Costs are part of their destination's snippet
+    _record_after_commit(f'destination:{instance.destination_id}')
+
+
+@receiver(post_save, sender='packages.Company')
+def company_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= STAT_FIELDS:
+        return
+    # Package and product snippets carry the company name
+    keys = [f'package:{pk}' for pk in instance.packages.values_list('pk', flat=True)]
+    keys += [f'product:{pk}' for pk in instance.products.values_list('pk', flat=True)]
+    if keys:
+        _record_after_commit(*keys)
+
+
+@receiver(post_save, sender=QuickAnswer)
+@receiver(post_delete, sender=QuickAnswer)
+def quick_answer_changed(sender, instance, **kwargs):
+    invalidate_intents()
+
+
+@receiver(post_save, sender='content.Destination')
+@receiver(post_delete, sender='content.Destination')
+def destination_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= STAT_FIELDS:
+        return
+    # Quick answers list the live destinations and their count
+    transaction.on_commit(invalidate_intents)
+
+
+@receiver(post_save, sender=ChatMessage)
+def chat_message_saved(sender, instance, created, **kwargs):
+    if created:
+        ChatSession.objects.filter(pk=instance.session_id).update(last_message_at=instance.created_at)
@@ -1,3 +1,721 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from content.models import Destination, PackageRateTable, Product
+from content.quote_grid import cheapest_quote
+from packages.inventory import apply_inventory_updates
+from packages.models import Company
+from . import answer_cache, llm, prompt_builder, transcripts
+from .answer_cache import (
+    answer_cache_key, depends_on_history, get_answer_cache_stats, get_cached_answer, normalize_question, store_answer,
+)
+from .consumers import ChatConsumer
+from .intents import classify
+from .llm import LLMError, LLMOverloaded, complete_chat_sync
+from .metrics import record_call, rollup_chat_calls
+from .models import ChatCall, ChatMessage, ChatMetricsMinute, ChatSession, ChatTranscriptArchive, QuickAnswer
+from .retrieval import record_catalog_change, search_catalog
+from .throttling import (
+    Bucket, begin_flight, check_rate_limit, flight_key, get_throttle_stats, single_flight, take_token,
+)
+from .transcripts import compact_idle_sessions, session_messages
+from .views import get_canned_response
+from .prompt_builder import CATALOG_CONTEXT_HEADER, build_catalog_context, build_context_aware_messages, count_tokens, get_system_prompt
+
+User = get_user_model()
+
+# (message, expected rule name or None when the model should answer), classified by the seeded rules
+LABELLED_CORPUS = [
+    ('hi', 'greeting'),
+    ('Hello!', 'greeting'),
+    ('hey there', 'greeting'),
+    ('Assalamualaikum', 'greeting'),
+    ('good morning', 'greeting'),
+    ('this is my first trip to Pakistan, where should I go?', None),
+    ('which hotel is best in Hunza', None),
+    ('hi, I want a detailed 7 day plan for Skardu and Hunza with my family', None),
+    ('what can you do?', 'capabilities'),
+    ('How can you help me', 'capabilities'),
+    ('what are the website features', 'website-features'),
+    ('list the features of TouriPK', 'website-features'),
+    ('where is the calculator', 'calculator'),
+    ('I need a cost estimate for Naran', 'calculator'),
+    ('how many destinations do you have', 'destination-list'),
+    ('show me all destinations', 'destination-list'),
+    ('how to book a package', 'booking-process'),
+    ('How do I book?', 'booking-process'),
+    ('explain the booking process', 'booking-process'),
+    ('who is the prime minister', 'off-topic'),
+    ('solve this equation for x', 'off-topic'),
+    ('write code to sort a list', 'off-topic'),
+    ('help with my homework', 'off-topic'),
+    ('what is 2+2', 'off-topic'),
+    ('latest news from London', 'off-topic'),
+    ('best restaurants in Dubai', 'off-topic'),
+    ('is a trip from Dubai to Skardu possible', None),
+    ('who is the best tour guide for Fairy Meadows', None),
+    ('who is the best guide in Hunza', None),
+    ('who are the trekking guides in Chitral', None),
+    ('tour packages for a family of five', None),
+    ('what is the best time to visit Swat', None),
+    ('is Naran safe in winter', None),
+    ('schedule for the programme in Lahore', 'off-topic'),
+    ('I love hiking', None),
+    ('what is the weather in Gilgit', None),
+    ('whos the hiring manager', None),
+    ('chinar trees in autumn', None),
+    ('indiana jones', None),
+]
+
+
+def make_user(email='traveller@example.com', **kwargs):
+    return User.objects.create_user(username=email, email=email, password='pw12345!x', **kwargs)
+
+
+class CompletionStubServer(ThreadingHTTPServer):
+    """A local stand-in for the DeepSeek chat completions API"""
+    daemon_threads = True
+
+    def reset(self):
+        self.requests = []
+        self.tokens = ['Hunza ', 'is ', 'lovely ', 'in ', 'October.']
+        self.token_delay = 0
+        self.answer_delay = 0
+        self.statuses = []  # Status codes for the next requests, then 200
+
+    def handle_error(self, request, client_address):
+        pass  # The client closed a cancelled stream
+
+
+class CompletionStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(payload)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        time.sleep(self.server.answer_delay)
+        usage = {'prompt_tokens': 120, 'completion_tokens': len(self.server.tokens), 'prompt_cache_hit_tokens': 100}
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if not payload.get('stream'):
+            body = json.dumps({
+                'choices': [{'message': {'content': ''.join(self.server.tokens)}}], 'usage': usage,
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        chunks = [{'choices': [{'delta': {'content': token}}]} for token in self.server.tokens]
+        chunks.append({'choices': [], 'usage': usage})
+        for chunk in chunks:
+            time.sleep(self.server.token_delay)
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CompletionStubMixin:
+    """Points chatbot.llm at a CompletionStubServer for the duration of each test"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = CompletionStubServer(('127.0.0.1', 0), CompletionStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        answer_cache._local.clear()
+        self.server.reset()
+        url = f'http://127.0.0.1:{self.server.server_port}/v1/chat/completions'
+        patcher = mock.patch.object(llm, 'DEEPSEEK_API_URL', url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+# Whatever CHANNEL_LAYER_BACKEND says, consumers and tests share this process
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(CompletionStubMixin, TransactionTestCase):
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chatbot/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_until(self, communicator, kind):
+        received = []
+        while not received or received[-1]['type'] != kind:
+            received.append(await communicator.receive_json_from(timeout=5))
+        return received
+
+    async def test_streams_tokens_and_saves_the_answer(self):
+        user = await sync_to_async(make_user)()
+        communicator = await self.connect(user)
+        question = 'Suggest a relaxed Hunza itinerary for October'
+        await communicator.send_json_to({'type': 'message', 'message': question, 'session_id': None})
+
+        received = await self.receive_until(communicator, 'done')
+        self.assertEqual(received[0]['type'], 'start')
+        self.assertEqual([m['text'] for m in received if m['type'] == 'token'], self.server.tokens)
+        done = received[-1]
+        self.assertEqual(done['response'], 'Hunza is lovely in October.')
+        self.assertTrue(self.server.requests[0]['stream'])
+
+        saved = await sync_to_async(ChatMessage.objects.get)(id=done['message_id'])
+        self.assertEqual(
+            (saved.session_id, saved.message, saved.response), (done['session_id'], question, done['response']),
+        )
+        call = await sync_to_async(ChatCall.objects.get)()
+        self.assertEqual((call.channel, call.path, call.prompt_tokens, call.completion_tokens), ('ws', 'llm', 120, 5))
+        self.assertIsNotNone(call.ttft_ms)
+        cached, _ = await sync_to_async(get_cached_answer)(question)
+        self.assertEqual(cached, done['response'])
+
+        # The same question in a new session comes from the answer cache
+        await communicator.send_json_to({'type': 'message', 'message': question, 'session_id': None})
+        received = await self.receive_until(communicator, 'done')
+        self.assertEqual(received[-1]['response'], done['response'])
+        self.assertEqual(len(self.server.requests), 1)
+        await communicator.disconnect()
+
+    async def test_cancel_mid_stream(self):
+        self.server.tokens = [f'word{i} ' for i in range(20)]
+        self.server.token_delay = 0.1
+        user = await sync_to_async(make_user)()
+        communicator = await self.connect(user)
+        question = 'Describe the Skardu lakes in detail'
+        await communicator.send_json_to({'type': 'message', 'message': question, 'session_id': None})
+        await self.receive_until(communicator, 'token')
+        await communicator.send_json_to({'type': 'cancel'})
+
+        received = await self.receive_until(communicator, 'cancelled')
+        cancelled = received[-1]
+        self.assertTrue(cancelled['response'].startswith('word0 '))
+        self.assertLess(len(cancelled['response']), len(''.join(self.server.tokens)))
+
+        saved = await sync_to_async(ChatMessage.objects.get)(id=cancelled['message_id'])
+        self.assertEqual(saved.response, cancelled['response'])
+        call = await sync_to_async(ChatCall.objects.get)()
+        self.assertEqual(call.error, 'cancelled')
+        cached, key = await sync_to_async(get_cached_answer)(question)
+        self.assertIsNone(cached)  # A partial answer is never cached
+        self.assertIsNotNone(key)
+        await communicator.disconnect()
+
+    async def test_rejects_anonymous_and_bad_messages(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chatbot/')
+        communicator.scope['user'] = None
+        connected, code = await communicator.connect()
+        self.assertEqual((connected, code), (False, 4401))
+
+        communicator = await self.connect(await sync_to_async(make_user)())
+        for content, error in (
+            ({'type': 'ping'}, 'Unknown message type'),
+            ({'type': 'message', 'message': '  '}, 'Message cannot be empty'),
+            ({'type': 'message', 'message': 'Hunza?', 'session_id': 999}, 'Chat session not found'),
+        ):
+            await communicator.send_json_to(content)
+            self.assertEqual((await communicator.receive_json_from())['error'], error)
+        await communicator.disconnect()
+
+
+class LLMGatewayTests(CompletionStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(llm, 'RETRY_BASE', 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_transient_failures(self):
+        self.server.statuses = [503, 429]
+        stats = {}
+        with self.assertLogs('chatbot.llm', 'WARNING'):
+            answer = complete_chat_sync([{'role': 'user', 'content': 'Hi'}], user_id=1, stats=stats)
+        self.assertEqual(answer, 'Hunza is lovely in October.')
+        self.assertEqual(stats['attempts'], 3)
+        self.assertEqual(
+            (stats['prompt_tokens'], stats['completion_tokens'], stats['cached_prompt_tokens']), (120, 5, 100),
+        )
+        self.assertFalse(self.server.requests[0]['stream'])
+
+    def test_gives_up_after_max_attempts_and_on_client_errors(self):
+        self.server.statuses = [500] * llm.MAX_ATTEMPTS
+        with self.assertLogs('chatbot.llm', 'WARNING'), self.assertRaises(LLMError):
+            complete_chat_sync([{'role': 'user', 'content': 'Hi'}], user_id=1)
+        self.assertEqual(len(self.server.requests), llm.MAX_ATTEMPTS)
+
+        self.server.reset()
+        self.server.statuses = [400]
+        with self.assertRaisesMessage(LLMError, 'HTTP 400'):
+            complete_chat_sync([{'role': 'user', 'content': 'Hi'}], user_id=1)
+        self.assertEqual(len(self.server.requests), 1)  # Not retried
+
+    def test_sheds_requests_that_wait_too_long(self):
+        self.server.answer_delay = 0.5
+        first = threading.Thread(target=lambda: complete_chat_sync([{'role': 'user', 'content': 'Hi'}], user_id=7))
+        with mock.patch.object(llm, 'QUEUE_TIMEOUT', 0.1):
+            first.start()
+            time.sleep(0.1)
+            # The same user's second call waits for the first one's slot
+            with self.assertRaises(LLMOverloaded):
+                complete_chat_sync([{'role': 'user', 'content': 'Again'}], user_id=7)
+            # Other users are not held up
+            answer = complete_chat_sync([{'role': 'user', 'content': 'Hi'}], user_id=8)
+            self.assertEqual(answer, 'Hunza is lovely in October.')
+        first.join()
+
+
+class PromptBuilderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_system_prompt_is_rendered_once(self):
+        saved = dict(prompt_builder._state)
+        self.addCleanup(prompt_builder._state.update, saved)
+        prompt_builder._state.update(prompt=None, tokens=0)
+        render_system_prompt = prompt_builder.render_system_prompt
+        with mock.patch.object(prompt_builder, 'render_system_prompt', wraps=render_system_prompt) as render:
+            prompt, tokens, sources_hash = get_system_prompt()
+            self.assertIs(get_system_prompt()[0], prompt)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(tokens, count_tokens(prompt))
+        self.assertRegex(sources_hash, r'^[0-9a-f]{16}$')
+
+    def test_messages_fit_the_budget(self):
+        Destination.objects.create(
+            name='Hunza Valley', description='Apricot orchards below Rakaposhi', city='Karimabad', min_days=3,
+        )
+        history = [{'message': f'Question {i} ' + 'word ' * 40, 'response': 'Answer ' * 40} for i in range(5)]
+        system_tokens = get_system_prompt()[1]
+
+        messages = build_context_aware_messages('When should I visit Hunza Valley?', history)
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertEqual(len(messages), 1 + 10 + 2)
+        self.assertTrue(messages[-2]['content'].startswith(CATALOG_CONTEXT_HEADER))
+        self.assertIn('Destination: Hunza Valley (Karimabad)', messages[-2]['content'])
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'When should I visit Hunza Valley?'})
+
+        # A tight budget drops the oldest exchanges first
+        messages = build_context_aware_messages('When should I visit Hunza Valley?', history, system_tokens + 400)
+        self.assertEqual([m['content'] for m in messages if m['role'] == 'user'][0], history[-2]['message'])
+        self.assertLessEqual(sum(count_tokens(m['content']) + 4 for m in messages), system_tokens + 400)
+
+        # As a last resort the message itself is shortened
+        with self.assertLogs('chatbot.prompt_builder', 'WARNING'):
+            messages = build_context_aware_messages('Hunza ' * 2000, None, system_tokens + 100)
+        self.assertLess(len(messages[-1]['content']), 400)
+
+
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        answer_cache._local.clear()
+
+    def test_spelling_variants_share_a_key(self):
+        self.assertEqual(normalize_question('Best time to visit Hunza Valley?'), ('best time visit hunza', ('hunza',)))
+        self.assertEqual(normalize_question('hunzah trip')[1], ('hunza',))
+        key = answer_cache_key('best time to visit hunza')
+        for variant in ('Best time to visit Hunza valley??', 'BEST TIME TO VISIT KARIMABAD', 'best time visit hunzza'):
+            self.assertEqual(answer_cache_key(variant), key, variant)
+        self.assertNotEqual(answer_cache_key('best time to visit skardu'), key)
+        self.assertEqual(normalize_question('Naran & Kaghan trip')[1], ('naran',))
+
+    def test_follow_ups_are_not_cached(self):
+        self.assertFalse(depends_on_history('what about there in May?', has_history=False))
+        for message in ('what about there in May?', 'and in winter', 'how much does it cost'):
+            self.assertTrue(depends_on_history(message, has_history=True), message)
+            self.assertIsNone(answer_cache_key(message, has_history=True))
+        self.assertFalse(depends_on_history('Best time to visit Skardu', has_history=True))
+        self.assertIsNone(answer_cache_key('x' * 400))
+
+    def test_store_hit_and_catalog_invalidation(self):
+        answer, key = get_cached_answer('Best time to visit Hunza?')
+        self.assertIsNone(answer)
+        store_answer(key, 'April to October.', latency=2.5)
+        self.assertEqual(get_cached_answer('best time to visit hunza valley')[0], 'April to October.')
+        answer_cache._local.clear()
+        self.assertEqual(get_cached_answer('best time to visit hunza')[0], 'April to October.')  # Shared cache
+
+        record_catalog_change('destination:1')
+        self.assertIsNone(get_cached_answer('Best time to visit Hunza?')[0])
+        stats = get_answer_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['saved_seconds']), (2, 2, 5.0))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+
+class IntentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_labelled_corpus(self):
+        failures = []
+        for message, expected in LABELLED_CORPUS:
+            intent = classify(message)
+            if (intent.name if intent else None) != expected:
+                failures.append((message, expected, intent))
+        self.assertEqual(failures, [])
+
+    def test_rule_changes_apply_without_restart(self):
+        self.assertIsNone(classify('tell me a joke'))
+        QuickAnswer.objects.create(name='jokes', kind='irrelevant', patterns='joke*', response='No jokes, only trips!')
+        self.assertEqual(classify('tell me a joke'), ('irrelevant', 'jokes', 'No jokes, only trips!'))
+        self.assertIsNone(classify('a joke about Hunza'))  # Travel context wins
+
+
+class CatalogRetrievalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bulk_updates_reach_the_index(self):
+        company = Company.objects.create(
+            name='Hunza Foods', slug='hunza-foods', description='Dried fruit', email='info@example.com',
+            phone='03001234567', approval_status='approved',
+        )
+        jam = Product.objects.create(
+            name='Apricot Jam', description='Sun-dried apricots', price=Decimal('900'), company=company,
+            is_approved=False,
+        )
+        self.assertEqual(search_catalog('apricot jam'), [])
+
+        self.client.force_login(make_user('admin@example.com', is_staff=True, is_superuser=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/content/product/', {'action': 'approve_products', '_selected_action': [jam.id]})
+        (_, key, snippet), = search_catalog('apricot jam')
+        self.assertEqual(key, f'product:{jam.id}')
+        self.assertIn('Rs. 900', snippet)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_inventory_updates(company, [{'product_id': jam.id, 'stock': 3, 'price': '1150'}])
+        self.assertIn('Rs. 1,150', search_catalog('apricot jam')[0][2])
+
+    def test_answers_use_live_destinations(self):
+        Destination.objects.create(name='Hunza Valley', description='Orchards', city='Karimabad')
+        Destination.objects.create(name='Closed Pass', description='Closed', city='Nowhere', is_active=False)
+        self.assertIn('Explore 1 destinations', get_canned_response('what can you do?'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Destination.objects.create(name='Skardu', description='Lakes', city='Skardu')
+        answer = get_canned_response('how many destinations do you have')
+        self.assertIn('We feature 2 amazing destinations', answer)
+        self.assertIn('1. Hunza Valley - Karimabad\n2. Skardu - Skardu\n', answer)
+        self.assertIn('Explore 2 destinations', get_canned_response('what can you do?'))
+        self.assertIn('Exploring our 2 destinations', get_canned_response('write code to sort a list'))
+
+    def test_system_prompt_quotes_no_prices(self):
+        self.assertNotRegex(get_system_prompt()[0], r'Rs\. ?\d')
+
+    def test_cheapest_quote_for_trip_questions(self):
+        quote = cheapest_quote('hunza', 5, 8)
+        context, _ = build_catalog_context('cheapest Hunza trip for 8 people, 5 days?')
+        self.assertIn(
+            f"Cheapest custom package for Hunza: Rs. {quote['total']:,.0f} for 8 people and 5 days", context,
+        )
+        self.assertIn('/custom-package/', context)
+        # Only the group size: the shortest trip the builder allows
+        self.assertIn('for 12 people and 3 days', build_catalog_context('Skardu for 12 travellers')[0])
+        for question in ('cheapest Hunza trip', 'a 5 day trip to Gilgit', 'what is 2+2'):
+            self.assertNotIn('Cheapest custom package', build_catalog_context(question)[0])
+
+        # Quoted answers expire when a rate changes
+        key = answer_cache_key('cheapest Hunza trip for 8 people, 5 days?')
+        table = PackageRateTable.objects.get(slug='hunza')
+        table.guide_per_day += 1
+        table.save()
+        self.assertNotEqual(answer_cache_key('cheapest Hunza trip for 8 people, 5 days?'), key)
+
+
+class ChatHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.session = ChatSession.objects.create(user=self.user, title='Hunza plans')
+        self.ids = [
+            ChatMessage.objects.create(session=self.session, message=f'Q{i}', response=f'A{i}').id for i in range(7)
+        ]
+
+    def history(self, **params):
+        response = self.client.get(f'/chatbot/history/{self.session.id}/', params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [m['message'] for m in body['messages']], body['has_more']
+
+    def test_history_pages(self):
+        self.assertEqual(self.history(limit=3), (['Q4', 'Q5', 'Q6'], True))
+        self.assertEqual(self.history(limit=3, before=self.ids[4]), (['Q1', 'Q2', 'Q3'], True))
+        self.assertEqual(self.history(limit=3, before=self.ids[1]), (['Q0'], False))
+        self.assertEqual(self.history(limit=3, since=self.ids[2]), (['Q3', 'Q4', 'Q5'], True))
+        self.assertEqual(self.history(limit=3, since=self.ids[5]), (['Q6'], False))
+        self.assertEqual(self.history(limit='x'), ([f'Q{i}' for i in range(7)], False))
+
+        other = ChatSession.objects.create(user=make_user('other@example.com'))
+        self.assertEqual(self.client.get(f'/chatbot/history/{other.id}/').status_code, 404)
+
+    def test_sessions_page_by_last_activity(self):
+        older = ChatSession.objects.create(user=self.user, title='Skardu')
+        ChatSession.objects.create(user=make_user('other@example.com'), title='Not mine')
+        ChatMessage.objects.create(session=older, message='Q', response='A')  # Now the most recent
+
+        response = self.client.get('/chatbot/sessions/', {'limit': 1})
+        body = response.json()
+        self.assertEqual(([s['title'] for s in body['sessions']], body['has_more']), (['Skardu'], True))
+        response = self.client.get('/chatbot/sessions/', {'limit': 1, 'before': body['sessions'][0]['id']})
+        body = response.json()
+        self.assertEqual(([s['title'] for s in body['sessions']], body['has_more']), (['Hunza plans'], False))
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.now = 1_000_000.0
+        patcher = mock.patch('chatbot.throttling.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, message, client=None, **extra):
+        return (client or self.client).post(
+            '/chatbot/send/', json.dumps({'message': message}), content_type='application/json', **extra,
+        )
+
+    def test_bucket_allows_a_burst_then_refills(self):
+        bucket = Bucket('test', 3, 60)  # One message a second
+        self.assertEqual([take_token(bucket, 'a') for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(take_token(bucket, 'a'), 1.0)
+        self.assertEqual(take_token(bucket, 'b'), 0)  # Identities have their own buckets
+
+        self.now += 1
+        self.assertEqual(take_token(bucket, 'a'), 0)
+        self.assertAlmostEqual(take_token(bucket, 'a'), 1.0)
+
+        # An idle bucket refills to its capacity, not beyond
+        self.now += 600
+        self.assertEqual([take_token(bucket, 'a') for _ in range(3)], [0, 0, 0])
+        self.assertGreater(take_token(bucket, 'a'), 0)
+
+    def test_user_and_ip_limits(self):
+        with mock.patch('chatbot.throttling.USER_BUCKET', Bucket('user', 2, 60)), \
+                mock.patch('chatbot.throttling.IP_BUCKET', Bucket('ip', 3, 60)):
+            self.assertEqual([check_rate_limit(1, '10.0.0.1') for _ in range(3)], [None, None, 1])
+            self.assertEqual([check_rate_limit(2, '10.0.0.1') for _ in range(2)], [None, 1])
+        self.assertEqual(get_throttle_stats(), {'rejected_user': 1, 'rejected_ip': 1, 'coalesced': 0})
+
+    def test_send_message_is_rate_limited(self):
+        with mock.patch('chatbot.throttling.USER_BUCKET', Bucket('user', 1, 60)):
+            self.assertEqual(self.send('hi').status_code, 200)
+            with self.assertLogs('chatbot.views', 'WARNING'):
+                response = self.send('hello')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual((response['Retry-After'], response.json()['retry_after']), ('1', 1))
+
+    def test_double_submit_is_charged_once(self):
+        # A request for the same question is already running; publish its result
+        key = flight_key(self.user.id, None, 'hi there')
+        token, leader = begin_flight(key)
+        self.assertTrue(leader)
+        result = {'response': 'Hello!', 'session_id': 1, 'message_id': 1}
+        cache.set(f'{key}:{token}', result)
+
+        with mock.patch('chatbot.throttling.USER_BUCKET', Bucket('user', 1, 60)):
+            response = self.send('Hi  there')
+            self.assertEqual(response.json(), result)
+            self.assertEqual(get_throttle_stats()['coalesced'], 1)
+            # The coalesced request left the bucket alone
+            self.assertEqual(self.send('hi').status_code, 200)
+            with self.assertLogs('chatbot.views', 'WARNING'):
+                self.assertEqual(self.send('hello').status_code, 429)
+
+    def test_admit_runs_only_for_the_leader(self):
+        admitted = []
+        self.assertEqual(single_flight('flight', lambda: 'answer', admit=lambda: admitted.append(1)), 'answer')
+        self.assertEqual(admitted, [1])
+
+        token, _ = begin_flight('flight')
+        cache.set(f'flight:{token}', 'shared')
+        self.assertEqual(single_flight('flight', lambda: 'answer', admit=lambda: admitted.append(1)), 'shared')
+        self.assertEqual(admitted, [1])
+
+    def test_send_message_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self.send('hi', client).status_code, 403)
+
+        secret = 'a' * 32
+        client.cookies['csrftoken'] = secret
+        self.assertEqual(self.send('hi', client, HTTP_X_CSRFTOKEN=secret).status_code, 200)
+
+
+class TranscriptCompactionTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.session = ChatSession.objects.create(user=self.user, title='Hunza plans')
+
+    def add(self, *messages, session=None):
+        return [
+            ChatMessage.objects.create(session=session or self.session, message=m, response=f'Re: {m}').id
+            for m in messages
+        ]
+
+    def go_idle(self):
+        ChatSession.objects.update(last_message_at=timezone.now() - timedelta(days=40))
+
+    def page(self, **kwargs):
+        rows, has_more = session_messages(self.session.id, **kwargs)
+        return [row[1] for row in rows], has_more
+
+    def test_round_trip_across_archives_and_live_rows(self):
+        self.add(*[f'Q{i}' for i in range(5)])
+        self.go_idle()
+        self.assertEqual(compact_idle_sessions(), (1, 5))
+        self.assertFalse(ChatMessage.objects.filter(session=self.session).exists())
+        ids = [row[0] for row in session_messages(self.session.id, 10)[0]]
+        ids += self.add('Q5', 'Q6', 'Q7')  # The session is picked up again
+
+        self.assertEqual(self.page(limit=3), (['Q5', 'Q6', 'Q7'], True))
+        self.assertEqual(self.page(limit=3, before=ids[5]), (['Q2', 'Q3', 'Q4'], True))
+        self.assertEqual(self.page(limit=3, before=ids[2]), (['Q0', 'Q1'], False))
+        self.assertEqual(self.page(limit=3, since=ids[3]), (['Q4', 'Q5', 'Q6'], True))
+        self.assertEqual(self.page(limit=3, since=ids[6]), (['Q7'], False))
+
+        self.go_idle()
+        self.assertEqual(compact_idle_sessions(), (1, 3))
+        self.assertEqual(ChatTranscriptArchive.objects.filter(session=self.session).count(), 2)
+        self.assertEqual(self.page(limit=10), ([f'Q{i}' for i in range(8)], False))
+        self.assertEqual(self.page(limit=3, before=ids[6]), (['Q3', 'Q4', 'Q5'], True))
+
+        self.client.force_login(self.user)
+        body = self.client.get(f'/chatbot/history/{self.session.id}/', {'limit': 2, 'before': ids[5]}).json()
+        self.assertEqual(([m['message'] for m in body['messages']], body['has_more']), (['Q3', 'Q4'], True))
+
+    def test_message_saved_during_compaction_stays_live(self):
+        # A message whose id was taken before the compaction read the session,
+        # but which was only committed while the batch was being archived
+        first, late_id, last = self.add('first', 'late', 'last')
+        ChatMessage.objects.filter(id=late_id).delete()
+        other = ChatSession.objects.create(user=self.user, title='Skardu')
+        self.add('other', session=other)
+        self.go_idle()
+
+        real_archive = transcripts._archive
+
+        def archive_and_commit_late_message(session_id, rows):
+            if not ChatMessage.objects.filter(id=late_id).exists():
+                ChatMessage.objects.create(id=late_id, session=self.session, message='late', response='Re: late')
+            return real_archive(session_id, rows)
+
+        with mock.patch('chatbot.transcripts._archive', side_effect=archive_and_commit_late_message):
+            self.assertEqual(compact_idle_sessions(), (2, 3))
+
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True)), [late_id])
+        self.assertEqual(self.page(limit=10), (['first', 'late', 'last'], False))
+        self.assertEqual(self.page(limit=1), (['last'], True))
+        self.assertEqual(self.page(limit=1, before=last), (['late'], True))
+        self.assertEqual(self.page(limit=1, before=late_id), (['first'], False))
+        self.assertEqual(self.page(limit=2, since=first), (['late', 'last'], False))
+
+
+class ChatMetricsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.session = ChatSession.objects.create(user=self.user, title='Hunza plans')
+
+    def call_at(self, created_at, path='llm', **kwargs):
+        return ChatCall.objects.create(
+            created_at=created_at, channel='http', path=path, latency_ms=kwargs.pop('latency_ms', 100), **kwargs,
+        )
+
+    def test_record_call_prices_the_reported_usage(self):
+        stats = {'prompt_tokens': 1000, 'cached_prompt_tokens': 400, 'completion_tokens': 500, 'attempts': 1}
+        record_call('ws', 'llm', latency_ms=812.4, session=self.session, ttft_ms=95.2, stats=stats, response='Hi')
+
+        call = ChatCall.objects.get()
+        self.assertEqual((call.user_id, call.latency_ms, call.ttft_ms, call.attempts), (self.user.id, 812, 95, 1))
+        self.assertFalse(call.tokens_estimated)
+        self.assertEqual(call.cost, Decimal('0.000740'))  # 600 * 0.27 + 400 * 0.07 + 500 * 1.10 per million
+
+    def test_record_call_estimates_tokens_without_usage(self):
+        messages = [{'role': 'system', 'content': 'You plan trips in Pakistan.'}, {'role': 'user', 'content': 'Hunza?'}]
+        record_call('ws', 'llm', latency_ms=300, session=self.session, stats={}, messages=messages,
+                    response='Hunza is lovely', error='cancelled')
+
+        call = ChatCall.objects.get()
+        self.assertTrue(call.tokens_estimated)
+        self.assertEqual(call.prompt_tokens, sum(count_tokens(m['content']) for m in messages))
+        self.assertEqual(call.completion_tokens, count_tokens('Hunza is lovely'))
+        self.assertGreater(call.cost, 0)
+
+        # Quick answers use no tokens, and a failure to save is only logged
+        record_call('http', 'quick', latency_ms=3)
+        self.assertEqual(ChatCall.objects.filter(path='quick', prompt_tokens=0, cost=0).count(), 1)
+        with self.assertLogs('chatbot.metrics', 'ERROR'):
+            record_call('http', 'quick', latency_ms='slow')
+
+    def test_rollup_is_idempotent_and_picks_up_late_calls(self):
+        now = datetime(2026, 10, 19, 12, 0, 30, tzinfo=dt_timezone.utc)
+        self.call_at(now - timedelta(seconds=140), latency_ms=200, prompt_tokens=50, cost=Decimal('0.01'))
+        self.call_at(now - timedelta(seconds=110), path='quick', latency_ms=5)
+        self.call_at(now - timedelta(seconds=70), latency_ms=400, error='timeout')
+        self.call_at(now - timedelta(seconds=25))  # The current minute is not complete yet
+
+        def minutes():
+            return list(ChatMetricsMinute.objects.order_by('minute', 'path').values_list(
+                'minute', 'path', 'calls', 'errors', 'latency_ms_total', 'latency_ms_max', 'prompt_tokens', 'cost',
+            ))
+
+        self.assertEqual(rollup_chat_calls(now), (3, 0))
+        first = minutes()
+        self.assertEqual([row[1:4] for row in first], [('llm', 1, 0), ('quick', 1, 0), ('llm', 1, 1)])
+        self.assertEqual(rollup_chat_calls(now), (3, 0))
+        self.assertEqual(minutes(), first)
+
+        # A call saved just after the last run, and one past retention
+        self.call_at(now - timedelta(seconds=40), latency_ms=600)
+        self.call_at(now - timedelta(days=15))
+        self.assertEqual(rollup_chat_calls(now), (3, 1))
+        self.assertEqual(minutes()[-1][1:6], ('llm', 2, 1, 1000, 600))
+        self.assertEqual(ChatMetricsMinute.objects.count(), 3)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        record_call('http', 'quick', latency_ms=4, session=self.session)
+        self.client.force_login(self.user)
+        response = self.client.get('/chatbot/metrics/')
+        self.assertEqual((response.status_code, response.json()), (403, {'error': 'Unauthorized'}))
+
+        self.client.force_login(make_user('staff@example.com', is_staff=True))
+        response = self.client.get('/chatbot/metrics/', {'minutes': 'x'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['calls'], body['paths']['quick']['calls']), (1, 1))
+        self.assertEqual(body['top_sessions'][0]['session_id'], self.session.id)
+        self.assertEqual(set(body['throttle']), {'rejected_user', 'rejected_ip', 'coalesced'})
+        self.assertIn('answer_cache', body)
@@ -0,0 +1,215 @@
+"""
+Rate limiting and duplicate-request coalescing for chat messages.
+
+Rate limits are token buckets per user and per IP address, kept in the
+shared cache as one timestamp each (GCRA: the time at which the bucket will
+be full again). A bucket holds `capacity` messages and refills at
+`per_minute`. Updates take a short cache.add lock, so parallel requests from
+one script cannot all read the same state and slip through together.
+
+Coalescing (single-flight): the first request for a question in a session
+becomes the leader and does the work; identical requests that arrive while
+it runs wait for its result instead of making their own upstream call. The
+leader is elected with cache.add, so this also works across processes. Only a
+request that does the work is charged to the rate limit, so a double submit
+costs one message.
+
+Rejections and coalesced requests are counted; see get_throttle_stats().
+"""
+import hashlib
+import math
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+Bucket = namedtuple('Bucket', 'name capacity per_minute')
+
+USER_BUCKET = Bucket(
+    'user', getattr(settings, 'CHAT_USER_BURST', 5), getattr(settings, 'CHAT_USER_RATE_PER_MINUTE', 10),
+)
+IP_BUCKET = Bucket(
+    'ip', getattr(settings, 'CHAT_IP_BURST', 20), getattr(settings, 'CHAT_IP_RATE_PER_MINUTE', 30),
+)
+LOCK_TIMEOUT = 2
+LOCK_ATTEMPTS = 5
+LOCK_WAIT = 0.01
+
+FLIGHT_TIMEOUT = 60  # Longer than the slowest upstream answer
+FLIGHT_RESULT_TTL = 30
+FLIGHT_POLL_INTERVAL = 0.1
+
+STATS_KEYS = {
+    'rejected_user': 'chatbot:throttle:rejected_user',
+    'rejected_ip': 'chatbot:throttle:rejected_ip',
+    'coalesced': 'chatbot:throttle:coalesced',
+}
+
+
+def _incr(stat):
+    key = STATS_KEYS[stat]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def take_token(bucket, identity):
+    """
+    Take one message from a bucket.
+
+    Returns:
+        0 when allowed, else the seconds until the next message is allowed
+    """
+    interval = 60 / bucket.per_minute
+    key = f'chatbot:throttle:{bucket.name}:{identity}'
+    lock_key = f'{key}:lock'
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            break
+        time.sleep(LOCK_WAIT)
+    else:
+        # Another request for the same identity holds the bucket: a burst
+        return interval
+    try:
+        now = time.time()
+        full_at = max(cache.get(key, now), now)
+        allowed_at = full_at - interval * (bucket.capacity - 1)
+        if allowed_at > now:
+            return allowed_at - now
+        full_at += interval
+        cache.set(key, full_at, timeout=math.ceil(full_at - now) + 1)
+        return 0
+    finally:
+        cache.delete(lock_key)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limited, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+def check_rate_limit(user_id, ip=None):
+    """
+    Charge one chat message to the user's and the IP's buckets.
+
+    Returns:
+        None when allowed, else the whole seconds to wait (for Retry-After)
+    """
+    wait = take_token(USER_BUCKET, user_id)
+    if wait:
+        _incr('rejected_user')
+        return math.ceil(wait)
+    if ip:
+        wait = take_token(IP_BUCKET, ip)
+        if wait:
+            _incr('rejected_ip')
+            return math.ceil(wait)
+    return None
+
+
+def charge_rate_limit(user_id, ip=None):
+    """Charge one chat message like check_rate_limit(), raising RateLimited when over the limit"""
+    retry_after = check_rate_limit(user_id, ip)
+    if retry_after:
+        raise RateLimited(retry_after)
+
+
+def flight_key(user_id, session_id, message):
+    digest = hashlib.sha1(' '.join(message.casefold().split()).encode('utf-8')).hexdigest()
+    return f'chatbot:flight:{user_id}:{session_id or "new"}:{digest}'
+
+
+def begin_flight(key):
+    """
+    Join or start the flight for a key.
+
+    Returns:
+        (flight token, True for the leader that must do the work)
+    """
+    for _ in range(2):
+        token = uuid.uuid4().hex
+        if cache.add(key, token, timeout=FLIGHT_TIMEOUT):
+            return token, True
+        current = cache.get(key)
+        if current is not None:
+            return current, False
+    # The flight kept ending between add() and get(); run without one
+    return None, True
+
+
+def finish_flight(key, token, result=None):
+    """Publish the leader's result (None when it failed) and end the flight"""
+    if token is None:
+        return
+    if result is not None:
+        cache.set(f'{key}:{token}', result, timeout=FLIGHT_RESULT_TTL)
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def poll_flight(key, token):
+    """
+    Returns:
+        (finished, result): result is None while running and when the leader failed
+    """
+    result = cache.get(f'{key}:{token}')
+    if result is not None:
+        _incr('coalesced')
+        return True, result
+    return cache.get(key) != token, None
+
+
+def wait_for_flight(key, token):
+    """Block until the leader finishes; None when it failed or took too long"""
+    deadline = time.monotonic() + FLIGHT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(FLIGHT_POLL_INTERVAL)
+        finished, result = poll_flight(key, token)
+        if finished:
+            return result
+    return None
+
+
+def single_flight(key, compute, admit=None):
+    """
+    Run compute() once for concurrent identical requests.
+
+    Args:
+        admit: Called before compute() by each request that does the work
+            (not by those that coalesce), e.g. to charge the rate limit;
+            it may raise to reject the request
+
+    Returns:
+        compute()'s result, shared with the requests that coalesced into it
+    """
+    token, leader = begin_flight(key)
+    if not leader:
+        result = wait_for_flight(key, token)
+        if result is not None:
+            return result
+        # The leader failed; its error is not shared
+        if admit:
+            admit()
+        return compute()
+    result = None
+    try:
+        if admit:
+            admit()
+        result = compute()
+        return result
+    finally:
+        finish_flight(key, token, result)
+
+
+def get_throttle_stats():
+    values = cache.get_many(STATS_KEYS.values())
+    return {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+
+
+def reset_throttle_stats():
+    cache.delete_many(STATS_KEYS.values())
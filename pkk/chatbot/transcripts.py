@@ -0,0 +1,142 @@
+"""
+Chat transcript storage: live ChatMessage rows plus compressed archives.
+
+compact_idle_sessions() folds the messages of every session idle for more
+than IDLE_DAYS into one ChatTranscriptArchive row (zlib-compressed JSON) and
+deletes the originals, a batch of sessions per transaction. The batch's
+sessions are locked while it runs and only the archived message ids are
+deleted, so a message saved meanwhile stays live instead of being lost. A
+session can be picked up again later; its new messages stay live until it
+goes idle once more.
+
+session_messages() reads both and merges them by id, so the history API and
+the prompt context do not care where a message is stored. Archives are only
+decompressed when they can hold messages for the page.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ChatMessage, ChatSession, ChatTranscriptArchive
+
+IDLE_DAYS = 30
+COMPACT_BATCH_SIZE = 100  # Sessions per transaction
+DELETE_CHUNK_SIZE = 500  # Message ids per DELETE, under the database's parameter limits
+
+
+def load_archive(archive):
+    """
+    Returns:
+        The archive's messages as (id, message, response, created_at) tuples, oldest first
+    """
+    return [
+        (message_id, message, response, datetime.fromisoformat(created_at))
+        for message_id, message, response, created_at in json.loads(zlib.decompress(bytes(archive.data)))
+    ]
+
+
+def _message_id(row):
+    return row[0]
+
+
+def _archive(session_id, rows):
+    payload = json.dumps(
+        [[message_id, message, response, created_at.isoformat()] for message_id, message, response, created_at in rows],
+        ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf-8')
+    return ChatTranscriptArchive(
+        session_id=session_id,
+        first_id=rows[0][0],
+        last_id=rows[-1][0],
+        count=len(rows),
+        oldest_created_at=rows[0][3],
+        newest_created_at=rows[-1][3],
+        data=zlib.compress(payload, 9),
+    )
+
+
+def compact_idle_sessions(days=IDLE_DAYS, batch_size=COMPACT_BATCH_SIZE):
+    """
+    Move the messages of sessions idle for more than `days` into archives.
+
+    Returns:
+        (sessions compacted, messages archived)
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    idle_sessions = ChatSession.objects.filter(last_message_at__lt=cutoff).filter(
+        Exists(ChatMessage.objects.filter(session=OuterRef('pk')))
+    )
+    compacted = archived = 0
+    while True:
+        with transaction.atomic():
+            session_ids = list(
+                idle_sessions.select_for_update().order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not session_ids:
+                break
+            grouped = {}
+            rows = ChatMessage.objects.filter(session_id__in=session_ids).order_by('session_id', 'id').values_list(
+                'session_id', 'id', 'message', 'response', 'created_at'
+            )
+            for session_id, *row in rows:
+                grouped.setdefault(session_id, []).append(row)
+            ChatTranscriptArchive.objects.bulk_create([_archive(sid, session_rows) for sid, session_rows in grouped.items()])
+            archived_ids = [row[0] for session_rows in grouped.values() for row in session_rows]
+            for start in range(0, len(archived_ids), DELETE_CHUNK_SIZE):
+                ChatMessage.objects.filter(id__in=archived_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+        compacted += len(grouped)
+        archived += sum(len(session_rows) for session_rows in grouped.values())
+    return compacted, archived
+
+
+def session_messages(session_id, limit, since=None, before=None):
+    """
+    One page of a session's messages from the live table and its archives.
+
+    Args:
+        limit: page size
+        since: only messages with a larger id, paging forward
+        before: only messages with a smaller id, paging back (the latest page when neither is given)
+
+    Returns:
+        ((id, message, response, created_at) tuples oldest first,
+         whether more messages exist in the paging direction)
+    """
+    live = ChatMessage.objects.filter(session_id=session_id).values_list('id', 'message', 'response', 'created_at')
+    archives = ChatTranscriptArchive.objects.filter(session_id=session_id)
+
+    # Usually every archived message is older than the live ones, but one saved
+    # while its session was being compacted can be live with an older id
+    if since is not None:
+        rows = list(live.filter(id__gt=since).order_by('id')[:limit + 1])
+        archives = archives.filter(last_id__gt=since)
+        if len(rows) > limit:
+            archives = archives.filter(first_id__lt=rows[-1][0])
+        archived = []
+        for archive in archives.order_by('first_id'):
+            if len(archived) > limit and archive.first_id > archived[limit][0]:
+                break
+            archived = sorted(archived + [row for row in load_archive(archive) if row[0] > since], key=_message_id)
+        rows = sorted(rows + archived, key=_message_id)
+        return rows[:limit], len(rows) > limit
+
+    if before is not None:
+        live = live.filter(id__lt=before)
+        archives = archives.filter(first_id__lt=before)
+    rows = list(live.order_by('-id')[:limit + 1])
+    if len(rows) > limit:
+        archives = archives.filter(last_id__gt=rows[-1][0])
+    archived = []
+    for archive in archives.order_by('-last_id'):
+        if len(archived) > limit and archive.last_id < archived[limit][0]:
+            break
+        archived = sorted(
+            archived + [row for row in load_archive(archive) if before is None or row[0] < before],
+            key=_message_id, reverse=True,
+        )
+    rows = sorted(rows + archived, key=_message_id, reverse=True)
+    return rows[:limit][::-1], len(rows) > limit
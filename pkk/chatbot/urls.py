@@ -4,5 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.chatbot_view, name='chatbot'),
     path('send/', views.send_message, name='send_message'),
+    path('sessions/', views.get_chat_sessions, name='chat_sessions'),
     path('history/<int:session_id>/', views.get_chat_history, name='chat_history'),
+    path('metrics/', views.chat_metrics, name='chat_metrics'),
 ]
\ No newline at end of file
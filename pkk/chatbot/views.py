@@ -1,82 +1,130 @@
 import json
-import requests
+import time
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.db.models import Q
 from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
 from .models import ChatSession, ChatMessage
-from .config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL
-from .prompt_builder import (
-    build_context_aware_messages,
-    detect_irrelevant_keywords,
-    get_quick_response_for_common_questions
-)
+from .answer_cache import get_answer_cache_stats, get_cached_answer, store_answer
+from .llm import LLMError, LLMOverloaded, LLMTimeout, complete_chat_sync
+from .metrics import get_chat_metrics, record_call
+from .intents import classify, render_response
+from .prompt_builder import build_context_aware_messages
+from .throttling import RateLimited, charge_rate_limit, flight_key, get_throttle_stats, single_flight
+from .transcripts import session_messages
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_deepseek_response(message, session=None):
+BOUNDARY_RESPONSE = "I'm specifically designed to help with TouriPK website and Pakistan tourism. I can assist you with:\n\n🏔️ Exploring our {destinations_total} destinations\n💰 Estimating trip costs\n📦 Finding tour packages\n🌤️ Checking weather forecasts\n🛍️ Shopping local products\n\nWhat would you like to know about planning your trip to Pakistan?"
+BUSY_RESPONSE = "Lots of travellers are planning trips with me right now, so I couldn't answer in time. Please try again in a moment. Meanwhile you can:\n• Browse destinations at /content/destinations/\n• Check packages at /packages/\n• Use cost calculator at /content/calculator/"
+RATE_LIMITED_RESPONSE = "You're sending messages faster than I can answer them. Please wait a moment and try again."
+ERROR_RESPONSE = "Sorry, I'm having trouble connecting right now. Please try again later. In the meantime, you can:\n• Browse destinations at /content/destinations/\n• Check packages at /packages/\n• Use cost calculator at /content/calculator/"
+
+HISTORY_PAGE_SIZE = 30
+SESSIONS_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def get_canned_response(message):
+    """
+    Answer common and off-topic questions without calling the API.
+
+    Returns:
+        Response text, or None when the model should answer
+    """
+    # One pass over the QuickAnswer rules (no API call needed)
+    intent = classify(message)
+    if intent is None:
+        return None
+    if intent.kind == 'answer':
+        logger.info(f"Returning quick response for common question: {intent.name}")
+        return intent.response
+
+    logger.info(f"Detected irrelevant question, returning boundary response")
+    return intent.response or render_response(BOUNDARY_RESPONSE)
+
+
+def load_chat_history(session=None):
+    """The session's last five exchanges, oldest first (archived ones included)"""
+    if not session:
+        return []
+    recent_messages, _ = session_messages(session.id, 5)
+    return [
+        {'message': message, 'response': response}
+        for _, message, response, _ in recent_messages
+    ]
+
+
+def prepare_answer(message, session=None):
+    """
+    Look the question up in the answer cache, else build the prompt.
+
+    Returns:
+        (cached answer or None, prompt messages or None, answer cache key or None)
+    """
+    chat_history = load_chat_history(session)
+    cached_answer, cache_key = get_cached_answer(message, has_history=bool(chat_history))
+    if cached_answer:
+        logger.info(f"Returning cached answer")
+        return cached_answer, None, cache_key
+
+    # Build context-aware messages with comprehensive training
+    return None, build_context_aware_messages(message, chat_history), cache_key
+
+
+def get_deepseek_response(message, session=None, call=None):
     """
     Get AI response with website-specific training and irrelevant question filtering.
 
     Args:
         message: User's message
         session: ChatSession object for conversation context
+        call: optional dict to fill with the path taken, the prompt and
+            answer, the upstream stats and any error, for
+            chatbot.metrics.record_call()
 
     Returns:
         AI-generated response or quick response
     """
+    call = {} if call is None else call
+    canned_response = get_canned_response(message)
+    if canned_response:
+        call['path'] = 'quick'
+        return canned_response
 
-    # Check for quick responses to common questions (no API call needed)
-    quick_response = get_quick_response_for_common_questions(message)
-    if quick_response:
-        logger.info(f"Returning quick response for common question")
-        return quick_response
-
-    # Pre-filter obviously irrelevant questions
-    if detect_irrelevant_keywords(message):
-        logger.info(f"Detected irrelevant question, returning boundary response")
-        return "I'm specifically designed to help with TouriPK website and Pakistan tourism. I can assist you with:\n\n🏔️ Exploring our 12 featured destinations\n💰 Estimating trip costs\n📦 Finding tour packages\n🌤️ Checking weather forecasts\n🛍️ Shopping local products\n\nWhat would you like to know about planning your trip to Pakistan?"
+    cached_answer, messages, cache_key = prepare_answer(message, session)
+    if cached_answer:
+        call['path'] = 'cache'
+        return cached_answer
 
-    # Get conversation history if session provided
-    chat_history = []
-    if session:
-        recent_messages = session.messages.order_by('-created_at')[:5]
-        chat_history = [
-            {'message': msg.message, 'response': msg.response}
-            for msg in reversed(list(recent_messages))
-        ]
-
-    # Build context-aware messages with comprehensive training
-    messages = build_context_aware_messages(message, chat_history)
-
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": "deepseek-chat",
-        "messages": messages,
-        "max_tokens": 600,
-        "temperature": 0.7,
-        "top_p": 0.95
-    }
-    
+    call.update(path='llm', messages=messages, stats={})
     try:
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data, timeout=30)
-        if response.status_code == 200:
-            ai_response = response.json()["choices"][0]["message"]["content"]
-            logger.info(f"AI response generated successfully")
-            return ai_response
-        else:
-            logger.error(f"API Error: {response.status_code}, {response.text}")
-            return "Sorry, I'm having trouble connecting right now. Please try again later. In the meantime, you can:\n• Browse destinations at /content/destinations/\n• Check packages at /packages/\n• Use cost calculator at /content/calculator/"
-    except requests.Timeout:
+        started = time.monotonic()
+        ai_response = complete_chat_sync(messages, user_id=session.user_id if session else None, stats=call['stats'])
+        stats = call['stats']
+        call['response'] = ai_response
+        logger.info(
+            f"AI response generated in {stats.get('upstream_ms')} ms "
+            f"({stats.get('prompt_tokens')} prompt / {stats.get('completion_tokens')} completion tokens)"
+        )
+        store_answer(cache_key, ai_response, time.monotonic() - started)
+        return ai_response
+    except LLMOverloaded as e:
+        logger.warning(f"LLM gateway shed a request: {str(e)}")
+        call['error'] = 'overloaded'
+        return BUSY_RESPONSE
+    except LLMTimeout:
         logger.error("API request timed out")
+        call['error'] = 'timeout'
         return "Sorry, the request took too long. Please try again, or browse our website:\n• Destinations: /content/destinations/\n• Packages: /packages/\n• Calculator: /content/calculator/"
+    except LLMError as e:
+        logger.error(f"API Error: {str(e)}")
+        call['error'] = f'api: {str(e)}'
+        return ERROR_RESPONSE
     except Exception as e:
         logger.error(f"Error in API call: {str(e)}")
+        call['error'] = f'{type(e).__name__}: {str(e)}'
         return "Sorry, I'm experiencing technical difficulties. You can still explore:\n• Destinations: /content/destinations/\n• Packages: /packages/\n• Calculator: /content/calculator/"
 
 
@@ -91,8 +139,53 @@ def chatbot_view(request):
     return redirect('home')
 
 
+def answer_message(user, session_id, message):
+    """
+    Answer a message in the user's session (a new one when session_id is
+    empty) and save the exchange.
+
+    Returns:
+        Dict with response, session_id and message_id
+    """
+    if session_id:
+        session = get_object_or_404(ChatSession, id=session_id, user=user)
+        logger.debug(f"Using existing session: {session.id}")
+    else:
+        session = ChatSession.objects.create(
+            user=user,
+            title=message[:50] + "..." if len(message) > 50 else message
+        )
+        logger.debug(f"Created new session: {session.id}")
+
+    # Pass session for context-aware responses
+    started = time.monotonic()
+    call = {}
+    ai_response = get_deepseek_response(message, session=session, call=call)
+    latency_ms = (time.monotonic() - started) * 1000
+    logger.debug(f"AI response generated")
+
+    chat_message = ChatMessage.objects.create(
+        session=session,
+        message=message,
+        response=ai_response
+    )
+    logger.debug(f"Saved message with ID: {chat_message.id}")
+    record_call('http', latency_ms=latency_ms, session=session, **call)
+
+    return {
+        'response': ai_response,
+        'session_id': session.id,
+        'message_id': chat_message.id
+    }
+
+
+def rate_limited_response(retry_after):
+    response = JsonResponse({'error': RATE_LIMITED_RESPONSE, 'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
 @login_required
-@csrf_exempt
 def send_message(request):
     logger.debug(f"send_message called with method: {request.method}")
     if request.method == 'POST':
@@ -105,35 +198,18 @@ def send_message(request):
             if not message:
                 logger.warning("Empty message received")
                 return JsonResponse({'error': 'Message cannot be empty'}, status=400)
-            
-            if session_id:
-                session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-                logger.debug(f"Using existing session: {session.id}")
-            else:
-                session = ChatSession.objects.create(
-                    user=request.user,
-                    title=message[:50] + "..." if len(message) > 50 else message
-                )
-                logger.debug(f"Created new session: {session.id}")
-            
-            # Pass session for context-aware responses
-            ai_response = get_deepseek_response(message, session=session)
-            logger.debug(f"AI response generated")
-
-            chat_message = ChatMessage.objects.create(
-                session=session,
-                message=message,
-                response=ai_response
+
+            # A double submit waits for the first request's answer instead of
+            # asking again, and only the first one is charged to the rate limit
+            response_data = single_flight(
+                flight_key(request.user.id, session_id, message),
+                lambda: answer_message(request.user, session_id, message),
+                admit=lambda: charge_rate_limit(request.user.id, request.META.get('REMOTE_ADDR')),
             )
-            logger.debug(f"Saved message with ID: {chat_message.id}")
-            
-            response_data = {
-                'response': ai_response,
-                'session_id': session.id,
-                'message_id': chat_message.id
-            }
-            
             return JsonResponse(response_data)
+        except RateLimited as e:
+            logger.warning(f"Chat rate limit hit by user {request.user.id}")
+            return rate_limited_response(e.retry_after)
         except json.JSONDecodeError:
             logger.error("Invalid JSON in request body")
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
@@ -143,28 +219,92 @@ def send_message(request):
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+
+def _cursor(request, name):
+    try:
+        return max(0, int(request.GET[name]))
+    except (KeyError, ValueError):
+        return None
+
+
+def _page_size(request, default):
+    try:
+        return min(max(1, int(request.GET.get('limit', default))), MAX_PAGE_SIZE)
+    except ValueError:
+        return default
+
+
+@login_required
+def get_chat_sessions(request):
+    """
+    The user's chat sessions, most recently active first.
+
+    ?before=<session id> returns the page after the last session the client has.
+    """
+    sessions = ChatSession.objects.filter(user=request.user)
+    before = _cursor(request, 'before')
+    if before is not None:
+        cursor = sessions.filter(id=before).values_list('last_message_at', flat=True).first()
+        if cursor is not None:
+            sessions = sessions.filter(Q(last_message_at__lt=cursor) | Q(last_message_at=cursor, id__lt=before))
+    limit = _page_size(request, SESSIONS_PAGE_SIZE)
+    rows = list(
+        sessions.order_by('-last_message_at', '-id').values_list('id', 'title', 'last_message_at')[:limit + 1]
+    )
+    return JsonResponse({
+        'sessions': [
+            {'id': session_id, 'title': title, 'last_message_at': last_message_at.isoformat()}
+            for session_id, title, last_message_at in rows[:limit]
+        ],
+        'has_more': len(rows) > limit,
+    })
+
+
 @login_required
 def get_chat_history(request, session_id):
-    print(f"DEBUG: get_chat_history called for session_id: {session_id}")
+    """
+    One page of a session's messages, oldest first, whether still live or
+    compacted into an archive.
+
+    Without a cursor this is the latest page. ?before=<message id> pages back
+    through older messages, and ?since=<message id> returns only the messages
+    after the last one the client has. has_more tells whether another page
+    exists in the direction being paged.
+    """
+    session = get_object_or_404(ChatSession.objects.only('id', 'title'), id=session_id, user=request.user)
+    rows, has_more = session_messages(
+        session.id, _page_size(request, HISTORY_PAGE_SIZE),
+        since=_cursor(request, 'since'), before=_cursor(request, 'before'),
+    )
+
+    return JsonResponse({
+        'title': session.title,
+        'messages': [
+            {'id': message_id, 'message': message, 'response': response, 'created_at': created_at.strftime('%H:%M')}
+            for message_id, message, response, created_at in rows
+        ],
+        'has_more': has_more,
+    })
+
+
+@login_required
+def chat_metrics(request):
+    """
+    Chatbot latency, token and cost metrics for staff.
+
+    Query parameters:
+        minutes: window size (default 60, at most a day)
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
     try:
-        session = get_object_or_404(ChatSession, id=session_id, user=request.user)
-        messages = session.messages.all().order_by('created_at')
-        print(f"DEBUG: Found {messages.count()} messages for session {session_id}")
-        
-        data = []
-        for msg in messages:
-            msg_data = {
-                'message': msg.message,
-                'response': msg.response,
-                'created_at': msg.created_at.strftime('%H:%M')
-            }
-            data.append(msg_data)
-            print(f"DEBUG: Message - User: '{msg.message}', Bot: '{msg.response}'")
-        
-        response_data = {'messages': data, 'title': session.title}
-        print(f"DEBUG: Returning chat history: {len(data)} messages")
-        return JsonResponse(response_data)
-    except Exception as e:
-        print(f"DEBUG: Error in get_chat_history: {str(e)}")
-        return JsonResponse({'error': f'Error loading history: {str(e)}'}, status=500)
-    
\ No newline at end of file
+        minutes = int(request.GET.get('minutes', 60))
+    except ValueError:
+        minutes = 60
+
+    return JsonResponse({
+        **get_chat_metrics(minutes),
+        'answer_cache': get_answer_cache_stats(),
+        'throttle': get_throttle_stats(),
+    })
@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Destination, Product, CustomPackageOrder, AdminNotification
+from django.db import transaction
+
+from chatbot.retrieval import record_catalog_change
+from .models import (
+    Destination, Product, CustomPackageOrder, AdminNotification,
+    PackageRateTable, VehicleRate, AccommodationRate,
+)
+from .catalog import refresh_facet_counts
+from .home_feed import invalidate_home_feed
 
 @admin.register(Destination)
 class DestinationAdmin(admin.ModelAdmin):
@@ -16,8 +24,31 @@ class ProductAdmin(admin.ModelAdmin):
     actions = ['approve_products']
     
     def approve_products(self, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
         queryset.update(is_approved=True)
-        self.message_user(request, f'{queryset.count()} products approved.')
+        # update() bypasses post_save, so refresh derived data explicitly
+        refresh_facet_counts()
+        invalidate_home_feed()
+        transaction.on_commit(lambda: record_catalog_change(*[f'product:{pk}' for pk in ids]))
+        self.message_user(request, f'{len(ids)} products approved.')
     approve_products.short_description = 'Approve selected products'
 
-# CustomPackageOrder and AdminNotification removed from admin portal
\ No newline at end of file
+# CustomPackageOrder and AdminNotification removed from admin portal
+
+
+class VehicleRateInline(admin.TabularInline):
+    model = VehicleRate
+    extra = 0
+
+
+class AccommodationRateInline(admin.TabularInline):
+    model = AccommodationRate
+    extra = 0
+
+
+@admin.register(PackageRateTable)
+class PackageRateTableAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'guide_per_day', 'bonfire', 'is_active', 'updated_at')
+    list_filter = ('is_active',)
+    prepopulated_fields = {'slug': ('name',)}
+    inlines = [VehicleRateInline, AccommodationRateInline]
@@ -0,0 +1,195 @@
+"""
+Product catalog query engine.
+
+Turns the product list query string into a filtered, sorted and paginated
+queryset, and serves facet counts (per category, per company, in stock)
+from the cache. Facets are rebuilt by content.signals whenever a product
+or company changes, so listing requests never run GROUP BY queries.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, Max, Min, Q
+from django.utils.http import urlencode
+
+from .models import Product
+
+# Page size is capped so memory and render time stay bounded
+CATALOG_PAGE_SIZE = 12
+CATALOG_MAX_PAGE_SIZE = 48
+
+FACETS_CACHE_KEY = 'catalog_facets'
+
+SORT_OPTIONS = {
+    'featured': ('-is_featured', 'name', 'id'),
+    'newest': ('-created_at', 'id'),
+    'price_asc': ('price', 'name', 'id'),
+    'price_desc': ('-price', 'name', 'id'),
+    'rating': ('-rating', '-reviews_count', 'name', 'id'),
+}
+
+SORT_CHOICES = [
+    ('featured', 'Featured'),
+    ('newest', 'Newest'),
+    ('price_asc', 'Price: Low to High'),
+    ('price_desc', 'Price: High to Low'),
+    ('rating', 'Top Rated'),
+]
+
+
+def catalog_queryset():
+    """Products visible in the public catalog"""
+    return Product.objects.filter(is_active=True, is_approved=True)
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(str(value).replace(',', '').strip())
+    except (InvalidOperation, ValueError):
+        return None
+    return price if price >= 0 else None
+
+
+def _parse_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_catalog_params(params):
+    """
+    Normalize catalog query parameters.
+
+    Unknown or malformed values are dropped instead of raising, so a bad
+    link degrades to the unfiltered catalog.
+
+    Args:
+        params: QueryDict or dict (usually request.GET)
+
+    Returns:
+        dict of cleaned filters
+    """
+    valid_categories = {value for value, _ in Product.CATEGORY_CHOICES}
+    category = params.get('category', '').strip()
+    sort = params.get('sort', '').strip()
+    per_page = _parse_int(params.get('per_page'), CATALOG_PAGE_SIZE)
+
+    min_price = _parse_price(params.get('min_price', ''))
+    max_price = _parse_price(params.get('max_price', ''))
+    if min_price is not None and max_price is not None and min_price > max_price:
+        min_price, max_price = max_price, min_price
+
+    return {
+        'category': category if category in valid_categories else '',
+        'company': params.get('company', '').strip(),
+        'search': params.get('search', '').strip()[:100],
+        'min_price': min_price,
+        'max_price': max_price,
+        'in_stock': params.get('in_stock', '') in ('1', 'true', 'on', 'yes'),
+        'sort': sort if sort in SORT_OPTIONS else 'featured',
+        'page': params.get('page', 1),
+        'per_page': max(1, min(per_page, CATALOG_MAX_PAGE_SIZE)),
+    }
+
+
+def filter_products(filters):
+    """Apply cleaned filters and ordering to the catalog queryset"""
+    products = catalog_queryset()
+
+    if filters['category']:
+        products = products.filter(category=filters['category'])
+    if filters['company']:
+        products = products.filter(company__slug=filters['company'])
+    if filters['min_price'] is not None:
+        products = products.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        products = products.filter(price__lte=filters['max_price'])
+    if filters['in_stock']:
+        products = products.filter(stock_quantity__gt=0)
+    if filters['search']:
+        products = products.filter(
+            Q(name__icontains=filters['search']) |
+            Q(description__icontains=filters['search'])
+        )
+
+    return products.select_related('company').order_by(*SORT_OPTIONS[filters['sort']])
+
+
+def get_catalog_page(params):
+    """
+    Run a catalog query.
+
+    Returns:
+        dict with page_obj, the cleaned filters, the facet counts and a
+        querystring (without page) for building pagination links
+    """
+    filters = parse_catalog_params(params)
+    paginator = Paginator(filter_products(filters), filters['per_page'])
+    page_obj = paginator.get_page(filters['page'])
+
+    query = {}
+    for key in ('category', 'company', 'search', 'min_price', 'max_price', 'sort'):
+        if filters[key] not in ('', None) and not (key == 'sort' and filters[key] == 'featured'):
+            query[key] = filters[key]
+    if filters['in_stock']:
+        query['in_stock'] = '1'
+    if filters['per_page'] != CATALOG_PAGE_SIZE:
+        query['per_page'] = filters['per_page']
+
+    return {
+        'page_obj': page_obj,
+        'filters': filters,
+        'facets': get_facet_counts(),
+        'querystring': urlencode(query),
+    }
+
+
+def compute_facet_counts():
+    """Aggregate facet counts over the whole public catalog"""
+    products = catalog_queryset()
+    category_counts = dict(
+        products.values_list('category').annotate(total=Count('id')).order_by()
+    )
+    companies = (
+        products.filter(company__isnull=False)
+        .values('company__slug', 'company__name')
+        .annotate(total=Count('id'))
+        .order_by('company__name')
+    )
+    totals = products.aggregate(
+        total=Count('id'),
+        in_stock=Count('id', filter=Q(stock_quantity__gt=0)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    )
+
+    return {
+        'categories': [
+            {'value': value, 'label': label, 'count': category_counts.get(value, 0)}
+            for value, label in Product.CATEGORY_CHOICES
+        ],
+        'companies': [
+            {'slug': c['company__slug'], 'name': c['company__name'], 'count': c['total']}
+            for c in companies
+        ],
+        'total': totals['total'],
+        'in_stock': totals['in_stock'],
+        'min_price': float(totals['min_price'] or 0),
+        'max_price': float(totals['max_price'] or 0),
+    }
+
+
+def refresh_facet_counts():
+    """Recompute facets and store them until the next catalog change"""
+    facets = compute_facet_counts()
+    cache.set(FACETS_CACHE_KEY, facets, timeout=None)
+    return facets
+
+
+def get_facet_counts():
+    facets = cache.get(FACETS_CACHE_KEY)
+    if facets is None:
+        facets = refresh_facet_counts()
+    return facets
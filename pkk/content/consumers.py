@@ -0,0 +1,66 @@
+"""WebSocket consumers for the content app"""
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from urllib.parse import parse_qs
+
+from .notifications import NOTIFICATIONS_GROUP, get_unread_count, get_unread_notifications
+
+
+class AdminNotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Live admin notifications for staff users.
+
+    Connect to ws/admin/notifications/?since_id=<last id seen>. The server
+    first sends every unread notification after since_id, then pushes new
+    ones as they are created, coalesced into digests and read.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated or not user.is_staff:
+            await self.close(code=4403)
+            return
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            since_id = max(0, int(query.get('since_id', ['0'])[0]))
+        except ValueError:
+            since_id = 0
+
+        # Join before reading the backlog so nothing created in between is missed
+        await self.channel_layer.group_add(NOTIFICATIONS_GROUP, self.channel_name)
+        await self.accept()
+
+        notifications = await database_sync_to_async(get_unread_notifications)(since_id)
+        unread_count = await database_sync_to_async(get_unread_count)()
+        await self.send_json({
+            'type': 'backlog',
+            'notifications': notifications,
+            'unread_count': unread_count,
+        })
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(NOTIFICATIONS_GROUP, self.channel_name)
+
+    async def notification_created(self, event):
+        await self.send_json({
+            'type': 'notification',
+            'notification': event['notification'],
+            'unread_count': event['unread_count'],
+        })
+
+    async def notification_updated(self, event):
+        # A digest row absorbed another event
+        await self.send_json({
+            'type': 'notification_updated',
+            'notification': event['notification'],
+            'unread_count': event['unread_count'],
+        })
+
+    async def notification_read(self, event):
+        await self.send_json({
+            'type': 'read',
+            'ids': event['ids'],
+            'up_to_id': event['up_to_id'],
+            'unread_count': event['unread_count'],
+        })
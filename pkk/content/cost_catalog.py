@@ -0,0 +1,91 @@
+"""
+Versioned cost component catalog.
+
+Every Destination carries a costs_version counter and a costs_updated_at
+timestamp that content.signals bumps whenever one of its CostComponents is
+saved or deleted. The JSON for each destination's components is serialized
+once per version and kept in the cache, so a catalog response is one small
+stamp query plus a cache get_many. ETag and Last-Modified come from the
+stamps, which lets clients revalidate with a 304 without any payload
+being built.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CostComponent, Destination
+
+COST_CATALOG_MAX_DESTINATIONS = 100
+FRAGMENT_TIMEOUT = 60 * 60 * 24  # Fragments are versioned, expiry only reclaims space
+
+
+def bump_cost_version(destination_id):
+    """Mark a destination's cost components as changed"""
+    # update() skips Destination.post_save, so the home feed is left alone
+    Destination.objects.filter(pk=destination_id).update(
+        costs_version=F('costs_version') + 1, costs_updated_at=timezone.now()
+    )
+
+
+def _fragment_key(destination_id, version):
+    return f'cost_catalog:{destination_id}:{version}'
+
+
+def serialize_components(components):
+    return json.dumps([{
+        'id': comp.id,
+        'name': comp.name,
+        'category': comp.category,
+        'base_cost': float(comp.base_cost),
+        'unit': comp.unit,
+        'description': comp.description,
+    } for comp in components], separators=(',', ':'))
+
+
+def get_cost_stamps(destination_ids=None):
+    """
+    Version stamps for the requested active destinations.
+
+    Returns:
+        (list of (id, version, updated_at), etag, last_modified)
+    """
+    queryset = Destination.objects.filter(is_active=True)
+    if destination_ids is not None:
+        queryset = queryset.filter(id__in=destination_ids)
+    stamps = list(queryset.order_by('id').values_list('id', 'costs_version', 'costs_updated_at'))
+    token = ','.join(f'{pk}:{version}' for pk, version, _ in stamps)
+    etag = hashlib.md5(token.encode('utf-8')).hexdigest()
+    last_modified = max((updated for _, _, updated in stamps), default=None)
+    return stamps, etag, last_modified
+
+
+def get_cost_fragments(stamps):
+    """
+    Serialized component lists keyed by destination id, built only for
+    destinations whose current version is not cached yet.
+    """
+    keys = {pk: _fragment_key(pk, version) for pk, version, _ in stamps}
+    cached = cache.get_many(keys.values())
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        grouped = {pk: [] for pk in missing}
+        for comp in CostComponent.objects.filter(destination_id__in=missing).order_by('id'):
+            grouped[comp.destination_id].append(comp)
+        built = {pk: serialize_components(components) for pk, components in grouped.items()}
+        cache.set_many({keys[pk]: fragment for pk, fragment in built.items()}, timeout=FRAGMENT_TIMEOUT)
+        fragments.update(built)
+    return fragments
+
+
+def build_catalog_payload(stamps):
+    """Concatenate the cached fragments into one JSON document"""
+    fragments = get_cost_fragments(stamps)
+    body = ','.join(
+        f'"{pk}":{{"version":{version},"costs":{fragments[pk]}}}' for pk, version, _ in stamps
+    )
+    return '{"destinations":{' + body + '}}'
@@ -0,0 +1,222 @@
+"""
+In-process spatial index over active destinations.
+
+Destinations with coordinates are bucketed into a grid of GRID_DEGREES
+cells. A radius query only computes great-circle distances for the
+destinations in the cells its bounding box touches. A nearest-N query
+widens the radius until it has enough hits, so both answers are exact.
+Packages are matched to destinations by the names and cities in their
+destination_names text.
+
+Each process keeps its index in memory and compares it against a version
+stamp in the shared cache on every use (the same scheme as content.pricing).
+content.signals bumps the stamp whenever a Destination or Package changes.
+"""
+import math
+import threading
+import uuid
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import Destination
+
+GEO_INDEX_VERSION_KEY = 'geo_index:version'
+GRID_DEGREES = 0.5  # About 55 km of latitude per cell
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+MAX_RADIUS_KM = 1000
+MAX_RESULTS = 50
+NEARBY_SECTION_LIMIT = 4  # "Nearby destinations" on destination_detail
+NEARBY_SECTION_RADIUS_KM = 300
+
+_state = {'version': None, 'index': None}
+_state_lock = threading.Lock()
+
+
+def _cell(latitude, longitude):
+    return int(math.floor(latitude / GRID_DEGREES)), int(math.floor((longitude + 180) / GRID_DEGREES))
+
+
+class GeoIndex:
+    """Grid of destination coordinates plus the packages touching each destination"""
+
+    def __init__(self, destinations, packages):
+        """
+        Args:
+            destinations: dicts with id, name, city, latitude and longitude
+            packages: dicts with id, name, slug and destination_names
+        """
+        self.destinations = destinations
+        self.positions = {d['id']: i for i, d in enumerate(destinations)}
+        coords = np.array([[d['latitude'], d['longitude']] for d in destinations], dtype=np.float64).reshape(-1, 2)
+        self.lat = np.radians(coords[:, 0])
+        self.lon = np.radians(coords[:, 1])
+        self.cos_lat = np.cos(self.lat)
+
+        cells = {}
+        for i, (latitude, longitude) in enumerate(coords):
+            cells.setdefault(_cell(latitude, longitude), []).append(i)
+        self.cells = {cell: np.array(members, dtype=np.int64) for cell, members in cells.items()}
+
+        # Destinations are referred to by name or city in free text
+        by_name = {}
+        for i, destination in enumerate(destinations):
+            for key in (destination['name'], destination['city']):
+                if key.strip():
+                    by_name.setdefault(key.strip().lower(), []).append(i)
+        self.packages = [[] for _ in destinations]
+        for package in packages:
+            matched = set()
+            for name in package['destination_names'].split(','):
+                matched.update(by_name.get(name.strip().lower(), ()))
+            for i in matched:
+                self.packages[i].append(package)
+
+    def __len__(self):
+        return len(self.destinations)
+
+    def _candidates(self, latitude, longitude, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        if abs(latitude) + dlat >= 90:
+            return np.arange(len(self.destinations))
+        dlon = min(dlat / math.cos(math.radians(latitude)), 180)
+        row_min, col_min = _cell(latitude - dlat, longitude - dlon)
+        row_max, col_max = _cell(latitude + dlat, longitude + dlon)
+        columns = round(360 / GRID_DEGREES)
+        span = col_max - col_min + 1
+        if span >= columns or (row_max - row_min + 1) * span > len(self.cells):
+            # Scanning the box would touch more cells than are occupied
+            return np.arange(len(self.destinations))
+
+        found = []
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                members = self.cells.get((row, col % columns))
+                if members is not None:
+                    found.append(members)
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def distances(self, latitude, longitude, indices):
+        """Haversine distances in km from a point to the given destinations"""
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        a = (
+            np.sin((self.lat[indices] - lat) / 2) ** 2
+            + math.cos(lat) * self.cos_lat[indices] * np.sin((self.lon[indices] - lon) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Destinations within radius_km of a point.
+
+        Returns:
+            list of (destination index, distance km), nearest first
+        """
+        indices = self._candidates(latitude, longitude, radius_km)
+        if not len(indices):
+            return []
+        distances = self.distances(latitude, longitude, indices)
+        keep = distances <= radius_km
+        indices, distances = indices[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return [(int(indices[i]), float(distances[i])) for i in order]
+
+    def nearest(self, latitude, longitude, limit, max_km=None, exclude=None):
+        """
+        The `limit` destinations closest to a point, optionally within max_km.
+
+        Returns:
+            list of (destination index, distance km), nearest first
+        """
+        ceiling = max_km if max_km is not None else math.pi * EARTH_RADIUS_KM
+        radius = min(GRID_DEGREES * KM_PER_DEGREE, ceiling)
+        while True:
+            hits = [hit for hit in self.within(latitude, longitude, radius) if hit[0] != exclude]
+            if len(hits) >= limit or radius >= ceiling:
+                return hits[:limit]
+            radius = min(radius * 2, ceiling)
+
+
+def build_geo_index():
+    from packages.models import Package
+
+    destinations = list(
+        Destination.objects.filter(is_active=True, latitude__isnull=False, longitude__isnull=False)
+        .order_by('id').values('id', 'name', 'city', 'latitude', 'longitude')
+    )
+    packages = list(
+        Package.objects.filter(is_active=True).order_by('id').values('id', 'name', 'slug', 'destination_names')
+    )
+    return GeoIndex(destinations, packages)
+
+
+def _current_version():
+    version = cache.get(GEO_INDEX_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another process may have set it first; use whichever won
+        if not cache.add(GEO_INDEX_VERSION_KEY, version, timeout=None):
+            version = cache.get(GEO_INDEX_VERSION_KEY, version)
+    return version
+
+
+def get_geo_index():
+    version = _current_version()
+    if _state['version'] == version:
+        return _state['index']
+    with _state_lock:
+        if _state['version'] != version:
+            _state.update(index=build_geo_index(), version=version)
+    return _state['index']
+
+
+def invalidate_geo_index():
+    """Make every process rebuild the index on its next use"""
+    cache.set(GEO_INDEX_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _serialize_destination(index, position, distance):
+    destination = index.destinations[position]
+    return {
+        'id': destination['id'],
+        'name': destination['name'],
+        'city': destination['city'],
+        'latitude': float(destination['latitude']),
+        'longitude': float(destination['longitude']),
+        'distance_km': round(distance, 1),
+    }
+
+
+def destinations_within(latitude, longitude, radius_km, limit=MAX_RESULTS):
+    index = get_geo_index()
+    hits = index.within(latitude, longitude, radius_km)[:limit]
+    return [_serialize_destination(index, position, distance) for position, distance in hits]
+
+
+def nearest_destinations(latitude, longitude, limit, max_km=None, exclude_id=None):
+    index = get_geo_index()
+    hits = index.nearest(latitude, longitude, limit, max_km=max_km, exclude=index.positions.get(exclude_id))
+    return [_serialize_destination(index, position, distance) for position, distance in hits]
+
+
+def packages_near(latitude, longitude, radius_km, limit=MAX_RESULTS):
+    """
+    Active packages visiting a destination within radius_km of a point.
+
+    Returns:
+        list of package dicts with the closest matching destination, nearest first
+    """
+    index = get_geo_index()
+    results = {}
+    for position, distance in index.within(latitude, longitude, radius_km):
+        for package in index.packages[position]:
+            if package['id'] not in results:
+                results[package['id']] = {
+                    'id': package['id'],
+                    'name': package['name'],
+                    'slug': package['slug'],
+                    'destination': index.destinations[position]['name'],
+                    'distance_km': round(distance, 1),
+                }
+    return list(results.values())[:limit]
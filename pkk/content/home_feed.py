@@ -0,0 +1,141 @@
+"""
+Home page feed builder.
+
+Assembles the bounded lists the home page shows (featured destinations,
+top companies, featured and trending products, featured packages) into a
+compact, template-ready structure of plain dicts and keeps it in the cache.
+The feed expires on a schedule (HOME_FEED_TIMEOUT, or the refresh_home_feed
+management command from cron) and is dropped by content.signals whenever
+one of the source models changes, so the home view costs a single cache
+read.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Sum, Q
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .models import Destination, Product
+
+HOME_FEED_CACHE_KEY = 'home_feed'
+HOME_FEED_TIMEOUT = 60 * 15  # Rebuild at least every 15 minutes
+
+FEATURED_DESTINATIONS_LIMIT = 6
+TOP_COMPANIES_LIMIT = 12
+FEATURED_PRODUCTS_LIMIT = 8
+TRENDING_PRODUCTS_LIMIT = 8
+FEATURED_PACKAGES_LIMIT = 6
+TRENDING_WINDOW_DAYS = 30
+
+
+def _file_name(field):
+    # Stored name, rendered through the responsive_image tag
+    return field.name if field else ''
+
+
+def _destination_entry(destination):
+    return {
+        'id': destination.id,
+        'name': destination.name,
+        'city': destination.city,
+        'country': destination.country,
+        'description': Truncator(destination.description).words(20),
+        'difficulty_level': destination.difficulty_level,
+        'min_days': destination.min_days,
+        'image': _file_name(destination.image),
+        'rating': round(destination.avg_rating or 0, 1),
+    }
+
+
+def _product_entry(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'category_label': product.get_category_display(),
+        'price': float(product.price),
+        'image': _file_name(product.image),
+        'in_stock': product.stock_quantity > 0,
+    }
+
+
+def build_home_feed():
+    """Query every home page section once and return the compact feed"""
+    from packages.models import Company, Package
+
+    destinations = (
+        Destination.objects.filter(is_featured=True, is_active=True)
+        .annotate(avg_rating=Avg('reviews__rating'))
+        .order_by('-created_at')[:FEATURED_DESTINATIONS_LIMIT]
+    )
+
+    companies = (
+        Company.objects.filter(is_active=True, approval_status='approved')
+        .order_by('-rating', 'name')[:TOP_COMPANIES_LIMIT]
+    )
+
+    visible_products = Product.objects.filter(is_active=True, is_approved=True)
+    featured_products = visible_products.order_by('-is_featured', '-rating', 'name')[:FEATURED_PRODUCTS_LIMIT]
+
+    since = timezone.now() - timedelta(days=TRENDING_WINDOW_DAYS)
+    trending_products = (
+        visible_products.annotate(
+            units_sold=Sum('orderitem__quantity', filter=Q(orderitem__order__created_at__gte=since))
+        )
+        .filter(units_sold__gt=0)
+        .order_by('-units_sold', 'name')[:TRENDING_PRODUCTS_LIMIT]
+    )
+
+    packages = (
+        Package.objects.filter(is_active=True, is_approved=True, company__is_active=True)
+        .select_related('company')
+        .order_by('-is_featured', '-rating', '-views_count')[:FEATURED_PACKAGES_LIMIT]
+    )
+
+    return {
+        'built_at': timezone.now().isoformat(),
+        'featured_destinations': [_destination_entry(d) for d in destinations],
+        'companies': [
+            {'name': c.name, 'slug': c.slug, 'logo': _file_name(c.logo)}
+            for c in companies
+        ],
+        'featured_products': [_product_entry(p) for p in featured_products],
+        'trending_products': [_product_entry(p) for p in trending_products],
+        'featured_packages': [
+            {
+                'name': p.name,
+                'slug': p.slug,
+                'company_name': p.company.name,
+                'destinations': p.destination_names,
+                'duration_days': p.duration_days,
+                'duration_nights': p.duration_nights,
+                'price_per_person': float(p.price_per_person),
+                'image': _file_name(p.image),
+            }
+            for p in packages
+        ],
+    }
+
+
+def refresh_home_feed():
+    """Rebuild the feed and store it for the next HOME_FEED_TIMEOUT seconds"""
+    feed = build_home_feed()
+    cache.set(HOME_FEED_CACHE_KEY, feed, timeout=HOME_FEED_TIMEOUT)
+    return feed
+
+
+def invalidate_home_feed():
+    cache.delete(HOME_FEED_CACHE_KEY)
+
+
+def get_home_feed():
+    feed = cache.get(HOME_FEED_CACHE_KEY)
+    if feed is None:
+        feed = refresh_home_feed()
+    return feed
+
+
+def get_home_products(feed):
+    """Featured products followed by trending ones not already shown"""
+    seen = {p['id'] for p in feed['featured_products']}
+    return feed['featured_products'] + [p for p in feed['trending_products'] if p['id'] not in seen]
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from content.notifications import ARCHIVE_BATCH_SIZE, RETENTION_DAYS, archive_read_notifications
+
+
+class Command(BaseCommand):
+    help = 'Move read admin notifications older than N days into the compressed archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batches, archived = archive_read_notifications(days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} read notifications in {batches} batches'
+        ))
@@ -0,0 +1,45 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from content.trip_optimizer import EXTRA_DAYS, MAX_PLANS, pareto_plans
+
+
+class Command(BaseCommand):
+    help = 'Time the trip optimizer on synthetic destinations (target: under 100 ms for 20)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--destinations', type=int, default=20)
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--budget', type=float, default=1_500_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        count = options['destinations']
+        # Daily and one-off costs in the range of real CostComponent totals for a group
+        per_day = rng.integers(2_000, 20_000, count)
+        fixed = rng.integers(5_000, 80_000, count)
+        min_days = rng.integers(1, 4, count)
+
+        pareto_plans(per_day, fixed, min_days, options['budget'], limit=MAX_PLANS)  # Warm up
+        timings = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            plans = pareto_plans(per_day, fixed, min_days, options['budget'], limit=MAX_PLANS)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings = np.array(timings)
+        itineraries = float(EXTRA_DAYS + 2) ** count
+        self.stdout.write(
+            f'{count} destinations, ~{itineraries:.1e} itineraries, {len(plans)} plans returned'
+        )
+        self.stdout.write(
+            f'median {np.median(timings):.1f} ms, p95 {np.percentile(timings, 95):.1f} ms, '
+            f'max {timings.max():.1f} ms over {options["runs"]} runs'
+        )
+        if np.percentile(timings, 95) < 100:
+            self.stdout.write(self.style.SUCCESS('Within the 100 ms target'))
+        else:
+            self.stdout.write(self.style.WARNING('Slower than the 100 ms target'))
@@ -0,0 +1,35 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from content.utils.images import IMAGE_FIELDS, generate_derivatives, get_manifest
+
+
+class Command(BaseCommand):
+    help = 'Generate WebP/JPEG derivatives for every uploaded image that is missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild manifests even if already stored')
+
+    def handle(self, *args, **options):
+        generated = skipped = failed = 0
+        for model_label, field_name in IMAGE_FIELDS:
+            model = apps.get_model(model_label)
+            names = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list(field_name, flat=True).distinct()
+            )
+            for name in names.iterator():
+                if not options['force'] and get_manifest(name) is not None:
+                    skipped += 1
+                    continue
+                manifest = generate_derivatives(name)
+                if manifest is None:
+                    skipped += 1  # Being generated by a web worker right now
+                elif manifest['widths']:
+                    generated += 1
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'  Could not process {model_label}.{field_name}: {name}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Derivatives generated for {generated} images ({skipped} already done, {failed} unreadable)'
+        ))
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from content.utils.weather import PREFETCH_AGE, PREFETCH_WORKERS, prefetch_weather
+
+# Backends whose entries live only in this process and vanish when the command exits
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh cached weather for every known city before it goes stale. '
+        'Schedule it from cron at least every 10 minutes, e.g. '
+        '*/10 * * * * python manage.py prefetch_weather'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('cities', nargs='*', help='Only these cities (default: all known cities)')
+        parser.add_argument('--workers', type=int, default=PREFETCH_WORKERS)
+        parser.add_argument('--force', action='store_true', help='Refresh even entries that are still fresh')
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES['default']['BACKEND']
+        if backend in PROCESS_LOCAL_CACHES:
+            raise CommandError(
+                f'The default cache ({backend}) is not shared with the web workers, so prefetching '
+                f'would warm nothing. Set REDIS_URL to use a shared cache.'
+            )
+        summary = prefetch_weather(
+            cities=options['cities'] or None,
+            max_workers=options['workers'],
+            max_age=0 if options['force'] else PREFETCH_AGE,
+        )
+        for city in sorted(summary['failed']):
+            self.stdout.write(self.style.WARNING(f'  Failed: {city}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Weather prefetched for {len(summary['refreshed'])} cities "
+            f"({len(summary['skipped'])} skipped, {len(summary['failed'])} failed)"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from content.home_feed import refresh_home_feed, HOME_FEED_TIMEOUT
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the cached home page feed (schedule from cron every few minutes)'
+
+    def handle(self, *args, **kwargs):
+        feed = refresh_home_feed()
+        self.stdout.write(self.style.SUCCESS(
+            f"Home feed rebuilt: {len(feed['featured_destinations'])} destinations, "
+            f"{len(feed['companies'])} companies, {len(feed['featured_products'])} featured products, "
+            f"{len(feed['trending_products'])} trending products, {len(feed['featured_packages'])} packages "
+            f"(expires in {HOME_FEED_TIMEOUT // 60} min)"
+        ))
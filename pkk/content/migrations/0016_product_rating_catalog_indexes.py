@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:54
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def backfill_product_ratings(apps, schema_editor):
+    Product = apps.get_model('content', 'Product')
+    products = Product.objects.annotate(
+        avg=Avg('product_reviews__rating'), total=Count('product_reviews')
+    ).filter(total__gt=0)
+    for product in products:
+        Product.objects.filter(pk=product.pk).update(rating=round(product.avg, 2), reviews_count=product.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0015_alter_adminnotification_options_and_more'),
+        ('packages', '0009_alter_booking_options_alter_company_options_and_more'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=3, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_approved', 'category', 'price'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_approved', 'company', 'price'], name='product_company_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_approved', 'price'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_approved', 'stock_quantity'], name='product_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'is_approved', '-rating', '-reviews_count'], name='product_rating_idx'),
+        ),
+        migrations.RunPython(backfill_product_ratings, migrations.RunPython.noop),
+    ]
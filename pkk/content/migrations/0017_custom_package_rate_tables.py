@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Rates previously hard-coded in templates/content/custom_package.html
+VALLEY_FUEL = {'coaster': (85000, 15000), 'grand-cabin': (70000, 15000)}
+SEED_RATES = {
+    'swat': ('Swat', VALLEY_FUEL),
+    'naran': ('Naran', VALLEY_FUEL),
+    'kashmir': ('Kashmir', VALLEY_FUEL),
+    'hunza': ('Hunza', {'coaster': (130000, 20000), 'grand-cabin': (100000, 20000)}),
+    'skardu': ('Skardu', {'coaster': (150000, 20000), 'grand-cabin': (130000, 20000)}),
+}
+VEHICLES = {
+    # vehicle: (min people, max people, rent per day)
+    'grand-cabin': (7, 13, 20000),
+    'coaster': (14, 27, 26000),
+}
+ACCOMMODATION = {'luxury': 15000, 'delux': 10000, 'standard': 5000}
+
+
+def seed_rate_tables(apps, schema_editor):
+    PackageRateTable = apps.get_model('content', 'PackageRateTable')
+    VehicleRate = apps.get_model('content', 'VehicleRate')
+    AccommodationRate = apps.get_model('content', 'AccommodationRate')
+    for slug, (name, trip_costs) in SEED_RATES.items():
+        table = PackageRateTable.objects.create(
+            slug=slug, name=name, breakfast_per_person=500, dinner_per_person=1050,
+            guide_per_day=2500, bonfire=7000,
+        )
+        for vehicle, (min_people, max_people, rent) in VEHICLES.items():
+            fuel, toll = trip_costs[vehicle]
+            VehicleRate.objects.create(
+                rate_table=table, vehicle=vehicle, min_people=min_people, max_people=max_people,
+                rent_per_day=rent, fuel=fuel, toll=toll, first_aid=1000,
+            )
+        for tier, rate in ACCOMMODATION.items():
+            AccommodationRate.objects.create(rate_table=table, tier=tier, per_room_per_night=rate)
+
+
+def remove_rate_tables(apps, schema_editor):
+    apps.get_model('content', 'PackageRateTable').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0016_product_rating_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageRateTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(help_text='Value submitted by the custom package form', unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('breakfast_per_person', models.DecimalField(decimal_places=2, help_text='Per person per day', max_digits=10)),
+                ('dinner_per_person', models.DecimalField(decimal_places=2, help_text='Per person per day', max_digits=10)),
+                ('guide_per_day', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('bonfire', models.DecimalField(decimal_places=2, help_text='One-time charge', max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AccommodationRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tier', models.CharField(choices=[('luxury', 'Luxury'), ('delux', 'Delux'), ('standard', 'Standard')], max_length=20)),
+                ('per_room_per_night', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rate_table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accommodation_rates', to='content.packageratetable')),
+            ],
+            options={
+                'unique_together': {('rate_table', 'tier')},
+            },
+        ),
+        migrations.CreateModel(
+            name='VehicleRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle', models.CharField(choices=[('grand-cabin', 'Grand Cabin (7-13 people)'), ('coaster', 'Coaster (14-27 people)')], max_length=20)),
+                ('min_people', models.PositiveIntegerField()),
+                ('max_people', models.PositiveIntegerField()),
+                ('rent_per_day', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fuel', models.DecimalField(decimal_places=2, help_text='Per trip', max_digits=10)),
+                ('toll', models.DecimalField(decimal_places=2, help_text='Per trip', max_digits=10)),
+                ('first_aid', models.DecimalField(decimal_places=2, help_text='Per trip', max_digits=10)),
+                ('rate_table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vehicle_rates', to='content.packageratetable')),
+            ],
+            options={
+                'ordering': ['min_people'],
+                'unique_together': {('rate_table', 'vehicle')},
+            },
+        ),
+        migrations.RunPython(seed_rate_tables, remove_rate_tables),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0017_custom_package_rate_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='destination',
+            name='costs_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='costs_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0018_destination_costs_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminNotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('oldest_created_at', models.DateTimeField()),
+                ('newest_created_at', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-first_id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='adminnotification',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='adminnotification',
+            name='group_key',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='adminnotification',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='adminnotification',
+            index=models.Index(fields=['is_read', 'id'], name='adminnotif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminnotification',
+            index=models.Index(fields=['group_key', 'is_read'], name='adminnotif_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adminnotification',
+            index=models.Index(fields=['is_read', 'created_at'], name='adminnotif_retention_idx'),
+        ),
+    ]
@@ -30,6 +30,10 @@ class Destination(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     tags = TaggableManager(blank=True)
     
+    # Bumped whenever one of the destination's cost components changes
+    costs_version = models.PositiveIntegerField(default=0, editable=False)
+    costs_updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    
     # SEO fields
     meta_title = models.CharField(max_length=60, blank=True)
     meta_description = models.CharField(max_length=160, blank=True)
@@ -79,21 +83,40 @@ class Product(models.Model):
     is_approved = models.BooleanField(default=True, help_text='Products added by companies require admin approval')
     is_featured = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    
+    # Denormalized review stats, kept current by content.signals so the
+    # catalog can sort by rating without aggregating reviews per request
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00, validators=[MinValueValidator(0)])
+    reviews_count = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     tags = TaggableManager(blank=True)
     
     class Meta:
         ordering = ['created_at']  # FIFO queue: oldest first
+        indexes = [
+            # Catalog filters always start with is_active/is_approved
+            models.Index(fields=['is_active', 'is_approved', 'category', 'price'], name='product_cat_price_idx'),
+            models.Index(fields=['is_active', 'is_approved', 'company', 'price'], name='product_company_price_idx'),
+            models.Index(fields=['is_active', 'is_approved', 'price'], name='product_price_idx'),
+            models.Index(fields=['is_active', 'is_approved', 'stock_quantity'], name='product_stock_idx'),
+            models.Index(fields=['is_active', 'is_approved', '-rating', '-reviews_count'], name='product_rating_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
     def get_average_rating(self):
-        reviews = self.product_reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
+        return float(self.rating)
+    
+    def update_rating(self):
+        """Recalculate the cached rating and review count from reviews"""
+        from django.db.models import Avg, Count
+        stats = self.product_reviews.aggregate(avg=Avg('rating'), total=Count('id'))
+        self.rating = round(stats['avg'] or 0, 2)
+        self.reviews_count = stats['total']
+        self.save(update_fields=['rating', 'reviews_count'])
     
     def is_in_stock(self):
         return self.stock_quantity > 0
@@ -411,6 +434,54 @@ class CustomPackageOrder(models.Model):
         super().save(*args, **kwargs)
 
 
+class PackageRateTable(models.Model):
+    """Per-destination rates used to price custom package requests"""
+    slug = models.SlugField(max_length=50, unique=True, help_text='Value submitted by the custom package form')
+    name = models.CharField(max_length=100)
+    breakfast_per_person = models.DecimalField(max_digits=10, decimal_places=2, help_text='Per person per day')
+    dinner_per_person = models.DecimalField(max_digits=10, decimal_places=2, help_text='Per person per day')
+    guide_per_day = models.DecimalField(max_digits=10, decimal_places=2)
+    bonfire = models.DecimalField(max_digits=10, decimal_places=2, help_text='One-time charge')
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class VehicleRate(models.Model):
+    rate_table = models.ForeignKey(PackageRateTable, on_delete=models.CASCADE, related_name='vehicle_rates')
+    vehicle = models.CharField(max_length=20, choices=CustomPackageOrder.VEHICLE_CHOICES)
+    min_people = models.PositiveIntegerField()
+    max_people = models.PositiveIntegerField()
+    rent_per_day = models.DecimalField(max_digits=10, decimal_places=2)
+    fuel = models.DecimalField(max_digits=10, decimal_places=2, help_text='Per trip')
+    toll = models.DecimalField(max_digits=10, decimal_places=2, help_text='Per trip')
+    first_aid = models.DecimalField(max_digits=10, decimal_places=2, help_text='Per trip')
+
+    class Meta:
+        ordering = ['min_people']
+        unique_together = ['rate_table', 'vehicle']
+
+    def __str__(self):
+        return f"{self.get_vehicle_display()} - {self.rate_table.name}"
+
+
+class AccommodationRate(models.Model):
+    rate_table = models.ForeignKey(PackageRateTable, on_delete=models.CASCADE, related_name='accommodation_rates')
+    tier = models.CharField(max_length=20, choices=CustomPackageOrder.ACCOMMODATION_CHOICES)
+    per_room_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ['rate_table', 'tier']
+
+    def __str__(self):
+        return f"{self.get_tier_display()} - {self.rate_table.name}"
+
+
 class AdminNotification(models.Model):
     NOTIFICATION_TYPES = [
         ('custom_package', 'New Custom Package Request'),
@@ -425,6 +496,11 @@ class AdminNotification(models.Model):
     is_read = models.BooleanField(default=False)
     link = models.CharField(max_length=500, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Bursts of events with the same group_key are folded into one digest row
+    group_key = models.CharField(max_length=100, blank=True)
+    count = models.PositiveIntegerField(default=1)
     
     # Optional reference to the related order
     custom_package_order = models.ForeignKey(
@@ -433,6 +509,28 @@ class AdminNotification(models.Model):
     
     class Meta:
         ordering = ['created_at']  # FIFO queue: oldest first
+        indexes = [
+            models.Index(fields=['is_read', 'id'], name='adminnotif_unread_idx'),
+            models.Index(fields=['group_key', 'is_read'], name='adminnotif_group_idx'),
+            models.Index(fields=['is_read', 'created_at'], name='adminnotif_retention_idx'),
+        ]
     
     def __str__(self):
         return f"[{self.notification_type}] {self.title}"
+
+
+class AdminNotificationArchive(models.Model):
+    """A batch of read notifications moved out of AdminNotification, stored as zlib-compressed JSON"""
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField()
+    oldest_created_at = models.DateTimeField()
+    newest_created_at = models.DateTimeField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-first_id']
+    
+    def __str__(self):
+        return f"Notifications #{self.first_id}-#{self.last_id} ({self.count})"
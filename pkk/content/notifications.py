@@ -0,0 +1,222 @@
+"""
+Admin notification delivery.
+
+New AdminNotification rows are pushed to every connected staff browser
+through the Channels group NOTIFICATIONS_GROUP (see
+content.consumers.AdminNotificationConsumer) instead of being polled. The
+unread count lives in the cache: it is counted once, then incremented and
+decremented as notifications are created and marked read, so neither the
+push channel nor admin_notifications_api has to run a COUNT.
+
+The hot table is kept small in two ways. notify() folds bursts that share a
+group_key into one digest row. archive_read_notifications() moves old read
+rows into compressed AdminNotificationArchive batches.
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AdminNotification, AdminNotificationArchive
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_GROUP = 'admin_notifications'
+UNREAD_COUNT_KEY = 'admin_notifications:unread_count'
+BACKLOG_LIMIT = 20
+BULK_READ_LIMIT = 1000
+COALESCE_WINDOW = timedelta(hours=1)  # Digest rows stop absorbing events after this
+RETENTION_DAYS = 30
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_FIELDS = (
+    'id', 'notification_type', 'title', 'message', 'is_read', 'link',
+    'created_at', 'updated_at', 'group_key', 'count', 'custom_package_order_id',
+)
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'link': notification.link,
+        'count': notification.count,
+        'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def get_unread_count():
+    count = cache.get(UNREAD_COUNT_KEY)
+    if count is None:
+        count = AdminNotification.objects.filter(is_read=False).count()
+        cache.add(UNREAD_COUNT_KEY, count, timeout=None)
+    return count
+
+
+def _adjust_unread_count(delta):
+    try:
+        return cache.incr(UNREAD_COUNT_KEY, delta)
+    except ValueError:
+        # Not cached yet, the next read counts from the database
+        return get_unread_count()
+
+
+def reset_unread_count():
+    cache.delete(UNREAD_COUNT_KEY)
+
+
+def get_unread_notifications(since_id=0, limit=BACKLOG_LIMIT):
+    """Unread notifications newer than the client's since_id cursor, oldest first"""
+    notifications = AdminNotification.objects.filter(is_read=False, id__gt=since_id).order_by('id')[:limit]
+    return [serialize_notification(n) for n in notifications]
+
+
+def _broadcast(event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(NOTIFICATIONS_GROUP, event)
+    except Exception as e:
+        # Clients catch up through since_id when they reconnect
+        logger.warning(f"Admin notification push failed: {str(e)}")
+
+
+def notification_created(notification):
+    """Count and push a newly created notification"""
+    unread_count = _adjust_unread_count(1) if not notification.is_read else get_unread_count()
+    _broadcast({
+        'type': 'notification.created',
+        'notification': serialize_notification(notification),
+        'unread_count': unread_count,
+    })
+
+
+def notify(notification_type, title, message, link='', group_key='', digest_title=None,
+           digest_link=None, **extra):
+    """
+    Create an admin notification, or fold it into a recent unread digest.
+
+    Args:
+        group_key: events sharing a key within COALESCE_WINDOW become one row
+        digest_title: callable(count) giving the title once a row holds
+            more than one event
+        digest_link: link for the digest row (defaults to the latest link)
+        extra: other AdminNotification fields, e.g. custom_package_order
+
+    Returns:
+        The created or updated AdminNotification
+    """
+    if group_key:
+        with transaction.atomic():
+            digest = (
+                AdminNotification.objects.select_for_update()
+                .filter(group_key=group_key, is_read=False, created_at__gte=timezone.now() - COALESCE_WINDOW)
+                .order_by('-id').first()
+            )
+            if digest is not None:
+                # The row is locked, so a plain increment is safe
+                digest.count += 1
+                digest.title = digest_title(digest.count) if digest_title else title
+                digest.message = f'Latest: {message}'
+                digest.link = digest_link or link
+                digest.save(update_fields=['count', 'title', 'message', 'link', 'updated_at'])
+                transaction.on_commit(lambda: _broadcast({
+                    'type': 'notification.updated',
+                    'notification': serialize_notification(digest),
+                    'unread_count': get_unread_count(),
+                }))
+                return digest
+
+    return AdminNotification.objects.create(
+        notification_type=notification_type, title=title, message=message, link=link,
+        group_key=group_key, **extra,
+    )
+
+
+def mark_notifications_read(ids=None, up_to_id=None):
+    """
+    Mark unread notifications read with a single UPDATE.
+
+    Args:
+        ids: specific notification ids
+        up_to_id: every unread notification with id <= up_to_id (used for
+            "mark all read" so rows that arrived after the page loaded stay unread)
+
+    Returns:
+        Number of rows changed
+    """
+    queryset = AdminNotification.objects.filter(is_read=False)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    elif up_to_id is not None:
+        queryset = queryset.filter(id__lte=up_to_id)
+    else:
+        return 0
+
+    updated = queryset.update(is_read=True, updated_at=timezone.now())
+    if updated:
+        _broadcast({
+            'type': 'notification.read',
+            'ids': list(ids) if ids is not None else [],
+            'up_to_id': up_to_id,
+            'unread_count': _adjust_unread_count(-updated),
+        })
+    return updated
+
+
+def mark_notification_read(notification_id):
+    """
+    Mark one notification read.
+
+    Returns:
+        False if the notification was missing or already read
+    """
+    return mark_notifications_read(ids=[notification_id]) > 0
+
+
+def archive_read_notifications(days=RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move read notifications older than `days` into AdminNotificationArchive.
+
+    Each batch becomes one archive row holding the zlib-compressed JSON of
+    its notifications, written in the same transaction that deletes them.
+
+    Returns:
+        (batches written, notifications archived)
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    batches = archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                AdminNotification.objects.filter(is_read=True, created_at__lt=cutoff)
+                .order_by('id').values(*ARCHIVE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            payload = json.dumps(rows, default=str, separators=(',', ':')).encode('utf-8')
+            AdminNotificationArchive.objects.create(
+                first_id=rows[0]['id'],
+                last_id=rows[-1]['id'],
+                count=len(rows),
+                oldest_created_at=min(row['created_at'] for row in rows),
+                newest_created_at=max(row['created_at'] for row in rows),
+                data=zlib.compress(payload, 9),
+            )
+            AdminNotification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        batches += 1
+        archived += len(rows)
+    return batches, archived
+
+
+def load_archive(archive):
+    """Decompress an AdminNotificationArchive back into notification dicts"""
+    return json.loads(zlib.decompress(bytes(archive.data)))
@@ -0,0 +1,213 @@
+"""
+Custom package pricing engine.
+
+Rates live in the PackageRateTable, VehicleRate and AccommodationRate
+models. Each process keeps the loaded tables in memory and compares them
+against a version stamp in the shared cache on every use. content.signals
+bumps that stamp whenever a rate row changes, so all processes reload on
+their next request. The same tables are used to build the JSON document
+for the browser preview (get_rates_document) and to compute the price that
+is actually charged (quote_custom_package).
+"""
+import hashlib
+import json
+import math
+import threading
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from .models import PackageRateTable
+
+RATES_VERSION_KEY = 'custom_package_rates:version'
+
+MIN_DAYS, MAX_DAYS = 3, 10
+MIN_PEOPLE, MAX_PEOPLE = 7, 27
+PEOPLE_PER_ROOM = 5  # At least one room per five travellers
+FOOD_OPTIONS = ('both', 'breakfast', 'dinner', 'none')
+
+_state = {'version': None, 'tables': None, 'document': None, 'etag': None}
+_state_lock = threading.Lock()
+
+
+class PricingError(ValueError):
+    """Raised for a destination or option that has no rate"""
+
+
+def load_rate_tables():
+    """Read every active rate table from the database (three queries)"""
+    tables = {}
+    queryset = PackageRateTable.objects.filter(is_active=True).prefetch_related(
+        'vehicle_rates', 'accommodation_rates'
+    )
+    for table in queryset:
+        tables[table.slug] = {
+            'name': table.name,
+            'vehicles': {
+                rate.vehicle: {
+                    'min_people': rate.min_people,
+                    'max_people': rate.max_people,
+                    'rent_per_day': rate.rent_per_day,
+                    'fuel': rate.fuel,
+                    'toll': rate.toll,
+                    'first_aid': rate.first_aid,
+                }
+                for rate in table.vehicle_rates.all()
+            },
+            'accommodation': {
+                rate.tier: rate.per_room_per_night for rate in table.accommodation_rates.all()
+            },
+            'food': {
+                'breakfast': table.breakfast_per_person,
+                'dinner': table.dinner_per_person,
+            },
+            'guide': table.guide_per_day,
+            'bonfire': table.bonfire,
+        }
+    return tables
+
+
+def _to_json(value):
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _current_version():
+    version = cache.get(RATES_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so concurrent processes agree on a single stamp
+        if not cache.add(RATES_VERSION_KEY, version, timeout=None):
+            version = cache.get(RATES_VERSION_KEY, version)
+    return version
+
+
+def _load_state():
+    version = _current_version()
+    if _state['version'] == version:
+        return _state
+    with _state_lock:
+        if _state['version'] != version:
+            tables = load_rate_tables()
+            document = json.dumps({
+                'limits': {
+                    'min_days': MIN_DAYS, 'max_days': MAX_DAYS,
+                    'min_people': MIN_PEOPLE, 'max_people': MAX_PEOPLE,
+                    'people_per_room': PEOPLE_PER_ROOM,
+                },
+                'destinations': _to_json(tables),
+            }, separators=(',', ':'), sort_keys=True).encode('utf-8')
+            _state.update(
+                tables=tables,
+                document=document,
+                etag=hashlib.sha256(document).hexdigest()[:32],
+                version=version,
+            )
+    return _state
+
+
+def invalidate_rate_tables():
+    """Make every process reload the rate tables on its next use"""
+    cache.set(RATES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_rate_tables():
+    return _load_state()['tables']
+
+
+def get_rates_version():
+    """Content hash of the current rate tables, shared by all processes"""
+    return _load_state()['etag']
+
+
+def get_rates_document():
+    """
+    Return the rate tables as serialized JSON for the browser.
+
+    Returns:
+        (document bytes, etag)
+    """
+    state = _load_state()
+    return state['document'], state['etag']
+
+
+def select_vehicle(rates, num_people):
+    """Vehicle code whose capacity range covers num_people"""
+    for vehicle, rate in rates['vehicles'].items():
+        if rate['min_people'] <= num_people <= rate['max_people']:
+            return vehicle
+    raise PricingError(f'No vehicle available for {num_people} people.')
+
+
+def clamp_request(num_days, num_people, num_rooms):
+    """Apply the builder's limits to the requested sizes"""
+    num_days = max(MIN_DAYS, min(MAX_DAYS, num_days))
+    num_people = max(MIN_PEOPLE, min(MAX_PEOPLE, num_people))
+    num_rooms = max(math.ceil(num_people / PEOPLE_PER_ROOM), min(num_people, num_rooms))
+    return num_days, num_people, num_rooms
+
+
+def quote_custom_package(destination, num_days, num_people, num_rooms, food, accommodation,
+                         guide=False, bonfire=False):
+    """
+    Price a custom package from the current rate tables.
+
+    Sizes are clamped to the builder's limits and the vehicle is chosen
+    from the group size, exactly as the booking form does.
+
+    Returns:
+        dict with the normalized request, a cost breakdown, total and
+        per person price (both Decimal)
+
+    Raises:
+        PricingError: unknown destination, food or accommodation option
+    """
+    rates = get_rate_tables().get(destination)
+    if rates is None:
+        raise PricingError('Please choose a valid destination.')
+    if food not in FOOD_OPTIONS:
+        raise PricingError('Please choose a valid food option.')
+    if accommodation not in rates['accommodation']:
+        raise PricingError('Please choose a valid accommodation option.')
+
+    num_days, num_people, num_rooms = clamp_request(num_days, num_people, num_rooms)
+    vehicle = select_vehicle(rates, num_people)
+    vehicle_rate = rates['vehicles'][vehicle]
+
+    meals_per_day = Decimal('0')
+    if food in ('both', 'breakfast'):
+        meals_per_day += rates['food']['breakfast']
+    if food in ('both', 'dinner'):
+        meals_per_day += rates['food']['dinner']
+
+    breakdown = {
+        'vehicle': (
+            vehicle_rate['rent_per_day'] * num_days
+            + vehicle_rate['fuel'] + vehicle_rate['toll'] + vehicle_rate['first_aid']
+        ),
+        'accommodation': rates['accommodation'][accommodation] * num_rooms * num_days,
+        'food': meals_per_day * num_people * num_days,
+        'guide': rates['guide'] * num_days if guide else Decimal('0'),
+        'bonfire': rates['bonfire'] if bonfire else Decimal('0'),
+    }
+    total = sum(breakdown.values(), Decimal('0'))
+
+    return {
+        'destination': destination,
+        'destination_name': rates['name'],
+        'num_days': num_days,
+        'num_people': num_people,
+        'num_rooms': num_rooms,
+        'vehicle': vehicle,
+        'food': food,
+        'accommodation': accommodation,
+        'guide': guide,
+        'bonfire': bonfire,
+        'breakdown': breakdown,
+        'total': total,
+        'per_person': (total / num_people).quantize(Decimal('1'), rounding=ROUND_HALF_UP),
+    }
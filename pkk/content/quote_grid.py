@@ -0,0 +1,224 @@
+"""
+Precomputed custom package quote grid.
+
+For one destination, every combination the custom package builder allows
+(days x people x rooms x food x accommodation x guide x bonfire) is priced
+in a single NumPy broadcast over the rate tables from content.pricing. The
+grid is kept per process and keyed by the rates version, so it is rebuilt
+only after a rate changes. It is served as one flat array for clients that
+answer "cheapest option" questions locally (custom_package_quote_grid), and
+cheapest_quote() answers them in Python: the chatbot adds its result to the
+prompt for questions like "cheapest Hunza trip for 8 people, 5 days".
+
+Grid totals are in PKR. Combinations that the builder would reject (fewer
+rooms than one per PEOPLE_PER_ROOM travellers, or no vehicle for the group
+size) are marked with UNAVAILABLE.
+"""
+import json
+import math
+import threading
+from decimal import Decimal
+
+import numpy as np
+
+from .pricing import (
+    FOOD_OPTIONS, MAX_DAYS, MAX_PEOPLE, MIN_DAYS, MIN_PEOPLE, PEOPLE_PER_ROOM, PricingError,
+    get_rate_tables, get_rates_version, quote_custom_package,
+)
+
+UNAVAILABLE = -1
+MAX_ROOMS = math.ceil(MAX_PEOPLE / PEOPLE_PER_ROOM)
+
+DAYS = np.arange(MIN_DAYS, MAX_DAYS + 1)
+PEOPLE = np.arange(MIN_PEOPLE, MAX_PEOPLE + 1)
+ROOMS = np.arange(1, MAX_ROOMS + 1)
+FLAGS = np.array([0, 1])
+AXES = ('days', 'people', 'rooms', 'food', 'accommodation', 'guide', 'bonfire')
+
+_grids = {}  # (rates version, destination) -> grid dict
+_grids_lock = threading.Lock()
+
+
+def _paisa(value):
+    # Integer arithmetic keeps the grid exact for DecimalField rates
+    return int(Decimal(value) * 100)
+
+
+def _axis(values, position):
+    """Reshape a 1-D array so it broadcasts along the given grid axis"""
+    shape = [1] * len(AXES)
+    shape[position] = -1
+    return np.asarray(values, dtype=np.int64).reshape(shape)
+
+
+def build_quote_grid(destination):
+    """
+    Price every builder combination for one destination.
+
+    Returns:
+        dict with the axis values, the vehicle used for each group size and
+        an int64 array of totals in paisa, shaped like AXES
+
+    Raises:
+        PricingError: unknown destination
+    """
+    rates = get_rate_tables().get(destination)
+    if rates is None:
+        raise PricingError('Please choose a valid destination.')
+
+    tiers = list(rates['accommodation'])
+    vehicle_by_people = []
+    rent = np.zeros(len(PEOPLE), dtype=np.int64)
+    trip = np.zeros(len(PEOPLE), dtype=np.int64)
+    for i, people in enumerate(PEOPLE):
+        vehicle = next(
+            (code for code, rate in rates['vehicles'].items()
+             if rate['min_people'] <= people <= rate['max_people']),
+            None,
+        )
+        vehicle_by_people.append(vehicle)
+        if vehicle:
+            rate = rates['vehicles'][vehicle]
+            rent[i] = _paisa(rate['rent_per_day'])
+            trip[i] = _paisa(rate['fuel']) + _paisa(rate['toll']) + _paisa(rate['first_aid'])
+
+    breakfast, dinner = _paisa(rates['food']['breakfast']), _paisa(rates['food']['dinner'])
+    meal_rates = {'both': breakfast + dinner, 'breakfast': breakfast, 'dinner': dinner, 'none': 0}
+
+    days = _axis(DAYS, 0)
+    people = _axis(PEOPLE, 1)
+    rooms = _axis(ROOMS, 2)
+    meals = _axis([meal_rates[food] for food in FOOD_OPTIONS], 3)
+    room_rate = _axis([_paisa(rates['accommodation'][tier]) for tier in tiers], 4)
+    guide = _axis(FLAGS, 5)
+    bonfire = _axis(FLAGS, 6)
+
+    totals = (
+        _axis(rent, 1) * days + _axis(trip, 1)
+        + room_rate * rooms * days
+        + meals * people * days
+        + guide * _paisa(rates['guide']) * days
+        + bonfire * _paisa(rates['bonfire'])
+    )
+    shape = (len(DAYS), len(PEOPLE), len(ROOMS), len(FOOD_OPTIONS), len(tiers), len(FLAGS), len(FLAGS))
+    totals = np.broadcast_to(totals, shape).copy()
+
+    too_few_rooms = rooms < np.ceil(people / PEOPLE_PER_ROOM)
+    no_vehicle = _axis([vehicle is None for vehicle in vehicle_by_people], 1).astype(bool)
+    totals[np.broadcast_to(too_few_rooms | no_vehicle, shape)] = UNAVAILABLE
+
+    return {
+        'destination': destination,
+        'name': rates['name'],
+        'axes': {
+            'days': DAYS.tolist(),
+            'people': PEOPLE.tolist(),
+            'rooms': ROOMS.tolist(),
+            'food': list(FOOD_OPTIONS),
+            'accommodation': tiers,
+            'guide': [False, True],
+            'bonfire': [False, True],
+        },
+        'vehicle_by_people': vehicle_by_people,
+        'totals': totals,
+    }
+
+
+def _serialize(grid):
+    totals = grid['totals']
+    available = totals != UNAVAILABLE
+    if (totals[available] % 100 == 0).all():
+        values = np.where(available, totals // 100, UNAVAILABLE).tolist()
+    else:
+        values = np.where(available, totals / 100, UNAVAILABLE).round(2).tolist()
+    return json.dumps({
+        'destination': grid['destination'],
+        'name': grid['name'],
+        'version': grid['version'],
+        'order': list(AXES),
+        'axes': grid['axes'],
+        'shape': list(totals.shape),
+        'vehicle_by_people': grid['vehicle_by_people'],
+        'unavailable': UNAVAILABLE,
+        # Row-major (C order) flattening of the grid, PKR
+        'totals': np.ravel(values).tolist(),
+    }, separators=(',', ':')).encode('utf-8')
+
+
+def get_quote_grid(destination):
+    """Cached grid for the current rate tables"""
+    version = get_rates_version()
+    key = (version, destination)
+    grid = _grids.get(key)
+    if grid is None:
+        with _grids_lock:
+            grid = _grids.get(key)
+            if grid is None:
+                grid = build_quote_grid(destination)
+                grid['version'] = version
+                grid['document'] = _serialize(grid)
+                # Drop grids priced from older rate tables
+                for stale in [k for k in _grids if k[0] != version]:
+                    del _grids[stale]
+                _grids[key] = grid
+    return grid
+
+
+def get_quote_grid_document(destination):
+    """
+    Return the grid as compact JSON for the browser.
+
+    Returns:
+        (document bytes, etag)
+    """
+    grid = get_quote_grid(destination)
+    return grid['document'], f"{grid['version']}-{destination}"
+
+
+def cheapest_quote(destination, num_days, num_people, **fixed):
+    """
+    Cheapest package for a trip length and group size.
+
+    Args:
+        destination: rate table slug
+        num_days, num_people: clamped to the builder limits
+        fixed: optional option values to hold constant, e.g.
+            food='both', accommodation='delux', guide=True, num_rooms=3
+
+    Returns:
+        quote_custom_package() result for the cheapest combination, or
+        None when nothing matches
+    """
+    grid = get_quote_grid(destination)
+    axes = grid['axes']
+    num_days = max(MIN_DAYS, min(MAX_DAYS, num_days))
+    num_people = max(MIN_PEOPLE, min(MAX_PEOPLE, num_people))
+
+    index = [axes['days'].index(num_days), axes['people'].index(num_people)]
+    for axis, name in (('rooms', 'num_rooms'), ('food', 'food'), ('accommodation', 'accommodation'),
+                       ('guide', 'guide'), ('bonfire', 'bonfire')):
+        if fixed.get(name) is None:
+            index.append(slice(None))
+        elif fixed[name] in axes[axis]:
+            index.append(axes[axis].index(fixed[name]))
+        else:
+            return None
+
+    options = grid['totals'][tuple(index)]
+    # Re-expand to a consistent shape so argmin indices map back to the axes
+    options = options.reshape([
+        1 if isinstance(i, int) else len(axes[AXES[position]])
+        for position, i in enumerate(index)
+    ][2:])
+    candidates = np.where(options == UNAVAILABLE, np.iinfo(np.int64).max, options)
+    best = np.unravel_index(np.argmin(candidates), candidates.shape)
+    if options[best] == UNAVAILABLE:
+        return None
+
+    choice = {}
+    for position, (axis, i) in enumerate(zip(AXES[2:], index[2:])):
+        choice[axis] = axes[axis][i if isinstance(i, int) else best[position]]
+    return quote_custom_package(
+        destination, num_days, num_people, choice['rooms'], choice['food'], choice['accommodation'],
+        guide=choice['guide'], bonfire=choice['bonfire'],
+    )
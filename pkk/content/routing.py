@@ -0,0 +1,6 @@
+from django.urls import path
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/admin/notifications/', consumers.AdminNotificationConsumer.as_asgi()),
+]
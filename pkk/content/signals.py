@@ -0,0 +1,151 @@
+"""Signal handlers that keep denormalized catalog data current"""
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import refresh_facet_counts
+from .home_feed import invalidate_home_feed
+from .cost_catalog import bump_cost_version
+from .geo_index import invalidate_geo_index
+from .models import (
+    AccommodationRate, AdminNotification, CostComponent, Destination, PackageRateTable, Product, ProductReview, Review, VehicleRate,
+)
+from .notifications import notification_created, reset_unread_count
+from .pricing import invalidate_rate_tables
+from .utils.images import IMAGE_FIELDS, get_manifest, schedule_derivatives
+
+# Saves that only touch these fields never change facet counts
+RATING_FIELDS = {'rating', 'reviews_count'}
+# Package saves limited to these fields leave the geo index untouched
+PACKAGE_STAT_FIELDS = {'views_count', 'rating'}
+# Counter saves (a package page view, a new review) wait for the scheduled feed refresh
+HOME_FEED_STAT_FIELDS = RATING_FIELDS | PACKAGE_STAT_FIELDS
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= RATING_FIELDS:
+        return
+    refresh_facet_counts()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    refresh_facet_counts()
+
+
+@receiver(post_save, sender='packages.Company')
+@receiver(post_delete, sender='packages.Company')
+def company_changed(sender, instance, **kwargs):
+    # Company facets carry the company name and slug
+    refresh_facet_counts()
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def product_review_changed(sender, instance, **kwargs):
+    try:
+        product = Product.objects.get(pk=instance.product_id)
+    except Product.DoesNotExist:
+        return  # Review removed as part of a product cascade delete
+    product.update_rating()
+
+
+@receiver(post_save, sender=Destination)
+@receiver(post_delete, sender=Destination)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender='packages.Company')
+@receiver(post_delete, sender='packages.Company')
+@receiver(post_save, sender='packages.Package')
+@receiver(post_delete, sender='packages.Package')
+def home_feed_source_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= HOME_FEED_STAT_FIELDS:
+        return
+    invalidate_home_feed()
+
+
+@receiver(post_save, sender=Destination)
+@receiver(post_delete, sender=Destination)
+@receiver(post_save, sender='packages.Package')
+@receiver(post_delete, sender='packages.Package')
+def geo_index_source_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= PACKAGE_STAT_FIELDS:
+        return
+    invalidate_geo_index()
+
+
+@receiver(post_save, sender=PackageRateTable)
+@receiver(post_delete, sender=PackageRateTable)
+@receiver(post_save, sender=VehicleRate)
+@receiver(post_delete, sender=VehicleRate)
+@receiver(post_save, sender=AccommodationRate)
+@receiver(post_delete, sender=AccommodationRate)
+def rate_table_changed(sender, instance, **kwargs):
+    invalidate_rate_tables()
+
+
+@receiver(post_save, sender=CostComponent)
+@receiver(post_delete, sender=CostComponent)
+def cost_component_changed(sender, instance, **kwargs):
+    bump_cost_version(instance.destination_id)
+
+
+@receiver(post_save, sender=AdminNotification)
+def admin_notification_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        transaction.on_commit(lambda: notification_created(instance))
+    elif update_fields is None or 'is_read' in update_fields:
+        # Read state may have changed outside mark_notifications_read
+        reset_unread_count()
+
+
+@receiver(post_delete, sender=AdminNotification)
+def admin_notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        reset_unread_count()
+
+
+def _loaded_name_attr(field_name):
+    return f'_{field_name}_loaded_name'
+
+
+def _image_field_loader(field_name):
+    def image_loaded(sender, instance, **kwargs):
+        # The raw attribute: reading the field would build a FieldFile for every row
+        value = instance.__dict__.get(field_name)
+        instance.__dict__[_loaded_name_attr(field_name)] = getattr(value, 'name', value)
+    return image_loaded
+
+
+def _image_field_saver(field_name):
+    def image_saved(sender, instance, created, update_fields=None, **kwargs):
+        if update_fields is not None and field_name not in update_fields:
+            return  # e.g. a last_login update
+        name = getattr(instance, field_name).name
+        loaded_attr = _loaded_name_attr(field_name)
+        unchanged = not created and instance.__dict__.get(loaded_attr) == name
+        instance.__dict__[loaded_attr] = name
+        # Only a new or replaced image pays for the manifest lookup
+        if name and not unchanged and get_manifest(name) is None:
+            # Wait for the commit so the worker thread sees the saved row and file
+            transaction.on_commit(lambda: schedule_derivatives(name))
+    return image_saved
+
+
+for _model_label, _field_name in IMAGE_FIELDS:
+    post_init.connect(
+        _image_field_loader(_field_name),
+        sender=apps.get_model(_model_label),
+        weak=False,
+        dispatch_uid=f'image_derivatives_loaded:{_model_label}.{_field_name}',
+    )
+    post_save.connect(
+        _image_field_saver(_field_name),
+        sender=apps.get_model(_model_label),
+        weak=False,
+        dispatch_uid=f'image_derivatives:{_model_label}.{_field_name}',
+    )
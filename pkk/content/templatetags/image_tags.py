@@ -0,0 +1,84 @@
+"""
+Template tags for responsive images.
+
+    {% load image_tags %}
+    {% responsive_image product.image product.name sizes="300px" class="card-img" %}
+
+renders a <picture> with WebP and JPEG srcsets built from the derivative
+pipeline in content.utils.images. Images whose derivatives do not exist
+yet point at the lazy image_derivative view and are queued for background
+generation.
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+from django.utils.http import urlencode
+
+from content.utils.images import (
+    DERIVATIVE_WIDTHS, derivative_url, get_manifest, get_source_name, schedule_derivatives,
+    sign_source_name,
+)
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 768px) 100vw, 400px'
+
+
+def _lazy_url(source_name, width, fmt):
+    query = urlencode({'src': sign_source_name(source_name), 'w': width, 'fmt': fmt})
+    return f"{reverse('content:image_derivative')}?{query}"
+
+
+def build_srcset(source_name, fmt, manifest):
+    if manifest is not None:
+        return ', '.join(f'{derivative_url(manifest, w, fmt)} {w}w' for w in manifest['widths'])
+    return ', '.join(f'{_lazy_url(source_name, w, fmt)} {w}w' for w in DERIVATIVE_WIDTHS)
+
+
+def _manifest_or_schedule(source_name):
+    manifest = get_manifest(source_name)
+    if manifest is None:
+        schedule_derivatives(source_name)
+    return manifest
+
+
+@register.simple_tag
+def srcset(source, fmt='webp'):
+    """srcset attribute value for an image field or stored file name"""
+    source_name = get_source_name(source)
+    if not source_name:
+        return ''
+    return build_srcset(source_name, fmt, _manifest_or_schedule(source_name))
+
+
+@register.simple_tag
+def responsive_image(source, alt='', sizes=DEFAULT_SIZES, **attrs):
+    """<picture> element with WebP/JPEG derivatives and lazy loading"""
+    source_name = get_source_name(source)
+    if not source_name:
+        return ''
+
+    manifest = _manifest_or_schedule(source_name)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+
+    if manifest and not manifest['widths']:
+        # Source could not be decoded, serve it untouched
+        return format_html('<img src="{}" alt="{}"{}>', default_storage.url(source_name), alt, extra)
+
+    if manifest is not None:
+        fallback = derivative_url(manifest, manifest['widths'][len(manifest['widths']) // 2], 'jpeg')
+    else:
+        fallback = _lazy_url(source_name, DERIVATIVE_WIDTHS[1], 'jpeg')
+
+    # display: contents keeps existing "wrapper img" CSS rules working
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        '</picture>',
+        build_srcset(source_name, 'webp', manifest), sizes,
+        fallback, build_srcset(source_name, 'jpeg', manifest), sizes, alt, extra,
+    )
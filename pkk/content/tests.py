@@ -1,3 +1,927 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from itertools import product as combinations
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from packages.models import Company, Package
+from .catalog import FACETS_CACHE_KEY, get_catalog_page, get_facet_counts
+from .consumers import AdminNotificationConsumer
+from .geo_index import EARTH_RADIUS_KM, GeoIndex, get_geo_index
+from .home_feed import HOME_FEED_CACHE_KEY, get_home_feed
+from .models import (
+    AdminNotification, AdminNotificationArchive, CostComponent, CustomPackageOrder, Destination, PackageRateTable, Product, ProductReview,
+)
+from .notifications import (
+    COALESCE_WINDOW, UNREAD_COUNT_KEY, get_unread_count, load_archive, mark_notifications_read, notify,
+)
+from .pricing import PricingError, get_rates_document, quote_custom_package
+from .quote_grid import AXES, UNAVAILABLE, cheapest_quote, get_quote_grid
+from .trip_optimizer import MAX_TRIP_DAYS, pareto_plans
+from .utils import weather
+from .utils.images import _manifest_key, generate_derivatives, get_manifest, manifest_name, sign_source_name
+
+User = get_user_model()
+
+
+def make_user(email='traveller@example.com', **kwargs):
+    return User.objects.create_user(username=email, email=email, password='pw12345!x', **kwargs)
+
+
+def make_company(name='Karakoram Crafts', **kwargs):
+    return Company.objects.create(
+        name=name, slug=name.lower().replace(' ', '-'), description=name, email='info@example.com',
+        phone='03001234567', approval_status='approved', **kwargs,
+    )
+
+
+def make_package(company, name, **kwargs):
+    kwargs.setdefault('is_approved', True)
+    kwargs.setdefault('destination_names', 'Hunza, Skardu')
+    return Package.objects.create(
+        company=company, name=name, slug=name.lower().replace(' ', '-'), description=name,
+        duration_days=5, duration_nights=4, price_per_person=Decimal('25000'), **kwargs,
+    )
+
+
+class WeatherStubServer(ThreadingHTTPServer):
+    """A local stand-in for WeatherAPI.com; tests set per-city status codes and delays"""
+    daemon_threads = True
+
+    def reset(self):
+        self.hits = []
+        self.status = {}
+        self.delay = {}
+        self.temp_c = 12.0
+
+    def handle_error(self, request, client_address):
+        pass  # The client gave up on a delayed response
+
+
+class WeatherStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        city = parse_qs(url.query)['q'][0].split(',')[0].lower()
+        self.server.hits.append((url.path.rsplit('/', 1)[-1], city))
+        time.sleep(self.server.delay.get(city, 0))
+        status = self.server.status.get(city, 200)
+        if status != 200:
+            body = {'error': {'message': 'No matching location found.'}}
+        elif url.path.endswith('forecast.json'):
+            today = timezone.localdate()
+            body = {'forecast': {'forecastday': [
+                {'date': (today + timedelta(days=offset)).isoformat(), 'day': {
+                    'maxtemp_c': 20 + offset, 'mintemp_c': 5, 'avghumidity': 40, 'daily_chance_of_rain': 10,
+                    'condition': {'text': 'Sunny', 'icon': '//cdn/sunny.png'}, 'maxwind_kph': 18,
+                }}
+                for offset in range(weather.FORECAST_DAYS)
+            ]}}
+        else:
+            body = {
+                'current': {
+                    'temp_c': self.server.temp_c, 'feelslike_c': 10.0, 'humidity': 40, 'wind_kph': 18,
+                    'condition': {'text': 'Sunny', 'icon': '//cdn/sunny.png'}, 'last_updated': '2026-10-19 10:00',
+                },
+                'location': {'name': city.title(), 'country': 'Pakistan', 'region': ''},
+            }
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WeatherStubMixin:
+    """Points the weather client at a WeatherStubServer for the duration of each test"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = WeatherStubServer(('127.0.0.1', 0), WeatherStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.reset()
+        base = f'http://127.0.0.1:{self.server.server_port}/v1'
+        for name, value in (('BASE_URL', f'{base}/current.json'), ('FORECAST_URL', f'{base}/forecast.json')):
+            patcher = mock.patch.object(weather, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def hits_for(self, city):
+        return [hit for hit in self.server.hits if hit[1] == city]
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Timed out waiting for a background weather fetch')
+            time.sleep(0.02)
+
+
+def make_product(name, price, **kwargs):
+    kwargs.setdefault('stock_quantity', 5)
+    return Product.objects.create(name=name, description=f'{name} from the north', price=Decimal(price), **kwargs)
+
+
+class ProductCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = make_company()
+        self.shawl = make_product('Pashmina Shawl', '4500', category='clothing', company=self.company)
+        self.rug = make_product('Hunza Rug', '12000', category='handicrafts', stock_quantity=0)
+        self.honey = make_product('Sidr Honey', '1800', category='food', company=self.company)
+        make_product('Hidden Vase', '900', is_approved=False)
+
+    def test_filters_and_sort(self):
+        page = get_catalog_page({'min_price': '1000', 'max_price': '20,000', 'sort': 'price_desc'})['page_obj']
+        self.assertEqual([p.name for p in page], ['Hunza Rug', 'Pashmina Shawl', 'Sidr Honey'])
+
+        page = get_catalog_page({'in_stock': '1', 'company': self.company.slug})['page_obj']
+        self.assertEqual({p.name for p in page}, {'Pashmina Shawl', 'Sidr Honey'})
+
+        page = get_catalog_page({'search': 'rug', 'category': 'not-a-category', 'sort': 'bogus'})['page_obj']
+        self.assertEqual([p.name for p in page], ['Hunza Rug'])
+
+    def test_page_size_is_capped(self):
+        catalog = get_catalog_page({'per_page': '100000', 'page': '99'})
+        self.assertEqual(catalog['filters']['per_page'], 48)
+        self.assertEqual(catalog['page_obj'].number, 1)  # Out of range pages fall back to the last one
+        self.assertEqual(catalog['querystring'], 'per_page=48')
+
+    def test_facets_are_maintained_by_signals(self):
+        facets = get_facet_counts()
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(facets['in_stock'], 2)
+        self.assertEqual(facets['companies'], [{'slug': self.company.slug, 'name': self.company.name, 'count': 2}])
+
+        make_product('Chitrali Cap', '700', category='clothing')
+        facets = cache.get(FACETS_CACHE_KEY)
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(next(c for c in facets['categories'] if c['value'] == 'clothing')['count'], 2)
+
+        with self.assertNumQueries(0):
+            get_facet_counts()
+
+    def test_rating_sort_uses_denormalized_reviews(self):
+        for email, rating in (('a@example.com', 5), ('b@example.com', 4)):
+            ProductReview.objects.create(
+                user=make_user(email), product=self.honey, rating=rating, title='Good', comment='Good',
+            )
+        self.honey.refresh_from_db()
+        self.assertEqual(self.honey.rating, Decimal('4.50'))
+        self.assertEqual(self.honey.reviews_count, 2)
+        page = get_catalog_page({'sort': 'rating'})['page_obj']
+        self.assertEqual(page[0], self.honey)
+
+    def test_product_list_view(self):
+        response = self.client.get('/content/products/', {'category': 'clothing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [self.shawl])
+
+
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = make_company()
+        self.package = make_package(self.company, 'Hunza Autumn Tour', is_featured=True)
+        make_product('Pashmina Shawl', '4500', is_featured=True)
+        make_product('Pending Shawl', '4000', is_approved=False)
+        Destination.objects.create(name='Hunza', description='Valley', city='Hunza', is_featured=True)
+
+    def test_feed_is_bounded_and_served_from_one_cache_read(self):
+        feed = get_home_feed()
+        self.assertEqual([p['name'] for p in feed['featured_products']], ['Pashmina Shawl'])
+        self.assertEqual([p['slug'] for p in feed['featured_packages']], [self.package.slug])
+        self.assertEqual([d['name'] for d in feed['featured_destinations']], ['Hunza'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_home_feed(), feed)
+
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['featured_packages'], feed['featured_packages'])
+
+    def test_package_view_counter_keeps_the_feed(self):
+        get_home_feed()
+        with mock.patch('packages.views.get_forecasts', return_value={}):
+            response = self.client.get(f'/packages/package/{self.package.slug}/')
+        self.assertEqual(response.status_code, 200)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.views_count, 1)
+        self.assertIsNotNone(cache.get(HOME_FEED_CACHE_KEY))
+
+        self.package.name = 'Hunza Cherry Blossom Tour'
+        self.package.save()
+        self.assertIsNone(cache.get(HOME_FEED_CACHE_KEY))
+
+    def test_admin_approval_drops_the_feed(self):
+        pending = make_package(self.company, 'Skardu Lakes Tour', is_approved=False)
+        self.assertNotIn(pending.slug, [p['slug'] for p in get_home_feed()['featured_packages']])
+
+        admin = User.objects.create_superuser(username='admin@example.com', email='admin@example.com', password='pw12345!x')
+        self.client.force_login(admin)
+        response = self.client.post('/admin/packages/package/', {
+            'action': 'approve_packages', '_selected_action': [pending.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(pending.slug, [p['slug'] for p in get_home_feed()['featured_packages']])
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (1500, 1000), (40, 120, 200)).save(buffer, format='PNG')
+        self.product = make_product('Hunza Rug', '12000', image=SimpleUploadedFile('rug.png', buffer.getvalue()))
+        self.source_name = self.product.image.name
+
+    def derivative_url(self, width=640, fmt='webp'):
+        return '/content/images/derivative/?' + '&'.join([
+            f'src={sign_source_name(self.source_name)}', f'w={width}', f'fmt={fmt}',
+        ])
+
+    def test_derivatives_and_manifest_survive_a_cache_flush(self):
+        manifest = generate_derivatives(self.source_name)
+        self.assertEqual(manifest['widths'], [320, 640, 1024])
+        digest = manifest['digest']
+        for width in manifest['widths']:
+            for extension in ('webp', 'jpg'):
+                path = os.path.join(self.media_root, 'derivatives', digest[:2], digest, f'{width}.{extension}')
+                self.assertTrue(os.path.exists(path), path)
+        self.assertTrue(default_storage.exists(manifest_name(self.source_name)))
+
+        cache.clear()  # A restart with a fresh LocMem cache
+        self.assertEqual(get_manifest(self.source_name), manifest)
+
+        html = Template('{% load image_tags %}{% responsive_image product.image "Rug" %}').render(
+            Context({'product': self.product})
+        )
+        self.assertIn(f'/media/derivatives/{digest[:2]}/{digest}/320.webp 320w', html)
+
+    def test_lazy_view_generates_once(self):
+        response = self.client.get(self.derivative_url(width=500))
+        self.assertEqual(response.status_code, 302)
+        manifest = get_manifest(self.source_name)
+        self.assertTrue(response['Location'].endswith(f"{manifest['digest']}/640.webp"))
+
+    def test_concurrent_generation_serves_the_original(self):
+        cache.add(f'{_manifest_key(self.source_name)}:lock', 1)
+        self.assertIsNone(generate_derivatives(self.source_name))
+
+        response = self.client.get(self.derivative_url())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], default_storage.url(self.source_name))
+        self.assertIsNone(get_manifest(self.source_name))
+
+    def test_saves_that_keep_the_image_skip_the_manifest(self):
+        user = make_user()
+        with mock.patch('content.signals.get_manifest', return_value=None) as lookup:
+            self.product.save(update_fields=['name'])
+            product = Product.objects.get(pk=self.product.pk)
+            product.price = Decimal('12500')
+            product.save()
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+            self.assertEqual(lookup.call_count, 0)
+
+            buffer = BytesIO()
+            Image.new('RGB', (800, 600), (200, 40, 40)).save(buffer, format='PNG')
+            product.image = SimpleUploadedFile('rug-red.png', buffer.getvalue())
+            product.save()
+            product.save(update_fields=['image'])  # Same name as just saved
+        lookup.assert_called_once_with(product.image.name)
+
+    def test_unreadable_source(self):
+        self.assertEqual(generate_derivatives('products/missing.png')['widths'], [])
+        self.source_name = 'products/missing.png'
+        self.assertEqual(self.client.get(self.derivative_url()).status_code, 404)
+
+
+class CustomPackagePricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_quote_from_seeded_rate_tables(self):
+        quote = quote_custom_package('hunza', 5, 12, 3, 'both', 'standard', guide=True, bonfire=True)
+        self.assertEqual(quote['vehicle'], 'grand-cabin')
+        self.assertEqual(quote['breakdown'], {
+            'vehicle': Decimal('221000'),  # 5 days rent plus fuel, toll and first aid
+            'accommodation': Decimal('75000'),
+            'food': Decimal('93000'),
+            'guide': Decimal('12500'),
+            'bonfire': Decimal('7000'),
+        })
+        self.assertEqual(quote['total'], Decimal('408500'))
+        self.assertEqual(quote['per_person'], Decimal('34042'))
+
+    def test_requests_are_clamped_and_validated(self):
+        quote = quote_custom_package('hunza', 40, 2, 0, 'none', 'standard')
+        self.assertEqual((quote['num_days'], quote['num_people'], quote['num_rooms']), (10, 7, 2))
+        with self.assertRaises(PricingError):
+            quote_custom_package('atlantis', 5, 12, 3, 'both', 'standard')
+        with self.assertRaises(PricingError):
+            quote_custom_package('hunza', 5, 12, 3, 'caviar', 'standard')
+
+    def test_rate_change_reprices_and_changes_the_etag(self):
+        _, etag = get_rates_document()
+        response = self.client.get('/content/custom-package/rates/', HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(response.status_code, 304)
+
+        table = PackageRateTable.objects.get(slug='hunza')
+        table.bonfire = Decimal('9000')
+        table.save()
+        quote = quote_custom_package('hunza', 5, 12, 3, 'none', 'standard', bonfire=True)
+        self.assertEqual(quote['breakdown']['bonfire'], Decimal('9000'))
+        response = self.client.get('/content/custom-package/rates/', HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['destinations']['hunza']['bonfire'], 9000)
+
+    def test_order_price_ignores_the_posted_total(self):
+        self.client.force_login(make_user())
+        response = self.client.post('/content/custom-package/', {
+            'destination': 'hunza', 'numDays': '5', 'numPeople': '12', 'numRooms': '3', 'food': 'both',
+            'accommodation': 'standard', 'guide': 'yes', 'bonfire': 'yes', 'totalPrice': '100',
+        })
+        order = CustomPackageOrder.objects.get()
+        self.assertRedirects(response, f'/content/custom-package/payment/{order.id}/', fetch_redirect_response=False)
+        self.assertEqual(order.total_price, Decimal('408500'))
+        self.assertEqual(order.per_person_price, Decimal('34042'))
+
+
+class QuoteGridTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_grid_matches_the_pricing_engine(self):
+        grid = get_quote_grid('hunza')
+        axes, totals = grid['axes'], grid['totals']
+        self.assertEqual(totals.shape, tuple(len(axes[axis]) for axis in AXES))
+        for index in list(combinations(*[range(n) for n in totals.shape]))[::97]:
+            days, people, rooms, food, tier, guide, bonfire = (axes[axis][i] for axis, i in zip(AXES, index))
+            if rooms * 5 < people:
+                self.assertEqual(totals[index], UNAVAILABLE)
+                continue
+            quote = quote_custom_package('hunza', days, people, rooms, food, tier, guide=guide, bonfire=bonfire)
+            self.assertEqual(totals[index], int(quote['total'] * 100), index)
+
+    def test_cheapest_quote(self):
+        quote = cheapest_quote('hunza', 5, 12)
+        self.assertEqual((quote['num_rooms'], quote['food'], quote['accommodation']), (3, 'none', 'standard'))
+        self.assertFalse(quote['guide'] or quote['bonfire'])
+        self.assertEqual(quote['total'], Decimal('296000'))
+
+        quote = cheapest_quote('hunza', 5, 12, accommodation='luxury', guide=True)
+        self.assertEqual((quote['accommodation'], quote['guide']), ('luxury', True))
+        self.assertIsNone(cheapest_quote('hunza', 5, 12, food='caviar'))
+
+    def test_endpoint_is_cached_until_rates_change(self):
+        response = self.client.get('/content/custom-package/rates/hunza/grid/')
+        self.assertEqual(response.status_code, 200)
+        document = response.json()
+        self.assertEqual(document['order'], list(AXES))
+        self.assertEqual(len(document['totals']), get_quote_grid('hunza')['totals'].size)
+
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get('/content/custom-package/rates/hunza/grid/', HTTP_IF_NONE_MATCH=etag).status_code, 304,
+        )
+        PackageRateTable.objects.filter(slug='hunza').get().save()  # Same rates, same content hash
+        self.assertEqual(
+            self.client.get('/content/custom-package/rates/hunza/grid/', HTTP_IF_NONE_MATCH=etag).status_code, 304,
+        )
+        table = PackageRateTable.objects.get(slug='hunza')
+        table.guide_per_day = Decimal('3000')
+        table.save()
+        self.assertEqual(
+            self.client.get('/content/custom-package/rates/hunza/grid/', HTTP_IF_NONE_MATCH=etag).status_code, 200,
+        )
+        self.assertEqual(self.client.get('/content/custom-package/rates/atlantis/grid/').status_code, 404)
+
+
+class CostCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hunza = Destination.objects.create(name='Hunza', description='Valley', city='Hunza')
+        self.skardu = Destination.objects.create(name='Skardu', description='Lakes', city='Skardu')
+        self.jeep = CostComponent.objects.create(
+            destination=self.hunza, name='Jeep', category='transport', base_cost=Decimal('8000'), unit='per day',
+        )
+        CostComponent.objects.create(
+            destination=self.skardu, name='Camping', category='camping', base_cost=Decimal('1500'), unit='per night',
+        )
+
+    def test_many_destinations_in_one_response(self):
+        response = self.client.get('/content/api/cost-catalog/', {'destinations': f'{self.hunza.id},{self.skardu.id}'})
+        self.assertEqual(response.status_code, 200)
+        destinations = response.json()['destinations']
+        self.assertEqual(destinations[str(self.hunza.id)]['costs'][0]['name'], 'Jeep')
+        self.assertEqual(destinations[str(self.skardu.id)]['costs'][0]['base_cost'], 1500.0)
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        self.assertEqual(self.client.get('/content/api/cost-catalog/', {'destinations': 'x'}).status_code, 400)
+        too_many = ','.join(str(pk) for pk in range(1, 200))
+        self.assertEqual(self.client.get('/content/api/cost-catalog/', {'destinations': too_many}).status_code, 400)
+
+    def test_conditional_get_and_version_bump(self):
+        response = self.client.get('/content/api/cost-catalog/')
+        etag = response['ETag']
+        with self.assertNumQueries(1):  # Only the stamp query
+            response = self.client.get('/content/api/cost-catalog/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.jeep.base_cost = Decimal('9000')
+        self.jeep.save()
+        self.hunza.refresh_from_db()
+        self.assertEqual(self.hunza.costs_version, 2)
+        response = self.client.get('/content/api/cost-catalog/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['destinations'][str(self.hunza.id)]['costs'][0]['base_cost'], 9000.0)
+
+    def test_single_destination_endpoint(self):
+        response = self.client.get('/content/api/destination-costs/', {'destination_id': self.skardu.id})
+        self.assertEqual(response.json()['costs'][0]['name'], 'Camping')
+        self.assertEqual(
+            self.client.get('/content/api/destination-costs/', {'destination_id': self.skardu.id},
+                            HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304,
+        )
+
+
+class TripOptimizerTests(TestCase):
+    PER_DAY = [1000.0, 1500.0, 800.0, 2500.0]
+    FIXED = [500.0, 0.0, 2000.0, 300.0]
+    MIN_DAYS = [2, 1, 3, 1]
+
+    def brute_force_frontier(self, budget, max_days, extra_days):
+        cheapest = {}
+        options = [[0] + list(range(m, m + extra_days + 1)) for m in self.MIN_DAYS]
+        for stays in combinations(*options):
+            days = sum(stays)
+            covered = sum(1 for d in stays if d)
+            if not covered or days > max_days:
+                continue
+            cost = sum(self.PER_DAY[i] * d + self.FIXED[i] for i, d in enumerate(stays) if d)
+            if cost <= budget and cost < cheapest.get((covered, days), float('inf')):
+                cheapest[(covered, days)] = cost
+        return {
+            (covered, days, cost) for (covered, days), cost in cheapest.items()
+            if not any(
+                other <= cost and (n, d) != (covered, days)
+                for (n, d), other in cheapest.items() if n >= covered and d >= days
+            )
+        }
+
+    def test_frontier_matches_brute_force(self):
+        for budget, max_days in ((10 ** 9, 30), (20000, 30), (20000, 6)):
+            plans = pareto_plans(self.PER_DAY, self.FIXED, self.MIN_DAYS, budget, max_days=max_days, extra_days=2)
+            self.assertEqual(
+                {(len(p['stops']), p['days'], p['cost']) for p in plans},
+                self.brute_force_frontier(budget, max_days, extra_days=2),
+            )
+            for plan in plans:
+                self.assertEqual(sum(days for _, days in plan['stops']), plan['days'])
+                self.assertEqual(
+                    sum(self.PER_DAY[i] * days + self.FIXED[i] for i, days in plan['stops']), plan['cost'],
+                )
+            self.assertEqual([p['cost'] for p in plans], sorted(p['cost'] for p in plans))
+
+    def test_day_limit_is_clamped(self):
+        plans = pareto_plans([100.0], [0.0], [2], budget=10 ** 9, max_days=10 ** 9)
+        self.assertEqual(max(p['days'] for p in plans), 2 + 4)
+        plans = pareto_plans([100.0] * 30, [0.0] * 30, [20] * 30, budget=10 ** 12)
+        self.assertLessEqual(max(p['days'] for p in plans), MAX_TRIP_DAYS)
+
+    def test_endpoint(self):
+        hunza = Destination.objects.create(name='Hunza', description='Valley', city='Hunza', min_days=2)
+        CostComponent.objects.create(
+            destination=hunza, name='Hotel', category='accommodation', base_cost=Decimal('3000'), unit='per night',
+        )
+        response = self.client.get('/content/api/trip-optimizer/', {'budget': '100000', 'people': '2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['plans'][0]['stops'][0]['name'], 'Hunza')
+        self.assertEqual(response.json()['plans'][0]['total_cost'], 6000.0)
+
+        for params in (
+            {'budget': 'nan', 'people': '2'},
+            {'budget': 'inf', 'people': '2'},
+            {'budget': '-5', 'people': '2'},
+            {'budget': '1000', 'people': '0'},
+            {'budget': '1000', 'people': '2', 'max_days': '100000'},
+            {'budget': '1000', 'people': '2', 'max_days': str(MAX_TRIP_DAYS + 1)},
+            {'budget': '1000', 'people': '2', 'destinations': 'x'},
+        ):
+            self.assertEqual(self.client.get('/content/api/trip-optimizer/', params).status_code, 400, params)
+
+
+# Whatever CHANNEL_LAYER_BACKEND says, consumers and tests share this process
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AdminNotificationPushTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def connect(self, user, since_id=0):
+        communicator = WebsocketCommunicator(
+            AdminNotificationConsumer.as_asgi(), f'/ws/admin/notifications/?since_id={since_id}',
+        )
+        communicator.scope['user'] = user
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def test_backlog_then_push(self):
+        staff = await sync_to_async(make_user)('staff@example.com', is_staff=True)
+        first = await sync_to_async(AdminNotification.objects.create)(
+            notification_type='general', title='First', message='one',
+        )
+        second = await sync_to_async(AdminNotification.objects.create)(
+            notification_type='general', title='Second', message='two',
+        )
+
+        communicator, connected, _ = await self.connect(staff, since_id=first.id)
+        self.assertTrue(connected)
+        backlog = await communicator.receive_json_from()
+        self.assertEqual(backlog['type'], 'backlog')
+        self.assertEqual([n['id'] for n in backlog['notifications']], [second.id])
+        self.assertEqual(backlog['unread_count'], 2)
+
+        third = await sync_to_async(AdminNotification.objects.create)(
+            notification_type='order', title='Third', message='three',
+        )
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['notification']['id']), ('notification', third.id))
+        self.assertEqual(message['unread_count'], 3)
+
+        await sync_to_async(mark_notifications_read)(up_to_id=second.id)
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['type'], message['up_to_id'], message['unread_count']), ('read', second.id, 1))
+        await communicator.disconnect()
+
+    async def test_non_staff_rejected(self):
+        user = await sync_to_async(make_user)()
+        communicator, connected, code = await self.connect(user)
+        self.assertFalse(connected)
+        self.assertEqual(code, 4403)
+
+
+class AdminNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = make_user('staff@example.com', is_staff=True)
+        for title in ('One', 'Two', 'Three'):
+            AdminNotification.objects.create(notification_type='general', title=title, message=title)
+
+    def test_unread_count_is_cached(self):
+        self.assertEqual(get_unread_count(), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(), 3)
+
+        self.client.force_login(self.staff)
+        response = self.client.get('/content/api/admin-notifications/', {'since_id': 0})
+        self.assertEqual(response.json()['unread_count'], 3)
+        self.assertEqual([n['title'] for n in response.json()['notifications']], ['One', 'Two', 'Three'])
+
+        # A save outside mark_notifications_read drops the cached count
+        notification = AdminNotification.objects.get(title='One')
+        notification.is_read = True
+        notification.save()
+        self.assertIsNone(cache.get(UNREAD_COUNT_KEY))
+        self.assertEqual(get_unread_count(), 2)
+
+    def test_api_requires_staff(self):
+        self.client.force_login(make_user())
+        self.assertEqual(self.client.get('/content/api/admin-notifications/').status_code, 403)
+        self.assertEqual(self.client.post('/content/api/mark-notifications-read/').status_code, 403)
+
+    def test_notify_coalesces_bursts(self):
+        def submit(name):
+            return notify(
+                'general', f'New Product for Approval: {name}', f'"{name}" awaits review', link=f'/p/{name}/',
+                group_key='product_submitted:1', digest_title=lambda count: f'{count} new products awaiting approval',
+                digest_link='/admin/content/product/',
+            )
+
+        first = submit('Shawl')
+        self.assertEqual(submit('Rug').id, first.id)
+        digest = submit('Honey')
+        self.assertEqual((digest.id, digest.count), (first.id, 3))
+        self.assertEqual(digest.title, '3 new products awaiting approval')
+        self.assertEqual((digest.message, digest.link), ('Latest: "Honey" awaits review', '/admin/content/product/'))
+
+        # Read or stale digests stop absorbing events
+        AdminNotification.objects.filter(id=first.id).update(created_at=timezone.now() - COALESCE_WINDOW * 2)
+        self.assertNotEqual(submit('Apricots').id, first.id)
+        self.assertEqual(AdminNotification.objects.filter(group_key='product_submitted:1').count(), 2)
+
+    def test_custom_package_events_are_coalesced(self):
+        for email in ('a@example.com', 'b@example.com'):
+            self.client.force_login(make_user(email))
+            self.client.post('/content/custom-package/', {
+                'destination': 'hunza', 'numDays': '5', 'numPeople': '8', 'numRooms': '2', 'food': 'none',
+                'accommodation': 'standard',
+            })
+            order = CustomPackageOrder.objects.latest('id')
+            self.client.get(f'/content/custom-package/payment-success/{order.id}/')
+
+        requests = AdminNotification.objects.get(group_key='custom_package_requested')
+        self.assertEqual((requests.count, requests.title), (2, '2 new custom package requests'))
+        self.assertEqual(requests.link, '/admin/content/custompackageorder/?status__exact=pending')
+        payments = AdminNotification.objects.get(group_key='custom_package_paid')
+        self.assertEqual((payments.count, payments.title), (2, '2 custom package payments received'))
+        self.assertEqual(payments.message, f'Latest: Payment of PKR {order.total_price:,.0f} received from '
+                                           f'b@example.com for custom package to Hunza.')
+        self.assertEqual(get_unread_count(), 5)
+
+    def test_bulk_mark_read(self):
+        self.client.force_login(self.staff)
+        one, two, three = AdminNotification.objects.order_by('id')
+        self.assertEqual(get_unread_count(), 3)
+
+        response = self.client.post(
+            '/content/api/mark-notifications-read/', json.dumps({'ids': [one.id, one.id]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json(), {'success': True, 'updated': 1, 'unread_count': 2})
+
+        # "Mark all read" leaves rows newer than the page the admin saw
+        with self.captureOnCommitCallbacks(execute=True):
+            late = AdminNotification.objects.create(notification_type='general', title='Late', message='late')
+        response = self.client.post(
+            '/content/api/mark-notifications-read/', json.dumps({'up_to_id': three.id}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(list(AdminNotification.objects.filter(is_read=False)), [late])
+        self.assertEqual(get_unread_count(), 1)
+
+        for body in ('{}', 'nope', json.dumps({'ids': ['x']})):
+            response = self.client.post('/content/api/mark-notifications-read/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_archive_old_read_notifications(self):
+        AdminNotification.objects.update(is_read=True)
+        AdminNotification.objects.exclude(title='Three').update(created_at=timezone.now() - timedelta(days=45))
+        call_command('archive_notifications', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(list(AdminNotification.objects.values_list('title', flat=True)), ['Three'])
+        archives = AdminNotificationArchive.objects.order_by('first_id')
+        self.assertEqual([a.count for a in archives], [1, 1])
+        self.assertEqual([row['title'] for a in archives for row in load_archive(a)], ['One', 'Two'])
+
+
+class WeatherClientTests(WeatherStubMixin, TestCase):
+    def test_stale_while_revalidate(self):
+        self.assertEqual(weather.get_weather_data(' Hunza ')['temperature'], 12.0)
+        self.assertEqual(weather.get_weather_data('hunza')['city_name'], 'Hunza')
+        self.assertEqual(len(self.hits_for('hunza')), 1)
+
+        key = weather._cache_key('hunza')
+        entry = cache.get(key)
+        entry['fetched_at'] -= weather.SOFT_TTL + 1
+        cache.set(key, entry, timeout=weather.HARD_TTL)
+        self.server.temp_c = 20.0
+        self.assertEqual(weather.get_weather_data('hunza')['temperature'], 12.0)  # Stale, served at once
+        self.wait_for(lambda: cache.get(key)['data']['temperature'] == 20.0)
+        self.assertEqual(len(self.hits_for('hunza')), 2)
+
+    def test_failed_lookups_are_negatively_cached(self):
+        self.server.status['atlantis'] = 400
+        with self.assertLogs('content.utils.weather', 'WARNING'):
+            self.assertIsNone(weather.get_weather_data('Atlantis'))
+        self.assertIsNone(weather.get_weather_data('atlantis'))
+        self.assertEqual(len(self.hits_for('atlantis')), 1)
+        self.assertIsNone(cache.get(weather.BREAKER_FAILURES_KEY))  # Bad requests are not outages
+
+    def test_slow_upstream_times_out(self):
+        self.server.delay['gilgit'] = 1
+        started = time.monotonic()
+        with mock.patch.object(weather, 'REQUEST_TIMEOUT', (1, 0.2)), self.assertLogs('content.utils.weather') as logs:
+            self.assertIsNone(weather.get_weather_data('gilgit'))
+        self.assertIn('ReadTimeout', logs.output[0])
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(cache.get(weather.BREAKER_FAILURES_KEY), 1)
+
+    def test_circuit_breaker_opens_and_closes(self):
+        cities = ['naran', 'swat', 'chitral', 'kaghan', 'murree']
+        for city in cities:
+            self.server.status[city] = 503
+        with mock.patch.object(weather, 'BREAKER_COOLDOWN', 1):
+            with self.assertLogs('content.utils.weather', 'WARNING') as logs:
+                for city in cities:
+                    self.assertIsNone(weather.get_weather_data(city))
+            self.assertIn('circuit breaker opened after 5 failures', logs.output[-1])
+            self.assertTrue(weather.breaker_is_open())
+
+            # Open: nothing is sent upstream
+            self.assertIsNone(weather.get_weather_data('hunza'))
+            self.assertEqual(self.hits_for('hunza'), [])
+
+            self.wait_for(lambda: not weather.breaker_is_open())
+        self.assertEqual(weather.get_weather_data('hunza')['temperature'], 12.0)
+        self.assertIsNone(cache.get(weather.BREAKER_FAILURES_KEY))
+
+
+class WeatherPrefetchTests(WeatherStubMixin, TestCase):
+    def test_prefetch_command(self):
+        self.server.status['atlantis'] = 400
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'Set REDIS_URL'):
+            call_command('prefetch_weather', stdout=out)
+        self.assertEqual(self.server.hits, [])
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        shared_cache = {
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+        }
+        with override_settings(CACHES=shared_cache):
+            with self.assertLogs('content.utils.weather', 'WARNING'):
+                call_command('prefetch_weather', 'Hunza', 'skardu', 'atlantis', stdout=out)
+            self.assertIn('Weather prefetched for 2 cities (0 skipped, 1 failed)', out.getvalue())
+            self.assertIsNotNone(cache.get(weather._cache_key('skardu')))
+
+            # Fresh entries are skipped until --force
+            summary = weather.prefetch_weather(['hunza', 'skardu'])
+            self.assertEqual(summary['skipped'], ['hunza', 'skardu'])
+            self.assertEqual(len(self.server.hits), 3)
+            summary = weather.prefetch_weather(['hunza', 'skardu'], max_age=0)
+            self.assertEqual(sorted(summary['refreshed']), ['hunza', 'skardu'])
+
+    def test_prefetch_cities_include_destinations(self):
+        Destination.objects.create(name='Fairy Meadows', description='Meadows', city='Fairy Meadows')
+        Destination.objects.create(name='Closed', description='Closed', city='Nowhere', is_active=False)
+        cities = weather.get_prefetch_cities()
+        self.assertIn('fairy meadows', cities)
+        self.assertIn('hunza', cities)
+        self.assertNotIn('nowhere', cities)
+
+    def test_prefetch_stops_when_breaker_opens(self):
+        cache.set(weather.BREAKER_OPEN_KEY, True)
+        summary = weather.prefetch_weather(['hunza', 'skardu'])
+        self.assertEqual(sorted(summary['skipped']), ['hunza', 'skardu'])
+        self.assertEqual(self.server.hits, [])
+
+
+class WeatherBatchTests(WeatherStubMixin, TestCase):
+    def test_batch_endpoint(self):
+        weather.fetch_weather('hunza')
+        self.server.status['gilgit'] = 400
+        with self.assertLogs('content.utils.weather', 'WARNING'):
+            response = self.client.get('/content/api/weather/', {'cities': 'Hunza,skardu,gilgit,hunza'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(sorted(body['weather']), ['hunza', 'skardu'])
+        self.assertEqual((body['pending'], body['failed']), ([], ['gilgit']))
+        self.assertEqual(len(self.hits_for('hunza')), 1)  # Cache hit
+
+        self.assertEqual(self.client.get('/content/api/weather/').status_code, 400)
+        too_many = ','.join(f'city{i}' for i in range(weather.BATCH_MAX_CITIES + 1))
+        self.assertEqual(self.client.get('/content/api/weather/', {'cities': too_many}).status_code, 400)
+
+    def test_unknown_cities_are_not_fetched(self):
+        Destination.objects.create(name='Deosai Plains', description='Plateau', city='Deosai')
+        response = self.client.get('/content/api/weather/', {'cities': 'atlantis,deosai,Gotham City'})
+        body = response.json()
+        self.assertEqual((sorted(body['weather']), body['failed']), (['deosai'], ['atlantis', 'gotham city']))
+        self.assertEqual(self.server.hits, [('current.json', 'deosai')])
+
+    def test_slow_cities_are_pending_and_fill_the_cache(self):
+        self.server.delay['skardu'] = 0.5
+        started = time.monotonic()
+        result = weather.get_weather_batch(['hunza', 'skardu'], deadline=0.2)
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual((sorted(result['weather']), result['pending']), (['hunza'], ['skardu']))
+        self.wait_for(lambda: cache.get(weather._cache_key('skardu')) is not None)
+
+
+class ForecastTests(WeatherStubMixin, TestCase):
+    def test_page_views_only_read_the_cache(self):
+        package = make_package(make_company(), 'Skardu Lakes', destination_names='Skardu, Shigar')
+        self.server.delay['skardu'] = 0.5
+        started = time.monotonic()
+        response = self.client.get(f'/packages/package/{package.slug}/')
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual(response.context['forecast'], [])
+        self.client.get(f'/packages/package/{package.slug}/')  # Fetch already in flight
+
+        key = weather._forecast_key('skardu', timezone.localdate().isoformat())
+        self.wait_for(lambda: cache.get(key) is not None)
+        response = self.client.get(f'/packages/package/{package.slug}/')
+        self.assertEqual(len(response.context['forecast']), weather.FORECAST_DAYS)
+        self.assertEqual(self.hits_for('skardu'), [('forecast.json', 'skardu')])
+
+    def test_dates_entering_the_window_are_fetched(self):
+        today = timezone.localdate()
+        window = [today + timedelta(days=offset) for offset in range(weather.FORECAST_DAYS)]
+        self.assertEqual(weather.get_forecasts([('Naran', day) for day in window], deadline=2), {
+            ('Naran', day): mock.ANY for day in window
+        })
+        self.assertEqual(weather.get_forecasts([('Naran', today + timedelta(days=30))]), {})
+
+        tomorrow = today + timedelta(days=1)
+        new_day = tomorrow + timedelta(days=weather.FORECAST_DAYS - 1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            self.assertEqual(weather.get_forecasts([('naran', new_day)]), {})
+            key = weather._forecast_key('naran', new_day.isoformat())
+            self.wait_for(lambda: cache.get(key) is not None)
+            self.assertEqual(weather.get_forecast('naran', new_day)['date'], new_day.isoformat())
+        self.assertEqual(len(self.hits_for('naran')), 2)
+
+
+class GeoIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def haversine(lat1, lon1, lat2, lon2):
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+    def test_queries_match_brute_force(self):
+        rng = random.Random(7)
+        points = [(rng.uniform(23, 37), rng.uniform(60, 78)) for _ in range(300)]
+        points += [(rng.uniform(-5, 5), rng.choice((-179.9, 179.9))) for _ in range(20)]  # Across the date line
+        index = GeoIndex(
+            [{'id': i, 'name': f'D{i}', 'city': '', 'latitude': lat, 'longitude': lon}
+             for i, (lat, lon) in enumerate(points)],
+            [],
+        )
+        for latitude, longitude, radius in ((35.9, 74.3, 150), (30, 70, 400), (0, 180, 300), (36, 72, 0.5)):
+            expected = sorted(
+                i for i, (lat, lon) in enumerate(points)
+                if self.haversine(latitude, longitude, lat, lon) <= radius
+            )
+            self.assertEqual(sorted(i for i, _ in index.within(latitude, longitude, radius)), expected)
+
+            hits = index.nearest(latitude, longitude, 5, exclude=0)
+            brute = sorted(
+                (self.haversine(latitude, longitude, lat, lon), i) for i, (lat, lon) in enumerate(points) if i
+            )[:5]
+            self.assertEqual([i for i, _ in hits], [i for _, i in brute])
+            for (_, distance), (expected_distance, _) in zip(hits, brute):
+                self.assertAlmostEqual(distance, expected_distance, places=6)
+
+    def test_index_follows_catalog_changes(self):
+        hunza = Destination.objects.create(
+            name='Hunza', description='Valley', city='Karimabad', latitude=Decimal('36.3167'), longitude=Decimal('74.65'),
+        )
+        Destination.objects.create(
+            name='Skardu', description='Lakes', city='Skardu', latitude=Decimal('35.2971'), longitude=Decimal('75.6333'),
+        )
+        package = make_package(make_company(), 'Karimabad Walks', destination_names='Karimabad, Lahore')
+        self.assertEqual(len(get_geo_index()), 2)
+
+        response = self.client.get('/content/api/nearby/', {'destination': hunza.id, 'packages': '1'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([d['name'] for d in body['destinations']], ['Skardu'])
+        self.assertAlmostEqual(body['destinations'][0]['distance_km'], 143, delta=3)
+        self.assertEqual([p['slug'] for p in body['packages']], [package.slug])
+
+        Destination.objects.create(
+            name='Gilgit', description='City', city='Gilgit', latitude=Decimal('35.9208'), longitude=Decimal('74.3144'),
+        )
+        response = self.client.get('/content/api/nearby/', {'lat': '36.3', 'lon': '74.6', 'radius': '60'})
+        self.assertEqual([d['name'] for d in response.json()['destinations']], ['Hunza', 'Gilgit'])
+
+        for params in ({'lat': 'nan', 'lon': '74'}, {'lat': '36', 'lon': '74', 'radius': '5000'},
+                       {'lat': '36', 'lon': '74', 'limit': '0'}, {'lat': '95', 'lon': '74'}, {}):
+            self.assertEqual(self.client.get('/content/api/nearby/', params).status_code, 400, params)
@@ -0,0 +1,168 @@
+"""
+Multi-destination trip cost optimizer.
+
+Given a group size, a budget and candidate destinations, find the plans
+that give the most destinations and days for the money. Every destination
+can be skipped or visited for min_days up to min_days + EXTRA_DAYS, so 20
+candidates already allow ~10^15 itineraries. Rather than enumerating them,
+the optimizer keeps a (destinations covered x total days) table of the
+cheapest plan found so far and folds in one destination at a time. Each
+step is a single NumPy broadcast over all stay options, and the result is
+exact. The Pareto-best plans are then read off the table: no other plan
+covers at least as many destinations and days for less money.
+
+Cost components are priced from their free-text unit (see component_basis).
+"""
+import numpy as np
+
+from .models import CostComponent, Destination
+
+EXTRA_DAYS = 4  # Stay options per destination: min_days .. min_days + EXTRA_DAYS
+MAX_CANDIDATES = 30
+MAX_TRIP_DAYS = 60  # The DP tables grow with the day limit, so it is always bounded
+MAX_PLANS = 25
+
+PER_DAY_WORDS = ('night', 'day')
+PER_PERSON_WORDS = ('person', 'head', 'pax', 'people')
+
+
+def component_basis(unit):
+    """
+    Interpret a CostComponent unit such as "night", "person/day" or "trip".
+
+    Returns:
+        (per_person, per_day) booleans; units matching neither word list
+        are one-off charges for the whole group
+    """
+    unit = (unit or '').lower()
+    return (
+        any(word in unit for word in PER_PERSON_WORDS),
+        any(word in unit for word in PER_DAY_WORDS),
+    )
+
+
+def destination_costs(components, group_size):
+    """
+    Split a destination's components into a daily and a one-off cost.
+
+    Returns:
+        (cost per day, fixed cost) for the whole group
+    """
+    per_day = fixed = 0.0
+    for component in components:
+        per_person, daily = component_basis(component.unit)
+        cost = float(component.base_cost) * (group_size if per_person else 1)
+        if daily:
+            per_day += cost
+        else:
+            fixed += cost
+    return per_day, fixed
+
+
+def pareto_plans(per_day, fixed, min_days, budget, max_days=None, extra_days=EXTRA_DAYS, limit=None):
+    """
+    Exact Pareto frontier of (cost, destinations covered, days).
+
+    Args:
+        per_day, fixed, min_days: arrays with one entry per destination
+        budget: upper bound on total cost
+        max_days: upper bound on total trip length, at most MAX_TRIP_DAYS
+        limit: only reconstruct this many of the cheapest plans
+
+    Returns:
+        list of plans sorted by cost; each plan is a dict with cost, days
+        and stops, a list of (destination index, days)
+    """
+    per_day = np.asarray(per_day, dtype=np.float64)
+    fixed = np.asarray(fixed, dtype=np.float64)
+    min_days = np.maximum(np.asarray(min_days, dtype=np.int64), 1)
+    count = len(per_day)
+
+    # stays[i, k] days at destination i cost costs[i, k]
+    stays = min_days[:, None] + np.arange(extra_days + 1)[None, :]
+    costs = per_day[:, None] * stays + fixed[:, None]
+    max_days = MAX_TRIP_DAYS if max_days is None else min(int(max_days), MAX_TRIP_DAYS)
+    day_limit = min(int(stays[:, -1].sum()), max_days)
+
+    # best[n, d]: cheapest way to cover n destinations in exactly d days
+    best = np.full((count + 1, day_limit + 1), np.inf)
+    best[0, 0] = 0.0
+    choices = np.full((count, count + 1, day_limit + 1), -1, dtype=np.int8)
+
+    for i in range(count):
+        candidates = np.full((extra_days + 1,) + best.shape, np.inf)
+        for k, days in enumerate(stays[i]):
+            if days <= day_limit:
+                candidates[k, 1:, days:] = best[:-1, :day_limit + 1 - days] + costs[i, k]
+        option = candidates.argmin(axis=0)
+        cheapest = np.take_along_axis(candidates, option[None], axis=0)[0]
+        improved = (cheapest < best) & (cheapest <= budget)
+        best = np.where(improved, cheapest, best)
+        choices[i][improved] = option[improved]
+
+    # A cell is Pareto-best when no cell with at least as many destinations
+    # and days is as cheap; suffix minima give that bound for every cell at once
+    suffix = np.minimum.accumulate(np.minimum.accumulate(best[::-1, ::-1], axis=0), axis=1)[::-1, ::-1]
+    bound = np.full(best.shape, np.inf)
+    bound[:-1, :] = suffix[1:, :]
+    bound[:, :-1] = np.minimum(bound[:, :-1], suffix[:, 1:])
+    frontier = np.argwhere(np.isfinite(best) & (best < bound) & (np.arange(count + 1) > 0)[:, None])
+    frontier = sorted(frontier.tolist(), key=lambda cell: (best[cell[0], cell[1]], -cell[0]))[:limit]
+
+    plans = []
+    for covered, days in frontier:
+        stops = []
+        n, d = covered, days
+        for i in range(count - 1, -1, -1):
+            k = choices[i, n, d]
+            if k >= 0:
+                stops.append((i, int(stays[i, k])))
+                n, d = n - 1, d - stays[i, k]
+        plans.append({'cost': float(best[covered, days]), 'days': days, 'stops': stops[::-1]})
+    return plans
+
+
+def optimize_trip(destination_ids, group_size, budget, max_days=None, limit=MAX_PLANS):
+    """
+    Pareto-best itineraries over the given active destinations.
+
+    Returns:
+        list of plan dicts ready for JSON, cheapest first
+    """
+    destinations = list(
+        Destination.objects.filter(id__in=destination_ids, is_active=True).order_by('id')
+    )
+    components = {}
+    for component in CostComponent.objects.filter(destination__in=destinations):
+        components.setdefault(component.destination_id, []).append(component)
+
+    vectors = [destination_costs(components.get(d.id, []), group_size) for d in destinations]
+    plans = pareto_plans(
+        per_day=[v[0] for v in vectors],
+        fixed=[v[1] for v in vectors],
+        min_days=[d.min_days for d in destinations],
+        budget=budget,
+        max_days=max_days,
+        limit=limit,
+    )
+
+    results = []
+    for plan in plans:
+        stops = []
+        for index, days in plan['stops']:
+            destination = destinations[index]
+            per_day, fixed = vectors[index]
+            stops.append({
+                'destination_id': destination.id,
+                'name': destination.name,
+                'days': days,
+                'cost': round(per_day * days + fixed, 2),
+            })
+        results.append({
+            'total_cost': round(plan['cost'], 2),
+            'per_person': round(plan['cost'] / group_size, 2),
+            'days': plan['days'],
+            'destinations_covered': len(stops),
+            'stops': stops,
+        })
+    return results
@@ -10,15 +10,23 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('calculator/', views.custom_package, name='cost_calculator'),
     path('custom-package/', views.custom_package, name='custom_package'),
+    path('custom-package/rates/', views.custom_package_rates, name='custom_package_rates'),
+    path('custom-package/rates/<slug:destination>/grid/', views.custom_package_quote_grid, name='custom_package_quote_grid'),
     path('custom-package/payment/<int:order_id>/', views.custom_package_payment, name='custom_package_payment'),
     path('custom-package/create-payment-intent/<int:order_id>/', views.create_payment_intent, name='create_payment_intent'),
     path('custom-package/payment-success/<int:order_id>/', views.payment_success, name='payment_success'),
     path('custom-package/confirmation/<int:order_id>/', views.custom_package_confirmation, name='custom_package_confirmation'),
     path('my-custom-packages/', views.my_custom_packages, name='my_custom_packages'),
     path('api/destination-costs/', views.get_destination_costs, name='get_destination_costs'),
+    path('api/cost-catalog/', views.cost_catalog, name='cost_catalog'),
+    path('api/nearby/', views.nearby_api, name='nearby_api'),
+    path('api/trip-optimizer/', views.trip_optimizer_api, name='trip_optimizer_api'),
     path('api/admin-notifications/', views.admin_notifications_api, name='admin_notifications_api'),
     path('api/mark-notification-read/<int:notification_id>/', views.mark_notification_read, name='mark_notification_read'),
+    path('api/mark-notifications-read/', views.mark_notifications_read_api, name='mark_notifications_read'),
     path('check-weather/', views.check_weather, name='check_weather'),
+    path('api/weather/', views.weather_batch_api, name='weather_batch'),
+    path('images/derivative/', views.image_derivative, name='image_derivative'),
     
     # Cart and Order URLs
     path('cart/', views.view_cart, name='view_cart'),
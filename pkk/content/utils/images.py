@@ -0,0 +1,236 @@
+"""
+Image derivative pipeline.
+
+Uploaded images (up to 5 MB each) are resized into WebP and JPEG
+derivatives at fixed widths so listing pages can serve a few kilobytes per
+card instead of the original upload. Derivatives are content-addressed:
+they live under derivatives/<digest>/ where digest is the SHA-256 of the
+source bytes, so identical uploads share files and a replaced image never
+serves stale derivatives.
+
+Each source's manifest (its digest and the widths produced) is written to
+derivatives/manifests/ next to the files, so it survives restarts and cache
+evictions; the cache only sits in front of it.
+
+Generation normally happens in a background thread right after upload (see
+content.signals). Anything still missing is generated lazily the first time
+a browser asks for it through the image_derivative view. A cache.add lock
+per source makes sure only one worker builds a given image at a time.
+"""
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 1024)
+DERIVATIVE_FORMATS = {
+    # format name: (file extension, Pillow save options)
+    'webp': ('webp', {'format': 'WEBP', 'quality': 78, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVES_ROOT = 'derivatives'
+MANIFESTS_ROOT = f'{DERIVATIVES_ROOT}/manifests'
+MANIFEST_CACHE_TIMEOUT = 60 * 60 * 24
+UNUSABLE_SOURCE_TIMEOUT = 60 * 60
+GENERATION_LOCK_TIMEOUT = 60  # Longer than resizing the largest allowed upload
+SIGNER_SALT = 'content.image_derivative'
+
+# Models whose image fields get derivatives, as (app_label.Model, field name)
+IMAGE_FIELDS = [
+    ('content.Destination', 'image'),
+    ('content.DestinationImage', 'image'),
+    ('content.Product', 'image'),
+    ('packages.Package', 'image'),
+    ('packages.Company', 'logo'),
+    ('users.CustomUser', 'avatar'),
+]
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _source_hash(source_name):
+    return hashlib.md5(source_name.encode('utf-8')).hexdigest()
+
+
+def _manifest_key(source_name):
+    return 'image_derivatives:' + _source_hash(source_name)
+
+
+def manifest_name(source_name):
+    source_hash = _source_hash(source_name)
+    return f'{MANIFESTS_ROOT}/{source_hash[:2]}/{source_hash}.json'
+
+
+def _read_manifest(source_name):
+    try:
+        with default_storage.open(manifest_name(source_name), 'rb') as stored:
+            return json.loads(stored.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(source_name, manifest):
+    name = manifest_name(source_name)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(json.dumps(manifest).encode('utf-8')))
+
+
+def get_manifest(source_name):
+    """
+    Return the derivative manifest for a stored image, or None if the
+    derivatives have not been generated yet.
+
+    The manifest is a dict with the source digest and the widths that
+    were produced (never wider than the source itself). Sources that could
+    not be decoded get a short-lived manifest with no widths so callers
+    fall back to the original file instead of retrying on every render.
+    """
+    if not source_name:
+        return None
+    key = _manifest_key(source_name)
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = _read_manifest(source_name)
+        if manifest is not None:
+            cache.set(key, manifest, timeout=MANIFEST_CACHE_TIMEOUT)
+    return manifest
+
+
+def derivative_name(digest, width, fmt):
+    extension = DERIVATIVE_FORMATS[fmt][0]
+    return f'{DERIVATIVES_ROOT}/{digest[:2]}/{digest}/{width}.{extension}'
+
+
+def derivative_url(manifest, width, fmt):
+    return default_storage.url(derivative_name(manifest['digest'], width, fmt))
+
+
+def _target_widths(source_width):
+    widths = [w for w in DERIVATIVE_WIDTHS if w < source_width]
+    widths.append(min(source_width, DERIVATIVE_WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def _encode(image, width, fmt):
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image.copy()
+    if fmt == 'jpeg' and resized.mode != 'RGB':
+        # JPEG has no alpha channel, flatten onto white
+        background = Image.new('RGB', resized.size, (255, 255, 255))
+        if resized.mode in ('RGBA', 'LA'):
+            background.paste(resized, mask=resized.getchannel('A'))
+        else:
+            background.paste(resized.convert('RGB'))
+        resized = background
+    buffer = BytesIO()
+    resized.save(buffer, **DERIVATIVE_FORMATS[fmt][1])
+    return buffer.getvalue()
+
+
+def _unusable(source_name):
+    manifest = {'digest': None, 'widths': []}
+    cache.set(_manifest_key(source_name), manifest, timeout=UNUSABLE_SOURCE_TIMEOUT)
+    return manifest
+
+
+def generate_derivatives(source_name):
+    """
+    Create every missing derivative for a stored image.
+
+    Safe to call repeatedly: existing content-addressed files are reused,
+    so only the manifest is rewritten.
+
+    Returns:
+        The manifest dict (with no widths if the source is not an image),
+        or None when another worker is generating this image right now
+    """
+    lock_key = f'{_manifest_key(source_name)}:lock'
+    if not cache.add(lock_key, 1, timeout=GENERATION_LOCK_TIMEOUT):
+        return None
+    try:
+        return _generate(source_name)
+    finally:
+        cache.delete(lock_key)
+
+
+def _generate(source_name):
+    try:
+        with default_storage.open(source_name, 'rb') as source:
+            data = source.read()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Image derivatives: cannot read {source_name}: {e}")
+        return _unusable(source_name)
+
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        image = Image.open(BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Image derivatives: {source_name} is not a readable image: {e}")
+        return _unusable(source_name)
+
+    widths = _target_widths(image.width)
+    for width in widths:
+        for fmt in DERIVATIVE_FORMATS:
+            name = derivative_name(digest, width, fmt)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(_encode(image, width, fmt)))
+
+    manifest = {'digest': digest, 'widths': widths}
+    _write_manifest(source_name, manifest)
+    cache.set(_manifest_key(source_name), manifest, timeout=MANIFEST_CACHE_TIMEOUT)
+    logger.info(f"Image derivatives ready for {source_name} ({len(widths)} widths)")
+    return manifest
+
+
+def _generate_in_background(source_name):
+    try:
+        generate_derivatives(source_name)
+    except Exception as e:
+        logger.error(f"Image derivatives failed for {source_name}: {str(e)}", exc_info=True)
+    finally:
+        with _pending_lock:
+            _pending.discard(source_name)
+
+
+def schedule_derivatives(source_name):
+    """Queue derivative generation on the background worker pool"""
+    if not source_name:
+        return
+    with _pending_lock:
+        if source_name in _pending:
+            return
+        _pending.add(source_name)
+    _executor.submit(_generate_in_background, source_name)
+
+
+def get_source_name(source):
+    """Accept an ImageFieldFile or a stored file name"""
+    if not source:
+        return ''
+    return getattr(source, 'name', source) or ''
+
+
+def sign_source_name(source_name):
+    """Signed token for lazy derivative URLs, so only stored names are served"""
+    return Signer(salt=SIGNER_SALT).sign(source_name)
+
+
+def unsign_source_name(token):
+    """Raises django.core.signing.BadSignature for tampered tokens"""
+    return Signer(salt=SIGNER_SALT).unsign(token)
@@ -1,11 +1,67 @@
+"""
+WeatherAPI.com client.
+
+All calls go through one pooled requests.Session with connect/read
+timeouts, so a slow upstream can hold a worker for at most a few seconds.
+Results are cached with two lifetimes:
+
+- SOFT_TTL: fresh data is returned straight from the cache.
+- HARD_TTL: stale data is still returned immediately, and a background
+  worker refreshes it (one refresh per city across all processes).
+
+Failed lookups are cached briefly (NEGATIVE_TTL) so a bad city or an
+outage is not retried on every request. Repeated upstream failures open
+a circuit breaker shared through the cache. While it is open, no requests
+are sent for BREAKER_COOLDOWN seconds and callers get stale data or None.
+
+prefetch_weather() (run by the prefetch_weather management command from
+cron) refreshes every known city before its entry goes stale, so
+user-facing reads are cache hits.
+
+Forecasts are cached per (city, date): one forecast.json call fills every
+day in the FORECAST_DAYS window, so a page listing many bookings costs at
+most one upstream call per distinct city (see get_forecasts). Pages never
+wait for that call: missing cities are fetched in the background and show
+up on the next request.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from datetime import timedelta
+from urllib.parse import quote
+
 import requests
-from datetime import datetime
-from django.core.cache import cache
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
 
 # WeatherAPI.com configuration
 API_KEY = getattr(settings, 'WEATHERAPI_KEY', '51669905e0fc4974b5b131221251012')
 BASE_URL = 'http://api.weatherapi.com/v1/current.json'
+FORECAST_URL = 'http://api.weatherapi.com/v1/forecast.json'
+FORECAST_DAYS = getattr(settings, 'WEATHERAPI_FORECAST_DAYS', 3)  # The free plan serves 3 days
+
+REQUEST_TIMEOUT = (3.05, 5)  # (connect, read) seconds
+SOFT_TTL = 60 * 15  # Serve without refreshing for 15 minutes
+HARD_TTL = 60 * 60 * 3  # Serve stale (while refreshing) for up to 3 hours
+NEGATIVE_TTL = 60  # Remember failed lookups for a minute
+FORECAST_TTL = 60 * 60 * 3
+REFRESH_LOCK_TTL = 30
+BREAKER_THRESHOLD = 5  # Upstream failures within BREAKER_WINDOW that open the breaker
+BREAKER_WINDOW = 60
+BREAKER_COOLDOWN = 60
+
+PREFETCH_WORKERS = 8
+BATCH_MAX_CITIES = 20
+BATCH_DEADLINE = 2.0  # Seconds a batch request waits for upstream misses
+PREFETCH_AGE = SOFT_TTL - 60 * 5  # Refresh entries older than this (schedule the job at least this often)
+
+BREAKER_FAILURES_KEY = 'weather:breaker:failures'
+BREAKER_OPEN_KEY = 'weather:breaker:open'
 
 # Pakistan cities mapping for accurate results
 PAKISTAN_CITIES = {
@@ -27,48 +83,428 @@ PAKISTAN_CITIES = {
     'rawalpindi': 'Rawalpindi, Pakistan',
 }
 
-def get_weather_data(city):
-    # Normalize city name for consistent caching
-    city_normalized = city.strip().lower()
-    
-    # Use Pakistan-specific location if available
-    api_query = PAKISTAN_CITIES.get(city_normalized, f"{city}, Pakistan")
-    
-    # Check cache first
-    cache_key = f'weather_{city_normalized}'
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return cached_data
-
-    # Make API request if not in cache
-    params = {
-        'key': API_KEY,
-        'q': api_query,
-        'aqi': 'no'
+
+class WeatherError(Exception):
+    """
+    A failed weather lookup.
+
+    upstream is True for outages (timeouts, 5xx, connection errors), which
+    count towards the circuit breaker, and False for bad requests such as
+    an unknown city.
+    """
+
+    def __init__(self, message, upstream=True):
+        super().__init__(message)
+        self.upstream = upstream
+
+
+def _build_session():
+    session = requests.Session()
+    # Retries are left to the cache and breaker instead of blocking the caller
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = _build_session()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='weather-refresh')
+# Shared by batch requests; fetches that miss a deadline finish here and fill the cache
+_batch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='weather-batch')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def normalize_city(city):
+    return city.strip().lower()
+
+
+def _cache_key(city):
+    # Quote so multi-word cities stay valid memcached keys
+    return f'weather:{quote(city)}'
+
+
+def _error_key(city):
+    return f'weather:error:{quote(city)}'
+
+
+def _forecast_key(city, date):
+    return f'weather:forecast:{quote(city)}:{date}'
+
+
+def _forecast_fetched_key(city):
+    # Set with every fetch so dates the response lacked are not re-requested.
+    # Keyed on the window's first day, so a date entering the window is fetched
+    return f'weather:forecast:fetched:{quote(city)}:{timezone.localdate().isoformat()}'
+
+
+def _forecast_error_key(city):
+    return f'weather:forecast:error:{quote(city)}'
+
+
+def breaker_is_open():
+    return cache.get(BREAKER_OPEN_KEY) is not None
+
+
+def _record_failure():
+    cache.add(BREAKER_FAILURES_KEY, 0, timeout=BREAKER_WINDOW)
+    try:
+        failures = cache.incr(BREAKER_FAILURES_KEY)
+    except ValueError:
+        return
+    if failures >= BREAKER_THRESHOLD and cache.add(BREAKER_OPEN_KEY, True, timeout=BREAKER_COOLDOWN):
+        logger.warning(f"Weather API circuit breaker opened after {failures} failures")
+
+
+def _record_success():
+    cache.delete(BREAKER_FAILURES_KEY)
+
+
+def parse_current(data):
+    current = data['current']
+    return {
+        'temperature': round(current['temp_c'], 1),
+        'feels_like': round(current['feelslike_c'], 1),
+        'humidity': current['humidity'],
+        'description': current['condition']['text'],
+        'icon': current['condition']['icon'],
+        'wind_speed': round(current['wind_kph'] / 3.6, 1),  # Convert kph to m/s
+        'last_updated': current['last_updated'],
+        'city_name': data['location']['name'],  # Get the actual city name from API
+        'country': data['location']['country'],
+        'region': data['location'].get('region', ''),
+    }
+
+
+def parse_forecast_day(forecastday):
+    day = forecastday['day']
+    return {
+        'date': forecastday['date'],
+        'max_temp': round(day['maxtemp_c'], 1),
+        'min_temp': round(day['mintemp_c'], 1),
+        'humidity': day['avghumidity'],
+        'chance_of_rain': day.get('daily_chance_of_rain', 0),
+        'description': day['condition']['text'],
+        'icon': day['condition']['icon'],
+        'wind_speed': round(day['maxwind_kph'] / 3.6, 1),  # Convert kph to m/s
     }
-    
+
+
+def api_get(url, params):
+    """
+    GET a WeatherAPI endpoint through the pooled session.
+
+    Returns:
+        Decoded JSON body
+
+    Raises:
+        WeatherError: on timeouts, connection errors or non-200 responses
+    """
     try:
-        response = requests.get(BASE_URL, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            weather_info = {
-                'temperature': round(data['current']['temp_c'], 1),
-                'feels_like': round(data['current']['feelslike_c'], 1),
-                'humidity': data['current']['humidity'],
-                'description': data['current']['condition']['text'],
-                'icon': data['current']['condition']['icon'],
-                'wind_speed': round(data['current']['wind_kph'] / 3.6, 1),  # Convert kph to m/s
-                'last_updated': data['current']['last_updated'],
-                'city_name': data['location']['name'],  # Get the actual city name from API
-                'country': data['location']['country'],
-                'region': data['location'].get('region', '')
-            }
-            # Cache for 15 minutes (shorter for more accurate data)
-            cache.set(cache_key, weather_info, timeout=900)
-            return weather_info
-        else:
-            print(f"Weather API error: {response.status_code} - {response.text}")
-            return None
+        response = _session.get(url, params={'key': API_KEY, **params}, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        raise WeatherError(f'{type(e).__name__}: {e}')
+    if response.status_code != 200:
+        # WeatherAPI answers 400 for unknown locations; only 5xx/429 mean the service is struggling
+        upstream = response.status_code >= 500 or response.status_code == 429
+        raise WeatherError(f'HTTP {response.status_code}: {response.text[:200]}', upstream=upstream)
+    try:
+        return response.json()
+    except ValueError:
+        raise WeatherError('Invalid JSON in weather response')
+
+
+def fetch_weather(city):
+    """
+    Fetch current weather from the API and cache it.
+
+    Failures are logged, counted by the circuit breaker when upstream and
+    negatively cached.
+
+    Returns:
+        weather dict, or None on failure
+    """
+    api_query = PAKISTAN_CITIES.get(city, f"{city}, Pakistan")
+    try:
+        weather_info = parse_current(api_get(BASE_URL, {'q': api_query, 'aqi': 'no'}))
+    except (WeatherError, KeyError, TypeError) as e:
+        upstream = getattr(e, 'upstream', True)
+        logger.warning(f"Weather lookup failed for {city}: {e}")
+        if upstream:
+            _record_failure()
+        cache.set(_error_key(city), str(e), timeout=NEGATIVE_TTL)
+        return None
+
+    _record_success()
+    cache.set(_cache_key(city), {'data': weather_info, 'fetched_at': time.time()}, timeout=HARD_TTL)
+    cache.delete(_error_key(city))
+    return weather_info
+
+
+def fetch_forecast(city):
+    """
+    Fetch the FORECAST_DAYS forecast for a city and cache every day separately.
+
+    Failures are handled like fetch_weather's.
+
+    Returns:
+        dict of ISO date -> forecast day, or None on failure
+    """
+    api_query = PAKISTAN_CITIES.get(city, f"{city}, Pakistan")
+    try:
+        data = api_get(FORECAST_URL, {'q': api_query, 'days': FORECAST_DAYS, 'aqi': 'no', 'alerts': 'no'})
+        days = {item['date']: parse_forecast_day(item) for item in data['forecast']['forecastday']}
+    except (WeatherError, KeyError, TypeError) as e:
+        upstream = getattr(e, 'upstream', True)
+        logger.warning(f"Forecast lookup failed for {city}: {e}")
+        if upstream:
+            _record_failure()
+        cache.set(_forecast_error_key(city), str(e), timeout=NEGATIVE_TTL)
+        return None
+
+    _record_success()
+    entries = {_forecast_key(city, date): day for date, day in days.items()}
+    entries[_forecast_fetched_key(city)] = time.time()
+    cache.set_many(entries, timeout=FORECAST_TTL)
+    cache.delete(_forecast_error_key(city))
+    return days
+
+
+def _refresh_in_background(city):
+    try:
+        fetch_weather(city)
     except Exception as e:
-        print(f"Error fetching weather data: {e}")
-        return None
\ No newline at end of file
+        logger.error(f"Weather refresh failed for {city}: {str(e)}", exc_info=True)
+    finally:
+        cache.delete(f'weather:refreshing:{quote(city)}')
+        with _pending_lock:
+            _pending.discard(city)
+
+
+def _fetch_forecast_in_background(city):
+    try:
+        fetch_forecast(city)
+    except Exception as e:
+        logger.error(f"Forecast refresh failed for {city}: {str(e)}", exc_info=True)
+    finally:
+        cache.delete(f'weather:forecast:refreshing:{quote(city)}')
+
+
+def schedule_forecast(city):
+    """Fetch a city's forecast on the background pool, once across processes"""
+    if cache.add(f'weather:forecast:refreshing:{quote(city)}', True, timeout=REFRESH_LOCK_TTL):
+        _batch_executor.submit(_fetch_forecast_in_background, city)
+
+
+def schedule_refresh(city):
+    """Refresh a city's weather on the background pool, once across processes"""
+    with _pending_lock:
+        if city in _pending:
+            return
+        if not cache.add(f'weather:refreshing:{quote(city)}', True, timeout=REFRESH_LOCK_TTL):
+            return
+        _pending.add(city)
+    _executor.submit(_refresh_in_background, city)
+
+
+def get_cached_weather(city):
+    """
+    Cached weather without any network call.
+
+    Returns:
+        (weather dict or None, is_stale)
+    """
+    entry = cache.get(_cache_key(normalize_city(city)))
+    if entry is None:
+        return None, False
+    return entry['data'], time.time() - entry['fetched_at'] > SOFT_TTL
+
+
+def get_weather_data(city):
+    """
+    Current weather for a city, served from the cache whenever possible.
+
+    Returns:
+        weather dict, or None when no data is available
+    """
+    city_normalized = normalize_city(city)
+    if not city_normalized:
+        return None
+
+    data, is_stale = get_cached_weather(city_normalized)
+    if data is not None:
+        if is_stale and not breaker_is_open():
+            schedule_refresh(city_normalized)
+        return data
+
+    if breaker_is_open() or cache.get(_error_key(city_normalized)) is not None:
+        return None
+    return fetch_weather(city_normalized)
+
+
+def get_prefetch_cities():
+    """Every PAKISTAN_CITIES key plus every active destination's city, deduplicated"""
+    from content.models import Destination
+
+    cities = set(PAKISTAN_CITIES)
+    destination_cities = Destination.objects.filter(is_active=True).exclude(city='').values_list('city', flat=True)
+    cities.update(normalize_city(city) for city in destination_cities)
+    cities.discard('')
+    return sorted(cities)
+
+
+def prefetch_weather(cities=None, max_workers=PREFETCH_WORKERS, max_age=PREFETCH_AGE):
+    """
+    Refresh cached weather for many cities concurrently.
+
+    Cities whose entry is younger than max_age are skipped. Work stops
+    being submitted once the circuit breaker opens.
+
+    Returns:
+        dict of city lists: refreshed, failed, skipped
+    """
+    cities = get_prefetch_cities() if cities is None else sorted({normalize_city(c) for c in cities} - {''})
+    summary = {'refreshed': [], 'failed': [], 'skipped': []}
+
+    due = []
+    for city in cities:
+        entry = cache.get(_cache_key(city))
+        if entry is not None and time.time() - entry['fetched_at'] < max_age:
+            summary['skipped'].append(city)
+        else:
+            due.append(city)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='weather-prefetch') as pool:
+        futures = {}
+        for city in due:
+            if breaker_is_open():
+                summary['skipped'].append(city)
+                continue
+            futures[pool.submit(fetch_weather, city)] = city
+        for future in as_completed(futures):
+            city = futures[future]
+            summary['refreshed' if future.result() is not None else 'failed'].append(city)
+
+    logger.info(
+        f"Weather prefetch: {len(summary['refreshed'])} refreshed, "
+        f"{len(summary['failed'])} failed, {len(summary['skipped'])} skipped"
+    )
+    return summary
+
+
+def get_weather_batch(cities, deadline=BATCH_DEADLINE):
+    """
+    Weather for several cities within a time budget.
+
+    Only known cities (get_prefetch_cities) are looked up; any other name
+    is reported as failed without an upstream call, so made-up names cannot
+    run up API usage. Cache hits are answered immediately; misses are
+    fetched concurrently and whatever has not arrived by the deadline is
+    reported as pending (the fetch keeps running and fills the cache for
+    the next request).
+
+    Returns:
+        dict with 'weather' (city -> data), 'pending' and 'failed' lists
+    """
+    result = {'weather': {}, 'pending': [], 'failed': []}
+    known = set(get_prefetch_cities())
+    misses = []
+    for city in dict.fromkeys(normalize_city(c) for c in cities):
+        if not city:
+            continue
+        if city not in known:
+            result['failed'].append(city)
+            continue
+        data, is_stale = get_cached_weather(city)
+        if data is not None:
+            result['weather'][city] = data
+            if is_stale and not breaker_is_open():
+                schedule_refresh(city)
+        elif breaker_is_open() or cache.get(_error_key(city)) is not None:
+            result['failed'].append(city)
+        else:
+            misses.append(city)
+
+    if misses:
+        futures = {_batch_executor.submit(fetch_weather, city): city for city in misses}
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            city = futures[future]
+            data = future.result()
+            if data is not None:
+                result['weather'][city] = data
+            else:
+                result['failed'].append(city)
+        result['pending'] = sorted(futures[future] for future in not_done)
+    return result
+
+
+def in_forecast_range(day):
+    today = timezone.localdate()
+    return today <= day < today + timedelta(days=FORECAST_DAYS)
+
+
+def get_forecasts(requested, deadline=0):
+    """
+    Forecasts for many (city, date) pairs, e.g. one per booking.
+
+    Dates outside the forecast window are skipped without a lookup. Pairs
+    missing from the cache cost one concurrent forecast call per distinct
+    city; cities that have not answered by the deadline are left out and
+    fill the cache for the next request.
+
+    Args:
+        requested: iterable of (city, date) pairs
+        deadline: seconds to wait for missing cities; with 0 (page views)
+            only cached forecasts are returned and the fetches run in the background
+
+    Returns:
+        dict of (city, date) as passed in -> forecast day
+    """
+    pairs = {}
+    for city, day in requested:
+        city_normalized = normalize_city(city or '')
+        if city_normalized and day and in_forecast_range(day):
+            pairs[(city, day)] = _forecast_key(city_normalized, day.isoformat())
+    if not pairs:
+        return {}
+
+    cached = cache.get_many(pairs.values())
+    result = {pair: cached[key] for pair, key in pairs.items() if key in cached}
+    missing = {normalize_city(city) for city, day in pairs if (city, day) not in result}
+    if not missing or breaker_is_open():
+        return result
+
+    # A recent fetch or failure means the missing dates are simply not available
+    markers = cache.get_many(
+        [_forecast_fetched_key(city) for city in missing] + [_forecast_error_key(city) for city in missing]
+    )
+    due = [
+        city for city in sorted(missing)
+        if _forecast_fetched_key(city) not in markers and _forecast_error_key(city) not in markers
+    ]
+    if not due:
+        return result
+    if not deadline:
+        for city in due:
+            schedule_forecast(city)
+        return result
+
+    futures = {_batch_executor.submit(fetch_forecast, city): city for city in due}
+    done, _ = wait(futures, timeout=deadline)
+    fetched = {futures[future]: future.result() or {} for future in done}
+    for city, day in pairs:
+        days = fetched.get(normalize_city(city))
+        if days and (city, day) not in result and day.isoformat() in days:
+            result[(city, day)] = days[day.isoformat()]
+    return result
+
+
+def get_forecast(city, day):
+    """
+    Forecast for one city on one date.
+
+    Returns:
+        forecast day dict, or None when the date is out of range or not cached yet
+    """
+    return get_forecasts([(city, day)]).get((city, day))
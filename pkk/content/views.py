@@ -1,31 +1,58 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.core.signing import BadSignature
+from django.core.files.storage import default_storage
 from django.contrib import messages
 from django.db.models import F
-from decimal import Decimal
 from .models import Destination, Product, CostComponent, Cart, CartItem, Order, OrderItem, CustomPackageOrder, AdminNotification, ProductReview
 from packages.models import Company
-from .utils.weather import get_weather_data
+from .utils.weather import BATCH_MAX_CITIES as WEATHER_BATCH_MAX_CITIES, get_weather_batch, get_weather_data
+from .catalog import get_catalog_page, SORT_CHOICES
+from .home_feed import get_home_feed, get_home_products
+from .pricing import (
+    MIN_DAYS, MIN_PEOPLE, PricingError, get_rate_tables, get_rates_document, quote_custom_package,
+)
+from .quote_grid import get_quote_grid_document
+from .notifications import (
+    BULK_READ_LIMIT, get_unread_count, get_unread_notifications, mark_notification_read as mark_read, mark_notifications_read,
+    notify,
+)
+from .geo_index import (
+    MAX_RADIUS_KM as NEARBY_MAX_RADIUS_KM, MAX_RESULTS as NEARBY_MAX_RESULTS, NEARBY_SECTION_LIMIT,
+    NEARBY_SECTION_RADIUS_KM,
+    destinations_within, nearest_destinations, packages_near,
+)
+from .trip_optimizer import MAX_CANDIDATES as TRIP_MAX_CANDIDATES, MAX_TRIP_DAYS, optimize_trip
+from .cost_catalog import (
+    COST_CATALOG_MAX_DESTINATIONS, build_catalog_payload, get_cost_fragments, get_cost_stamps,
+)
+from .utils.images import (
+    DERIVATIVE_FORMATS, derivative_url, generate_derivatives, get_manifest, unsign_source_name,
+)
 from django.conf import settings
 from django.utils import timezone
 from users.security_utils import log_security_event
 import stripe
 import json
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 def home(request):
-    featured_destinations = Destination.objects.filter(is_featured=True, is_active=True)[:6]
-    companies = Company.objects.filter(is_active=True, approval_status='approved').order_by('name')
-    products = Product.objects.filter(is_active=True).order_by('-is_featured', 'name')
+    feed = get_home_feed()
     return render(request, 'content/home.html', {
-        'featured_destinations': featured_destinations,
-        'companies': companies,
-        'products': products
+        'featured_destinations': feed['featured_destinations'],
+        'companies': feed['companies'],
+        'products': get_home_products(feed),
+        'featured_packages': feed['featured_packages'],
     })
 
 def destination_list(request):
@@ -51,38 +78,71 @@ def destination_list(request):
 
 def destination_detail(request, pk):
     destination = get_object_or_404(Destination, pk=pk, is_active=True)
-    return render(request, 'content/destination_detail.html', {'destination': destination})
+    nearby = []
+    if destination.latitude is not None and destination.longitude is not None:
+        nearby = nearest_destinations(
+            float(destination.latitude), float(destination.longitude), NEARBY_SECTION_LIMIT,
+            max_km=NEARBY_SECTION_RADIUS_KM, exclude_id=destination.id,
+        )
+    return render(request, 'content/destination_detail.html', {'destination': destination, 'nearby': nearby})
+
+def nearby_api(request):
+    """
+    Destinations and packages near a point or a destination.
+
+    Query: lat and lon, or destination=<id>; radius in km (nearest `limit`
+    destinations when omitted); limit; packages=1 to include packages.
+    """
+    try:
+        destination_id = request.GET.get('destination')
+        if destination_id:
+            origin = get_object_or_404(Destination, pk=int(destination_id), is_active=True)
+            if origin.latitude is None or origin.longitude is None:
+                return JsonResponse({'error': 'Destination has no coordinates'}, status=400)
+            latitude, longitude = float(origin.latitude), float(origin.longitude)
+        else:
+            latitude, longitude = float(request.GET.get('lat', '')), float(request.GET.get('lon', ''))
+        radius = request.GET.get('radius')
+        radius = float(radius) if radius else None
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({'error': 'lat, lon, radius, limit and destination must be numbers'}, status=400)
+
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'lat or lon out of range'}, status=400)
+    if radius is not None and not 0 < radius <= NEARBY_MAX_RADIUS_KM:
+        return JsonResponse({'error': f'radius must be between 0 and {NEARBY_MAX_RADIUS_KM} km'}, status=400)
+    if not 1 <= limit <= NEARBY_MAX_RESULTS:
+        return JsonResponse({'error': f'limit must be between 1 and {NEARBY_MAX_RESULTS}'}, status=400)
+
+    exclude_id = int(destination_id) if destination_id else None
+    if radius is None:
+        destinations = nearest_destinations(latitude, longitude, limit, exclude_id=exclude_id)
+    else:
+        destinations = [
+            d for d in destinations_within(latitude, longitude, radius, limit=limit + 1) if d['id'] != exclude_id
+        ][:limit]
+    data = {'origin': {'latitude': latitude, 'longitude': longitude}, 'radius_km': radius, 'destinations': destinations}
+    if request.GET.get('packages') == '1':
+        package_radius = radius or max((d['distance_km'] for d in destinations), default=0)
+        data['packages'] = packages_near(latitude, longitude, package_radius, limit=limit)
+    return JsonResponse(data)
 
 def product_list(request):
-    # Get filter parameters
-    category = request.GET.get('category', '')
-    search_query = request.GET.get('search', '').strip()
-    
-    # Start with active AND approved products
-    products = Product.objects.filter(is_active=True, is_approved=True).order_by('-is_featured', 'name')
-    
-    # Apply category filter
-    if category:
-        products = products.filter(category=category)
-    
-    # Apply search filter
-    if search_query:
-        products = products.filter(name__icontains=search_query) | products.filter(description__icontains=search_query)
-    
-    # Get all categories for filter dropdown
-    categories = Product.CATEGORY_CHOICES if hasattr(Product, 'CATEGORY_CHOICES') else [
-        ('clothing', 'Clothing'),
-        ('food', 'Food & Beverages'),
-        ('handicrafts', 'Handicrafts'),
-        ('books', 'Books & Media'),
-        ('accessories', 'Accessories'),
-    ]
+    catalog = get_catalog_page(request.GET)
+    filters = catalog['filters']
+    page_obj = catalog['page_obj']
     
     return render(request, 'content/product_list.html', {
-        'products': products,
-        'categories': categories,
-        'selected_category': category,
-        'search_query': search_query,
+        'page_obj': page_obj,
+        'products': page_obj.object_list,
+        'facets': catalog['facets'],
+        'filters': filters,
+        'querystring': catalog['querystring'],
+        'sort_choices': SORT_CHOICES,
+        'categories': Product.CATEGORY_CHOICES,
+        'selected_category': filters['category'],
+        'search_query': filters['search'],
     })
 
 @login_required
@@ -94,25 +154,110 @@ def cost_calculator(request):
         'today': date.today().isoformat()
     })
 
+def _cost_catalog_response(request, destination_ids, wrap):
+    stamps, etag, last_modified = get_cost_stamps(destination_ids)
+    etag = quote_etag(etag)
+    # HTTP dates have one-second resolution
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    response = HttpResponse(wrap(stamps), content_type='application/json')
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
 def get_destination_costs(request):
     try:
         destination_id = request.GET.get('destination_id')
         if destination_id:
-            cost_components = CostComponent.objects.filter(destination_id=destination_id)
-            data = [{
-                'id': comp.id,
-                'name': comp.name,
-                'category': comp.category,
-                'base_cost': float(comp.base_cost),
-                'unit': comp.unit,
-                'description': comp.description
-            } for comp in cost_components]
-            return JsonResponse({'costs': data})
+            def wrap(stamps):
+                fragments = get_cost_fragments(stamps)
+                return '{"costs":' + (fragments[stamps[0][0]] if stamps else '[]') + '}'
+            return _cost_catalog_response(request, [int(destination_id)], wrap)
         return JsonResponse({'costs': []})
     except Exception as e:
         logger.error(f"Error fetching destination costs: {str(e)}")
         return JsonResponse({'error': 'Failed to fetch costs'}, status=500)
 
+def cost_catalog(request):
+    """Cost components for many destinations (?destinations=1,2,3 or all)"""
+    raw_ids = request.GET.get('destinations', '').strip()
+    destination_ids = None
+    if raw_ids:
+        try:
+            destination_ids = sorted({int(pk) for pk in raw_ids.split(',') if pk.strip()})
+        except ValueError:
+            return JsonResponse({'error': 'destinations must be a comma-separated list of ids'}, status=400)
+        if len(destination_ids) > COST_CATALOG_MAX_DESTINATIONS:
+            return JsonResponse(
+                {'error': f'At most {COST_CATALOG_MAX_DESTINATIONS} destinations per request'}, status=400
+            )
+    return _cost_catalog_response(request, destination_ids, build_catalog_payload)
+
+def weather_batch_api(request):
+    """Current weather for several cities (?cities=hunza,skardu,naran)"""
+    cities = [c for c in request.GET.get('cities', '').split(',') if c.strip()]
+    if not cities:
+        return JsonResponse({'error': 'Provide a comma-separated cities parameter'}, status=400)
+    if len(cities) > WEATHER_BATCH_MAX_CITIES:
+        return JsonResponse({'error': f'At most {WEATHER_BATCH_MAX_CITIES} cities per request'}, status=400)
+    return JsonResponse(get_weather_batch(cities))
+
+def trip_optimizer_api(request):
+    """Pareto-best multi-destination plans for a budget and group size"""
+    try:
+        budget = float(request.GET.get('budget', ''))
+        group_size = int(request.GET.get('people', ''))
+        max_days = request.GET.get('max_days')
+        max_days = int(max_days) if max_days else None
+        raw_ids = request.GET.get('destinations', '').strip()
+        destination_ids = [int(pk) for pk in raw_ids.split(',') if pk.strip()] if raw_ids else None
+    except ValueError:
+        return JsonResponse({'error': 'budget, people, max_days and destinations must be numbers'}, status=400)
+
+    if not math.isfinite(budget) or budget <= 0 or not 1 <= group_size <= 100:
+        return JsonResponse({'error': 'budget and people must be positive'}, status=400)
+    if max_days is not None and not 1 <= max_days <= MAX_TRIP_DAYS:
+        return JsonResponse({'error': f'max_days must be between 1 and {MAX_TRIP_DAYS}'}, status=400)
+    if destination_ids is None:
+        destination_ids = list(
+            Destination.objects.filter(is_active=True).values_list('id', flat=True)[:TRIP_MAX_CANDIDATES]
+        )
+    if len(destination_ids) > TRIP_MAX_CANDIDATES:
+        return JsonResponse({'error': f'At most {TRIP_MAX_CANDIDATES} destinations per request'}, status=400)
+
+    plans = optimize_trip(destination_ids, group_size, budget, max_days=max_days)
+    return JsonResponse({'budget': budget, 'people': group_size, 'plans': plans})
+
+def image_derivative(request):
+    """Serve a resized image derivative, generating it on first request"""
+    try:
+        source_name = unsign_source_name(request.GET.get('src', ''))
+        width = int(request.GET.get('w', 0))
+    except (BadSignature, ValueError):
+        raise Http404('Unknown image')
+    fmt = request.GET.get('fmt', 'jpeg')
+    if fmt not in DERIVATIVE_FORMATS:
+        raise Http404('Unknown image format')
+
+    manifest = get_manifest(source_name) or generate_derivatives(source_name)
+    if manifest is None:
+        # Another request is building this image; serve the original meanwhile
+        response = redirect(default_storage.url(source_name))
+        response['Cache-Control'] = 'no-cache'
+        return response
+    if not manifest['widths']:
+        raise Http404('Image not available')
+
+    # Smallest generated width that covers the request, else the largest
+    width = next((w for w in manifest['widths'] if w >= width), manifest['widths'][-1])
+    response = redirect(derivative_url(manifest, width, fmt))
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
 @login_required
 def check_weather(request):
     weather_data = None
@@ -151,21 +296,34 @@ def custom_package(request):
             messages.error(request, 'Please login to create a custom package.')
             return redirect('login')
         
-        destination = request.POST.get('destination', '')
-        num_days = int(request.POST.get('numDays', 3))
-        num_people = int(request.POST.get('numPeople', 7))
-        num_rooms = int(request.POST.get('numRooms', 2))
-        vehicle = request.POST.get('vehicle', 'grand-cabin')
-        food = request.POST.get('food', 'none')
-        accommodation = request.POST.get('accommodation', 'standard')
-        guide = request.POST.get('guide', 'no') == 'yes'
-        bonfire = request.POST.get('bonfire', 'no') == 'yes'
-        total_price = Decimal(request.POST.get('totalPrice', '0').replace(',', ''))
-        per_person_price = Decimal(request.POST.get('perPersonPrice', '0').replace(',', ''))
+        try:
+            # The price is always recomputed from the rate tables, never taken from the form
+            quote = quote_custom_package(
+                destination=request.POST.get('destination', ''),
+                num_days=int(request.POST.get('numDays', MIN_DAYS)),
+                num_people=int(request.POST.get('numPeople', MIN_PEOPLE)),
+                num_rooms=int(request.POST.get('numRooms', 2)),
+                food=request.POST.get('food', 'none'),
+                accommodation=request.POST.get('accommodation', 'standard'),
+                guide=request.POST.get('guide', 'no') == 'yes',
+                bonfire=request.POST.get('bonfire', 'no') == 'yes',
+            )
+        except ValueError as e:
+            message = str(e) if isinstance(e, PricingError) else 'Please enter valid numbers for days, people and rooms.'
+            messages.error(request, message)
+            return redirect('content:custom_package')
+        
+        posted_total = request.POST.get('totalPrice', '').replace(',', '')
+        if posted_total and posted_total != str(int(quote['total'])):
+            logger.warning(
+                f"Custom package price mismatch for {request.user.username}: "
+                f"form {posted_total}, server {quote['total']}"
+            )
         
-        # Clamp values
-        num_days = max(3, min(10, num_days))
-        num_people = max(7, min(27, num_people))
+        destination = quote['destination']
+        num_days = quote['num_days']
+        num_people = quote['num_people']
+        total_price = quote['total']
         
         # Create CustomPackageOrder
         order = CustomPackageOrder.objects.create(
@@ -173,29 +331,69 @@ def custom_package(request):
             destination=destination,
             num_days=num_days,
             num_people=num_people,
-            num_rooms=num_rooms,
-            vehicle=vehicle,
-            food=food,
-            accommodation=accommodation,
-            guide=guide,
-            bonfire=bonfire,
+            num_rooms=quote['num_rooms'],
+            vehicle=quote['vehicle'],
+            food=quote['food'],
+            accommodation=quote['accommodation'],
+            guide=quote['guide'],
+            bonfire=quote['bonfire'],
             total_price=total_price,
-            per_person_price=per_person_price,
+            per_person_price=quote['per_person'],
         )
         
-        # Create admin notification
-        AdminNotification.objects.create(
+        # Create admin notification; a burst of requests becomes a single digest
+        notify(
             notification_type='custom_package',
             title=f'New Custom Package Request #{order.order_number}',
             message=f'{request.user.username} has requested a custom tour package to {destination.title()} for {num_people} people, {num_days} days. Total: PKR {total_price:,.0f}',
             link=f'/admin/content/custompackageorder/{order.id}/change/',
+            group_key='custom_package_requested',
+            digest_title=lambda count: f'{count} new custom package requests',
+            digest_link='/admin/content/custompackageorder/?status__exact=pending',
             custom_package_order=order,
         )
         
         messages.success(request, f'Your custom package request #{order.order_number} has been submitted!')
         return redirect('content:custom_package_payment', order_id=order.id)
     
-    return render(request, 'content/custom_package.html')
+    rate_tables = get_rate_tables()
+    return render(request, 'content/custom_package.html', {
+        'rate_destinations': [(slug, rates['name']) for slug, rates in rate_tables.items()],
+    })
+
+
+def _rates_etag(request):
+    return get_rates_document()[1]
+
+
+@condition(etag_func=_rates_etag)
+def custom_package_rates(request):
+    """Rate tables for the custom package price preview"""
+    document, _ = get_rates_document()
+    response = HttpResponse(document, content_type='application/json')
+    # Browsers revalidate with If-None-Match and get a 304 while rates are unchanged
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def _quote_grid_etag(request, destination):
+    try:
+        return get_quote_grid_document(destination)[1]
+    except PricingError:
+        return None
+
+
+@gzip_page
+@condition(etag_func=_quote_grid_etag)
+def custom_package_quote_grid(request, destination):
+    """Every priced option combination for one destination as a flat array"""
+    try:
+        document, _ = get_quote_grid_document(destination)
+    except PricingError:
+        raise Http404('Unknown destination')
+    response = HttpResponse(document, content_type='application/json')
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
 
 
 @login_required
@@ -281,12 +479,15 @@ def payment_success(request, order_id):
             level='info'
         )
         
-        # Notify admin about payment
-        AdminNotification.objects.create(
+        # Notify admin about payment; a burst of payments becomes a single digest
+        notify(
             notification_type='payment',
             title=f'Payment Received for #{order.order_number}',
             message=f'Payment of PKR {order.total_price:,.0f} received from {request.user.username} for custom package to {order.destination.title()}.',
             link=f'/admin/content/custompackageorder/{order.id}/change/',
+            group_key='custom_package_paid',
+            digest_title=lambda count: f'{count} custom package payments received',
+            digest_link='/admin/content/custompackageorder/?status__exact=paid',
             custom_package_order=order,
         )
     
@@ -309,21 +510,24 @@ def my_custom_packages(request):
 
 @login_required
 def admin_notifications_api(request):
-    """API endpoint to get unread admin notifications (for admin users)"""
+    """
+    Unread admin notifications (for admin users).
+
+    Live updates are pushed over ws/admin/notifications/; this endpoint
+    serves the same since_id cursor for clients without WebSockets.
+    """
     if not request.user.is_staff:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    notifications = AdminNotification.objects.filter(is_read=False)[:20]
-    data = [{
-        'id': n.id,
-        'type': n.notification_type,
-        'title': n.title,
-        'message': n.message,
-        'link': n.link,
-        'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
-    } for n in notifications]
+    try:
+        since_id = max(0, int(request.GET.get('since_id', 0)))
+    except ValueError:
+        since_id = 0
     
-    return JsonResponse({'notifications': data, 'unread_count': AdminNotification.objects.filter(is_read=False).count()})
+    return JsonResponse({
+        'notifications': get_unread_notifications(since_id),
+        'unread_count': get_unread_count(),
+    })
 
 
 @login_required
@@ -332,11 +536,37 @@ def mark_notification_read(request, notification_id):
     if not request.user.is_staff:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
     
-    notification = get_object_or_404(AdminNotification, id=notification_id)
-    notification.is_read = True
-    notification.save()
+    if not mark_read(notification_id) and not AdminNotification.objects.filter(id=notification_id).exists():
+        raise Http404('Notification not found')
     return JsonResponse({'success': True})
 
+
+@login_required
+def mark_notifications_read_api(request):
+    """
+    Mark many notifications read in one UPDATE.
+
+    POST {"ids": [1, 2, 3]} or {"up_to_id": 42} for "mark all read".
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        if 'ids' in data:
+            ids = [int(pk) for pk in data['ids']]
+            updated = mark_notifications_read(ids=ids[:BULK_READ_LIMIT])
+        elif 'up_to_id' in data:
+            updated = mark_notifications_read(up_to_id=int(data['up_to_id']))
+        else:
+            return JsonResponse({'error': 'Provide "ids" or "up_to_id"'}, status=400)
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    
+    return JsonResponse({'success': True, 'updated': updated, 'unread_count': get_unread_count()})
+
 # Cart and Order Views
 @login_required
 def add_to_cart(request, product_id):
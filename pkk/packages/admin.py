@@ -1,4 +1,5 @@
 from django.contrib import admin
+from content.home_feed import invalidate_home_feed
 from .models import Company, Package, Booking, PackageReview
 
 
@@ -14,6 +15,8 @@ class CompanyAdmin(admin.ModelAdmin):
     
     def approve_companies(self, request, queryset):
         queryset.update(approval_status='approved')
+        # update() bypasses post_save, so the home feed is dropped explicitly
+        invalidate_home_feed()
         self.message_user(request, f'{queryset.count()} companies approved.')
     approve_companies.short_description = 'Approve selected companies'
 
@@ -30,6 +33,8 @@ class PackageAdmin(admin.ModelAdmin):
     
     def approve_packages(self, request, queryset):
         queryset.update(is_approved=True)
+        # update() bypasses post_save, so the home feed is dropped explicitly
+        invalidate_home_feed()
         self.message_user(request, f'{queryset.count()} packages approved.')
     approve_packages.short_description = 'Approve selected packages'
     fieldsets = [
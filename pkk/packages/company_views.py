@@ -7,7 +7,11 @@ from django.core.exceptions import ValidationError
 from functools import wraps
 from .models import Company, Package, Booking, PackageReview
 from content.models import Product, AdminNotification
+from content.notifications import notify
+from django.http import JsonResponse
 from users.security_utils import validate_file_upload, log_security_event
+from .inventory import apply_inventory_updates, parse_inventory_csv, InventoryError, INVENTORY_MAX_ROWS
+import json
 import logging
 import re
 
@@ -464,11 +468,15 @@ def add_product(request):
 
         if company.approval_status != 'approved':
             # Notify admin only if company is not yet approved
-            AdminNotification.objects.create(
+            # Bursts of submissions from one company become a single digest
+            notify(
                 notification_type='general',
                 title=f'New Product for Approval: {name}',
                 message=f'{company.name} has added a new product "{name}" (PKR {price_val:,.0f}). Please review and approve.',
                 link=f'/admin/content/product/{product.id}/change/',
+                group_key=f'product_submitted:{company.id}',
+                digest_title=lambda count: f'{count} new products from {company.name} awaiting approval',
+                digest_link=f'/admin/content/product/?company__id__exact={company.id}&is_approved__exact=0',
             )
             messages.success(request, 'Product submitted for admin approval!')
         else:
@@ -608,3 +616,63 @@ def update_booking_status(request, booking_id):
             messages.error(request, 'Invalid status.')
 
     return redirect('packages:company_bookings')
+
+
+@company_required
+def inventory_sync_api(request):
+    """
+    Bulk stock/price update for the company's products (JSON API).
+
+    POST {"rows": [{"product_id": 1, "stock": 25, "price": "1500.00"}, ...]}
+    Price is optional per row. Returns a per-row result report.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    company = Company.objects.filter(owner=request.user).first()
+    if not company:
+        return JsonResponse({'error': 'No company found for your account.'}, status=404)
+
+    try:
+        payload = json.loads(request.body)
+        rows = payload.get('rows') if isinstance(payload, dict) else None
+        if not isinstance(rows, list):
+            return JsonResponse({'error': 'Expected a JSON object with a "rows" list.'}, status=400)
+        report = apply_inventory_updates(company, rows)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    except InventoryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    log_security_event('inventory_sync', request.user, {'company': company.name, **report['summary']})
+    return JsonResponse(report)
+
+
+@company_required
+def inventory_upload(request):
+    """Upload a CSV of product_id, stock, price rows and show the result report"""
+    company = get_object_or_404(Company, owner=request.user)
+    context = {'company': company, 'max_rows': INVENTORY_MAX_ROWS}
+
+    if request.method == 'POST':
+        csv_file = request.FILES.get('csv_file')
+        if not csv_file:
+            messages.error(request, 'Please choose a CSV file to upload.')
+            return render(request, 'packages/inventory_upload.html', context)
+
+        try:
+            validate_file_upload(csv_file, allowed_extensions=['csv'], max_size_mb=5)
+            report = apply_inventory_updates(company, parse_inventory_csv(csv_file))
+        except (ValidationError, InventoryError) as e:
+            messages.error(request, e.messages[0] if isinstance(e, ValidationError) else str(e))
+            return render(request, 'packages/inventory_upload.html', context)
+
+        log_security_event('inventory_sync', request.user, {'company': company.name, **report['summary']})
+        summary = report['summary']
+        if summary['failed']:
+            messages.warning(request, f"{summary['updated']} products updated, {summary['failed']} rows need attention.")
+        else:
+            messages.success(request, f"{summary['updated']} products updated.")
+        context['report'] = report
+
+    return render(request, 'packages/inventory_upload.html', context)
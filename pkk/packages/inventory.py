@@ -0,0 +1,206 @@
+"""
+Bulk inventory sync for company products.
+
+Companies send (product id, stock, price) rows either as JSON or as a CSV
+upload. Ownership of every product is checked with a single query, and
+the valid rows are written with one UPDATE ... CASE statement per chunk
+instead of a form save per product. Each input row gets an entry in the
+returned report.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from chatbot.retrieval import record_catalog_change
+from content.catalog import refresh_facet_counts
+from content.home_feed import invalidate_home_feed
+from content.models import Product
+
+INVENTORY_MAX_ROWS = 5000
+INVENTORY_CHUNK_SIZE = 200  # Keeps each UPDATE well under SQL parameter limits
+MAX_PRICE = Decimal('99999999.99')  # Product.price is max_digits=10, decimal_places=2
+MAX_STOCK = 2147483647  # Largest value a PositiveIntegerField holds on every backend
+MAX_PRODUCT_ID = 2 ** 63 - 1
+
+CSV_COLUMNS = {
+    'product_id': ('product_id', 'id', 'product'),
+    'stock': ('stock', 'stock_quantity', 'quantity'),
+    'price': ('price',),
+}
+
+
+class InventoryError(Exception):
+    """Raised when a whole upload is unusable (bad format, too many rows)"""
+
+
+def _result(row_number, product_id, status, message=''):
+    return {'row': row_number, 'product_id': product_id, 'status': status, 'message': message}
+
+
+def clean_row(raw):
+    """
+    Validate a single input row.
+
+    Args:
+        raw: dict with product_id, stock and an optional price
+
+    Returns:
+        (product_id, stock, price or None)
+
+    Raises:
+        ValueError: with a message suitable for the row report
+    """
+    try:
+        product_id = int(str(raw.get('product_id', '')).strip())
+    except ValueError:
+        raise ValueError('Product ID must be a whole number.')
+    if not 0 < product_id <= MAX_PRODUCT_ID:
+        raise ValueError('Product ID must be a positive number.')
+
+    try:
+        stock = int(str(raw.get('stock', '')).strip())
+    except ValueError:
+        raise ValueError('Stock must be a whole number.')
+    if stock < 0:
+        raise ValueError('Stock cannot be negative.')
+    if stock > MAX_STOCK:
+        raise ValueError('Stock is unrealistically high.')
+
+    price = raw.get('price')
+    if price is None or str(price).strip() == '':
+        return product_id, stock, None
+    try:
+        price = Decimal(str(price).replace(',', '').strip())
+    except InvalidOperation:
+        raise ValueError('Price must be a valid number.')
+    # NaN and Infinity parse, but NaN cannot even be compared
+    if not price.is_finite():
+        raise ValueError('Price must be a valid number.')
+    if price <= 0:
+        raise ValueError('Price must be greater than 0.')
+    if price > MAX_PRICE:
+        raise ValueError('Price is unrealistically high.')
+    if price != price.quantize(Decimal('0.01')):
+        raise ValueError('Price can have at most 2 decimal places.')
+    return product_id, stock, price.quantize(Decimal('0.01'))
+
+
+def parse_inventory_csv(uploaded_file):
+    """
+    Read an uploaded CSV into row dicts.
+
+    The header must name a product id and a stock column; price is
+    optional. Column names are matched case-insensitively.
+    """
+    try:
+        text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text)
+        header = {name.strip().lower(): name for name in (reader.fieldnames or []) if name}
+    except (UnicodeDecodeError, csv.Error):
+        raise InventoryError('The file is not a readable UTF-8 CSV.')
+
+    columns = {}
+    for key, aliases in CSV_COLUMNS.items():
+        columns[key] = next((header[a] for a in aliases if a in header), None)
+    if not columns['product_id'] or not columns['stock']:
+        raise InventoryError('CSV header must include "product_id" and "stock" columns.')
+
+    rows = []
+    try:
+        for record in reader:
+            if len(rows) >= INVENTORY_MAX_ROWS:
+                raise InventoryError(f'A single upload is limited to {INVENTORY_MAX_ROWS} rows.')
+            rows.append({
+                key: (record.get(column) if column else None)
+                for key, column in columns.items()
+            })
+    except (UnicodeDecodeError, csv.Error):
+        raise InventoryError('The file is not a readable UTF-8 CSV.')
+    return rows
+
+
+def _apply_chunk(chunk, now):
+    """One UPDATE ... CASE statement for up to INVENTORY_CHUNK_SIZE rows"""
+    ids = [product_id for product_id, _, _ in chunk]
+    stock_case = Case(
+        *[When(id=product_id, then=Value(stock)) for product_id, stock, _ in chunk],
+        output_field=IntegerField(),
+    )
+    price_whens = [When(id=product_id, then=Value(price)) for product_id, _, price in chunk if price is not None]
+    changes = {'stock_quantity': stock_case, 'updated_at': Value(now)}
+    if price_whens:
+        changes['price'] = Case(*price_whens, default=F('price'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    updated = Product.objects.filter(id__in=ids).update(**changes)
+    # The chatbot's catalog snippets quote prices (stock is not in them); re-read after the commit
+    priced = [f'product:{product_id}' for product_id, _, price in chunk if price is not None]
+    if priced:
+        transaction.on_commit(lambda: record_catalog_change(*priced))
+    return updated
+
+
+def apply_inventory_updates(company, rows):
+    """
+    Validate and apply inventory rows for one company.
+
+    Args:
+        company: Company that must own every product
+        rows: list of dicts with product_id, stock and optional price
+
+    Returns:
+        dict with a summary and one result per input row
+    """
+    if len(rows) > INVENTORY_MAX_ROWS:
+        raise InventoryError(f'A single request is limited to {INVENTORY_MAX_ROWS} rows.')
+
+    results = []
+    cleaned = []  # (result index, product_id, stock, price)
+    for row_number, raw in enumerate(rows, 1):
+        if not isinstance(raw, dict):
+            results.append(_result(row_number, None, 'error', 'Row must be an object.'))
+            continue
+        try:
+            product_id, stock, price = clean_row(raw)
+        except ValueError as e:
+            results.append(_result(row_number, raw.get('product_id'), 'error', str(e)))
+            continue
+        results.append(_result(row_number, product_id, 'pending'))
+        cleaned.append((len(results) - 1, product_id, stock, price))
+
+    # Ownership check for every referenced product in a single query
+    owned_ids = set(
+        Product.objects.filter(company=company, id__in={c[1] for c in cleaned}).values_list('id', flat=True)
+    )
+
+    valid = []
+    seen = {}
+    for index, product_id, stock, price in cleaned:
+        if product_id not in owned_ids:
+            results[index].update(status='error', message='Product not found in your catalog.')
+        elif product_id in seen:
+            results[index].update(status='error', message=f'Duplicate of row {seen[product_id]}.')
+        else:
+            seen[product_id] = results[index]['row']
+            valid.append((index, product_id, stock, price))
+
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(valid), INVENTORY_CHUNK_SIZE):
+            chunk = valid[start:start + INVENTORY_CHUNK_SIZE]
+            _apply_chunk([(product_id, stock, price) for _, product_id, stock, price in chunk], now)
+            for index, _, _, _ in chunk:
+                results[index]['status'] = 'updated'
+
+    if valid:
+        # update() bypasses post_save, so refresh derived catalog data here
+        refresh_facet_counts()
+        invalidate_home_feed()
+
+    updated = len(valid)
+    return {
+        'summary': {'total': len(rows), 'updated': updated, 'failed': len(rows) - updated},
+        'results': results,
+    }
@@ -1 +1,122 @@
-# This file is intentionally empty to mark this directory as a Python package
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from content.models import Product
+from .inventory import MAX_STOCK, apply_inventory_updates, clean_row
+from .models import Company
+
+User = get_user_model()
+
+
+def make_company(name, owner=None):
+    return Company.objects.create(
+        owner=owner, name=name, slug=name.lower().replace(' ', '-'), description=name,
+        email='info@example.com', phone='03001234567', approval_status='approved',
+    )
+
+
+class InventorySyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            username='seller@example.com', email='seller@example.com', password='pw12345!x', user_type='company',
+        )
+        self.company = make_company('Karakoram Crafts', owner=self.owner)
+        self.shawl = Product.objects.create(
+            name='Pashmina Shawl', description='Shawl', price=Decimal('4500'), stock_quantity=3, company=self.company,
+        )
+        self.rug = Product.objects.create(
+            name='Hunza Rug', description='Rug', price=Decimal('12000'), stock_quantity=1, company=self.company,
+        )
+        self.other = Product.objects.create(
+            name='Swat Honey', description='Honey', price=Decimal('1800'), company=make_company('Swat Foods'),
+        )
+
+    def test_clean_row_rejects_bad_numbers(self):
+        self.assertEqual(clean_row({'product_id': '7', 'stock': '4', 'price': '1,250.5'}), (7, 4, Decimal('1250.50')))
+        self.assertEqual(clean_row({'product_id': 7, 'stock': 4, 'price': '12.500'})[2], Decimal('12.50'))
+        for price in ('NaN', 'nan', 'Infinity', '-inf', 'sNaN', 'abc', '12.345', '0', '-5', '1e12'):
+            with self.assertRaises(ValueError, msg=price):
+                clean_row({'product_id': 7, 'stock': 4, 'price': price})
+        for stock in ('-1', str(MAX_STOCK + 1), '2.5'):
+            with self.assertRaises(ValueError, msg=stock):
+                clean_row({'product_id': 7, 'stock': stock})
+        with self.assertRaises(ValueError):
+            clean_row({'product_id': str(2 ** 70), 'stock': 1})
+
+    def test_batch_update_reports_every_row(self):
+        report = apply_inventory_updates(self.company, [
+            {'product_id': self.shawl.id, 'stock': 10, 'price': '4800'},
+            {'product_id': self.rug.id, 'stock': 0},
+            {'product_id': self.other.id, 'stock': 99},
+            {'product_id': self.shawl.id, 'stock': 1},
+            {'product_id': self.rug.id, 'stock': 2, 'price': 'NaN'},
+            'not a row',
+        ])
+        self.assertEqual(report['summary'], {'total': 6, 'updated': 2, 'failed': 4})
+        self.assertEqual(
+            [(r['status'], r['message']) for r in report['results']],
+            [
+                ('updated', ''),
+                ('updated', ''),
+                ('error', 'Product not found in your catalog.'),
+                ('error', 'Duplicate of row 1.'),
+                ('error', 'Price must be a valid number.'),
+                ('error', 'Row must be an object.'),
+            ],
+        )
+        self.shawl.refresh_from_db()
+        self.rug.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.shawl.stock_quantity, self.shawl.price), (10, Decimal('4800.00')))
+        self.assertEqual((self.rug.stock_quantity, self.rug.price), (0, Decimal('12000.00')))
+        self.assertEqual(self.other.stock_quantity, 0)
+
+    def test_csv_upload_with_bad_cells(self):
+        self.client.force_login(self.owner)
+        csv_file = SimpleUploadedFile('stock.csv', (
+            'Product_ID,Stock,Price\n'
+            f'{self.shawl.id},7,NaN\n'
+            f'{self.rug.id},5,12.345\n'
+            f'{self.rug.id},5,13000\n'
+        ).encode('utf-8'), content_type='text/csv')
+        response = self.client.post('/packages/company-portal/inventory/', {'csv_file': csv_file})
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report']
+        self.assertEqual(report['summary'], {'total': 3, 'updated': 1, 'failed': 2})
+        self.assertEqual(report['results'][1]['message'], 'Price can have at most 2 decimal places.')
+        self.rug.refresh_from_db()
+        self.assertEqual((self.rug.stock_quantity, self.rug.price), (5, Decimal('13000.00')))
+
+    def test_json_api(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            '/packages/company-portal/api/inventory/',
+            json.dumps({'rows': [{'product_id': self.shawl.id, 'stock': 2, 'price': 4999.99}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary']['updated'], 1)
+
+        response = self.client.post(
+            '/packages/company-portal/api/inventory/', json.dumps({'rows': 'nope'}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+        # Other users get company_required's redirect and change nothing
+        self.client.force_login(User.objects.create_user(
+            username='buyer@example.com', email='buyer@example.com', password='pw12345!x',
+        ))
+        response = self.client.post(
+            '/packages/company-portal/api/inventory/',
+            json.dumps({'rows': [{'product_id': self.shawl.id, 'stock': 40}]}),
+            content_type='application/json',
+        )
+        self.assertRedirects(response, '/users/dashboard/', fetch_redirect_response=False)
+        self.shawl.refresh_from_db()
+        self.assertEqual(self.shawl.stock_quantity, 2)
@@ -3,6 +3,7 @@ from . import views
 from .company_views import (
     company_portal, add_package, edit_package, delete_package,
     add_product, edit_product, delete_product,
+    inventory_upload, inventory_sync_api,
     company_bookings, update_booking_status,
 )
 
@@ -32,6 +33,8 @@ urlpatterns = [
     path('company-portal/add-product/', add_product, name='add_product'),
     path('company-portal/edit-product/<int:product_id>/', edit_product, name='edit_product'),
     path('company-portal/delete-product/<int:product_id>/', delete_product, name='delete_product'),
+    path('company-portal/inventory/', inventory_upload, name='inventory_upload'),
+    path('company-portal/api/inventory/', inventory_sync_api, name='inventory_sync_api'),
     
     # Company Bookings
     path('company-portal/bookings/', company_bookings, name='company_bookings'),
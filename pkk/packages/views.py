@@ -5,8 +5,10 @@ from django.contrib import messages
 from django.db.models import Count, Q
 from django.http import JsonResponse
 from django.conf import settings
+from django.utils import timezone
 from .models import Company, Package, Booking, PackageReview
-from datetime import datetime
+from content.utils.weather import FORECAST_DAYS, get_forecasts
+from datetime import datetime, timedelta
 import stripe
 import logging
 import re as re_mod
@@ -76,6 +78,12 @@ def package_list(request):
         })
 
 
+def _forecast_city(package):
+    """Forecasts are shown for a package's first destination"""
+    destinations = package.get_destinations_list()
+    return destinations[0] if destinations else ''
+
+
 def package_detail(request, slug):
     """Display detailed package information"""
     from django.http import Http404
@@ -94,11 +102,30 @@ def package_detail(request, slug):
         
         # Get reviews for this package
         reviews = PackageReview.objects.filter(package=package).select_related('user').order_by('-created_at')
-        
+
+        # Forecast window for the first destination, marking days of the user's own trips
+        forecast_city = _forecast_city(package)
+        today = timezone.localdate()
+        window = [today + timedelta(days=offset) for offset in range(FORECAST_DAYS)]
+        forecasts = get_forecasts((forecast_city, day) for day in window)
+        trip_days = set()
+        if request.user.is_authenticated:
+            for travel_date in Booking.objects.filter(
+                user=request.user, package=package, travel_date__lte=window[-1],
+                travel_date__gt=today - timedelta(days=package.duration_days),
+            ).exclude(status='cancelled').values_list('travel_date', flat=True):
+                trip_days.update(travel_date + timedelta(days=offset) for offset in range(package.duration_days))
+        forecast = [
+            {**forecasts[(forecast_city, day)], 'is_trip_day': day in trip_days}
+            for day in window if (forecast_city, day) in forecasts
+        ]
+
         context = {
             'package': package,
             'related_packages': related_packages,
             'reviews': reviews,
+            'forecast_city': forecast_city,
+            'forecast': forecast,
         }
         
         return render(request, 'packages/package_detail.html', context)
@@ -395,9 +422,17 @@ def add_package_review(request, slug, booking_id):
 @login_required
 def my_bookings(request):
     """View user's package bookings"""
-    bookings = Booking.objects.filter(
+    bookings = list(Booking.objects.filter(
         user=request.user
-    ).select_related('package', 'package__company').order_by('-created_at')
+    ).select_related('package', 'package__company').order_by('-created_at'))
+
+    # Departure-day forecasts from the cache; misses are fetched in the background
+    forecasts = get_forecasts(
+        (_forecast_city(booking.package), booking.travel_date)
+        for booking in bookings if booking.status != 'cancelled'
+    )
+    for booking in bookings:
+        booking.forecast = forecasts.get((_forecast_city(booking.package), booking.travel_date))
 
     # Check which bookings already have reviews
     reviewed_booking_ids = set(
@@ -12,18 +12,22 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
-import chatbot.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'touripk.settings')
 
+# Initialize Django before importing consumers, which import models
 django_asgi_app = get_asgi_application()
 
+import chatbot.routing  # noqa: E402
+import content.routing  # noqa: E402
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter([
                 *chatbot.routing.websocket_urlpatterns,
+                *content.routing.websocket_urlpatterns,
             ])
         )
     ),
@@ -176,17 +176,45 @@ SIMPLE_JWT = {
 # CORS settings
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='http://localhost:3000,http://127.0.0.1:3000', cast=Csv())
 
+# Cache settings
+# Derived data (catalog facets, weather, ...) is invalidated by signals, so
+# production should point REDIS_URL at a cache shared by every worker. Cron
+# jobs that warm the cache (prefetch_weather) need it too.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'touripk',
+        }
+    }
+
 # Channels settings
 ASGI_APPLICATION = 'touripk.asgi.application'
 
+# Redis when REDIS_URL is set, like CACHES; CHANNEL_LAYER_BACKEND overrides it.
+# The in-memory layer only reaches consumers in the same process, which is
+# enough for development and tests but not for several workers.
+CHANNEL_LAYER_BACKEND = config(
+    'CHANNEL_LAYER_BACKEND',
+    default='channels_redis.core.RedisChannelLayer' if REDIS_URL else 'channels.layers.InMemoryChannelLayer',
+)
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
-        },
+        'BACKEND': CHANNEL_LAYER_BACKEND,
     },
 }
+if CHANNEL_LAYER_BACKEND == 'channels_redis.core.RedisChannelLayer':
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        "hosts": [REDIS_URL or ('127.0.0.1', 6379)],
+    }
 
 # Stripe settings
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='pk_test_your_key_here')